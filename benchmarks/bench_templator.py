@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""benchmark the hot paths of templator.py on synthetic workloads
+
+usage: python3 benchmarks/bench_templator.py [--scale FACTOR] [--repeat N]
+                                             [--filter STRING]
+                                             [--templator PATH]
+                                             [--output PATH]
+                                             [--compare PATH]
+
+the workloads are generated in a temporary directory. results are printed
+(or saved with '--output') as json, so they can be compared between
+versions:
+
+    python3 benchmarks/bench_templator.py --output new.json
+    python3 benchmarks/bench_templator.py --templator old/templator.py \\
+        --output old.json
+    python3 benchmarks/bench_templator.py --compare old.json
+
+benchmarks using a function the benchmarked templator.py does not provide
+are skipped.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """register a benchmark. the decorated function gets the templator
+    module, a working directory and the scale factor and returns the
+    function to time"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def load_templator(path: str):
+    spec = importlib.util.spec_from_file_location("templator", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def scaled(value: int, scale: float) -> int:
+    return max(1, int(value * scale))
+
+
+def random_text(size: int, seed: int = 0) -> str:
+    """lines of random words without '$'"""
+    rnd = random.Random(seed)
+    words = ["".join(rnd.choice(string.ascii_lowercase)
+                     for _ in range(rnd.randint(2, 10)))
+             for _ in range(1000)]
+    lines, length = [], 0
+    while length < size:
+        line = " ".join(rnd.choice(words) for _ in range(rnd.randint(3, 12)))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+def template_text(size: int, every: int, names: int = 100,
+                  seed: int = 0) -> str:
+    """text of about size characters with a placeholder every 'every'
+    characters"""
+    rnd = random.Random(seed)
+    text = random_text(size=size, seed=seed)
+    parts, start = [], 0
+    while start < len(text):
+        parts.append(text[start:start + every])
+        name = f"VAR_{rnd.randrange(names)}"
+        parts.append(rnd.choice([f"${name}", f"${{{name}}}"]))
+        start += every
+    return "".join(parts)
+
+
+def variables(count: int) -> dict:
+    return {f"VAR_{nr}": f"value {nr}" for nr in range(count)}
+
+
+def write(path: Path, content: str) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return path
+
+
+def quiet():
+    """suppress output of the measured functions"""
+    stack = contextlib.ExitStack()
+    devnull = stack.enter_context(open(os.devnull, "w"))
+    stack.enter_context(contextlib.redirect_stdout(devnull))
+    return stack
+
+
+# parse_template
+
+def parse_template_benchmark(templator, workdir: Path, size: int,
+                             every: int):
+    template = write(workdir.joinpath("template.txt"),
+                     template_text(size=size, every=every))
+    substitutions = [variables(50), {}, {}]
+
+    def run():
+        templator.parse_template(template=str(template),
+                                 substitutions=substitutions)
+    return run
+
+
+@benchmark("parse_template.small")
+def bench_parse_template_small(templator, workdir: Path, scale: float):
+    return parse_template_benchmark(templator, workdir, size=2000, every=100)
+
+
+@benchmark("parse_template.huge_sparse")
+def bench_parse_template_huge_sparse(templator, workdir: Path, scale: float):
+    size = scaled(20_000_000, scale)
+    return parse_template_benchmark(templator, workdir, size=size,
+                                    every=size // 10)
+
+
+@benchmark("parse_template.huge_dense")
+def bench_parse_template_huge_dense(templator, workdir: Path, scale: float):
+    return parse_template_benchmark(templator, workdir,
+                                    size=scaled(5_000_000, scale), every=20)
+
+
+@benchmark("parse_template.diff")
+def bench_parse_template_diff(templator, workdir: Path, scale: float):
+    template = write(workdir.joinpath("template.txt"),
+                     template_text(size=scaled(5_000_000, scale), every=2000))
+    substitutions = [variables(50), {}, {}]
+
+    def run():
+        with quiet():
+            templator.parse_template(template=str(template),
+                                     substitutions=substitutions,
+                                     show_diff=True)
+    return run
+
+
+# compile_template
+
+def scan_benchmark(templator, text: str):
+    compile_template = templator.compile_template
+    index_placeholders = templator.index_placeholders
+    return lambda: index_placeholders(parts=compile_template(text=text))
+
+
+@benchmark("scan.sparse")
+def bench_scan_sparse(templator, workdir: Path, scale: float):
+    size = scaled(20_000_000, scale)
+    return scan_benchmark(templator,
+                          text=template_text(size=size, every=size // 10))
+
+
+@benchmark("scan.dense")
+def bench_scan_dense(templator, workdir: Path, scale: float):
+    return scan_benchmark(templator,
+                          text=template_text(size=scaled(5_000_000, scale),
+                                             every=20))
+
+
+# read_file
+
+@benchmark("read_file.env")
+def bench_read_file_env(templator, workdir: Path, scale: float):
+    count = scaled(50_000, scale)
+    path = write(workdir.joinpath("values.env"),
+                 "\n".join(f"VAR_{nr}=value {nr}" if nr % 10 else
+                           f"# comment {nr}" for nr in range(count)))
+    return lambda: templator.read_file(path=str(path), delimiter="=")
+
+
+@benchmark("read_file.json")
+def bench_read_file_json(templator, workdir: Path, scale: float):
+    path = write(workdir.joinpath("values.json"),
+                 json.dumps(variables(scaled(50_000, scale))))
+    return lambda: templator.read_file(path=str(path), delimiter="=")
+
+
+# skip_path
+
+@benchmark("skip_path")
+def bench_skip_path(templator, workdir: Path, scale: float):
+    rnd = random.Random(0)
+    dirs = ["src", "lib", "static", "node_modules", ".git", "config", "a",
+            "b"]
+    paths = ["/".join(rnd.choice(dirs) for _ in range(rnd.randint(1, 8))) +
+             f"/file{nr}" + rnd.choice([".txt", ".yaml", ".md", ".json"])
+             for nr in range(scaled(100_000, scale))]
+    excludes = ["node_modules", ".git", "*.md", ".json", "static"]
+
+    def run():
+        for path in paths:
+            templator.skip_path(path=path, excludes=excludes)
+    return run
+
+
+# diff
+
+@benchmark("diff")
+def bench_diff(templator, workdir: Path, scale: float):
+    lines = random_text(size=scaled(2_500_000, scale)).splitlines()
+    for nr in range(0, len(lines), 50):
+        lines[nr] = f"{lines[nr]} $VAR_{nr // 50 % 50}"
+    template = write(workdir.joinpath("template.txt"), "\n".join(lines))
+    substitutions = [variables(50), {}, {}]
+
+    def run():
+        with quiet():
+            templator.parse_template(template=str(template),
+                                     substitutions=substitutions,
+                                     show_diff=True)
+    return run
+
+
+# process
+
+def tree(workdir: Path, files: int, depth: int, size: int) -> Path:
+    root = workdir.joinpath("templates")
+    rnd = random.Random(0)
+    for nr in range(files):
+        parts = [f"dir{rnd.randrange(4)}"
+                 for _ in range(rnd.randint(0, depth))]
+        write(root.joinpath(*parts, f"file{nr}.txt"),
+              template_text(size=size, every=200, seed=nr))
+    for nr in range(files // 10):
+        write(root.joinpath("node_modules", f"pkg{nr}", "index.js"),
+              "module.exports = {}\n")
+    return root
+
+
+def process_benchmark(templator, workdir: Path, files: int, depth: int,
+                      size: int, env_size: int = 0):
+    root = tree(workdir=workdir, files=files, depth=depth, size=size)
+    dst = workdir.joinpath("output")
+    input_file = write(workdir.joinpath("values.env"),
+                       "\n".join(f"VAR_{nr}=value {nr}"
+                                 for nr in range(50, 100)))
+    environ = {f"ENV_{nr}": f"value {nr}" for nr in range(env_size)}
+
+    def run():
+        dst.mkdir(exist_ok=True)
+        with mock.patch.dict(os.environ, environ), quiet():
+            templator.process(src=[f"{root}/"],
+                              dst=str(dst),
+                              recursive=True,
+                              key_value_list=[f"VAR_{nr}=value"
+                                              for nr in range(50)],
+                              input_files=[str(input_file)],
+                              no_os_env=False,
+                              force=True,
+                              excludes=["node_modules", "*.md"])
+    return run
+
+
+@benchmark("process.flat")
+def bench_process_flat(templator, workdir: Path, scale: float):
+    return process_benchmark(templator, workdir,
+                             files=scaled(1000, scale), depth=0, size=2000)
+
+
+@benchmark("process.deep")
+def bench_process_deep(templator, workdir: Path, scale: float):
+    return process_benchmark(templator, workdir,
+                             files=scaled(1000, scale), depth=10, size=2000)
+
+
+@benchmark("process.large_environ")
+def bench_process_large_environ(templator, workdir: Path, scale: float):
+    return process_benchmark(templator, workdir,
+                             files=scaled(200, scale), depth=2, size=2000,
+                             env_size=scaled(10_000, scale))
+
+
+def measure(func, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'runs': repeat,
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """print the ratio to a baseline for each benchmark"""
+    sys.stderr.write(f"{'benchmark':<32} {'baseline':>10} {'current':>10} "
+                     f"{'ratio':>8}\n")
+    for name, result in results['results'].items():
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        ratio = result['min'] / old['min'] if old['min'] else float("inf")
+        sys.stderr.write(f"{name:<32} {old['min']:>10.4f} "
+                         f"{result['min']:>10.4f} {ratio:>8.2f}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="benchmark the hot paths of templator.py")
+    parser.add_argument("--scale",
+                        type=float,
+                        default=1.0,
+                        help="factor for the size of the workloads. "
+                             "default: 1")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        help="runs per benchmark. default: 5")
+    parser.add_argument("--filter",
+                        default="",
+                        help="only run benchmarks containing FILTER")
+    parser.add_argument("--templator",
+                        default=os.path.join(ROOT, "templator.py"),
+                        help="templator.py to benchmark")
+    parser.add_argument("--output",
+                        help="save results as json to OUTPUT")
+    parser.add_argument("--compare",
+                        metavar="PATH",
+                        help="print ratio to the results in PATH")
+    args = parser.parse_args()
+
+    templator = load_templator(path=args.templator)
+    results = {
+        'templator': getattr(templator, "__version__", None),
+        'path': os.path.abspath(args.templator),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'results': {},
+    }
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                func = setup(templator, Path(tmp), args.scale)
+            except AttributeError as e:
+                sys.stderr.write(f"{name:<32} skipped: {e}\n")
+                continue
+            results['results'][name] = measure(func=func, repeat=args.repeat)
+        sys.stderr.write(f"{name:<32} "
+                         f"{results['results'][name]['min']:.4f}s\n")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as data:
+            compare(results=results, baseline=json.load(data))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""measure the startup time of templator.py and compare it with a budget
+
+usage: python3 benchmarks/startup.py [--repeat N] [--json]
+
+- import: time to import templator (python -X importtime, cumulative)
+- import_own: import minus the time to import the standard library modules
+  templator always needs (REQUIRED_MODULES). this part does not depend much
+  on the speed of the machine, so the budget applies to it
+- render: wall time of a plain single file render to stdout, minus the
+  time of a bare interpreter start
+- cli: render minus import (argument parsing, logging setup, rendering)
+- logging: in-process time of 'setup_logger' and the first logged message,
+  which creates the stream handlers
+
+importing templator must not import any of the modules in LAZY_MODULES.
+exits with 1 if a budget is exceeded.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+SCRIPT = os.path.join(ROOT, "templator.py")
+
+# budgets in milliseconds, measured with cached bytecode
+BUDGETS = {
+    'import_own': 5.0,
+    'cli': 30.0,
+    'logging': 1.0,
+}
+
+# standard library modules templator always needs
+REQUIRED_MODULES = ["collections", "functools", "io", "logging", "os",
+                    "pathlib", "re", "sys", "threading", "time"]
+
+# modules only needed by some options
+LAZY_MODULES = [
+    "argparse",
+    "asyncio",
+    "cProfile",
+    "concurrent.futures",
+    "csv",
+    "difflib",
+    "hashlib",
+    "json",
+    "logging.handlers",
+    "mmap",
+    "socket",
+    "socketserver",
+]
+
+
+def environment() -> dict:
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure cached bytecode
+    return env
+
+
+def import_times(args: list, top_level: bool = False) -> dict:
+    """run python -X importtime and return {module: cumulative µs}"""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args,
+                            cwd=ROOT,
+                            env=environment(),
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if top_level and name.startswith("  "):
+            continue  # imported by another module
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            pass  # header
+    return times
+
+
+def wall_time(args: list, repeat: int) -> float:
+    """best wall time in milliseconds of repeat runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args,
+                       cwd=ROOT,
+                       env=environment(),
+                       stdout=subprocess.DEVNULL,
+                       check=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# setup_logger and the first message, printed in ms on the real stdout
+LOGGING = """
+import io, sys, time
+import templator
+stdout = sys.stdout
+sys.stdout = sys.stderr = io.StringIO()
+start = time.perf_counter()
+templator.setup_logger()
+templator.logger.info("message")
+stdout.write(f"{(time.perf_counter() - start) * 1000}\\n")
+"""
+
+
+def logging_time(repeat: int) -> float:
+    """best time in milliseconds to set up logging and log one message"""
+    return min(float(subprocess.run([sys.executable, "-c", LOGGING],
+                                    cwd=ROOT,
+                                    env=environment(),
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True,
+                                    check=True).stdout)
+               for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="measure the startup time of templator.py")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=20,
+                        help="number of runs per measurement. default: 20")
+    parser.add_argument("--json",
+                        action="store_true",
+                        help="print results as json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.txt")
+        with open(template, "w") as f:
+            f.write("user: $USER\n")
+        render = ["-m", "templator", template, "-q", "-n", "-s", "USER=me"]
+
+        required = "import " + ", ".join(REQUIRED_MODULES)
+        import_times(["-c", "import templator"])  # write bytecode cache
+        imports = min(import_times(["-c", "import templator"])['templator']
+                      for _ in range(args.repeat)) / 1000
+        stdlib = min(sum(import_times(["-c", required],
+                                      top_level=True).get(name, 0)
+                         for name in REQUIRED_MODULES)
+                     for _ in range(args.repeat)) / 1000
+        bare = wall_time(["-c", "pass"], repeat=args.repeat)
+        cli = wall_time(render, repeat=args.repeat)
+        loaded = import_times(["-c", "import templator"])
+        logging_setup = logging_time(repeat=args.repeat)
+
+    results = {
+        'python': sys.version.split()[0],
+        'import': round(imports, 2),
+        'import_own': round(max(imports - stdlib, 0), 2),
+        'render': round(cli - bare, 2),
+        'cli': round(max(cli - bare - imports, 0), 2),
+        'interpreter': round(bare, 2),
+        'logging': round(logging_setup, 2),
+        'lazy_modules_loaded': sorted(name for name in LAZY_MODULES
+                                      if name in loaded),
+        'budgets': BUDGETS,
+    }
+    exceeded = [name for name, budget in BUDGETS.items()
+                if results[name] > budget]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name in ("import", "import_own", "render", "cli", "logging",
+                     "interpreter"):
+            budget = BUDGETS.get(name)
+            print(f"{name:<12} {results[name]:>8.2f} ms" +
+                  (f"  (budget {budget:g} ms)" if budget else ""))
+        if results['lazy_modules_loaded']:
+            print("eagerly imported: " +
+                  ", ".join(results['lazy_modules_loaded']))
+
+    if exceeded or results['lazy_modules_loaded']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
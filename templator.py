@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
-import argparse
-import difflib
-import json
+import collections
+import functools
+import io
 import logging
-import logging.handlers
 import os
 import re
 import sys
+import threading
+import time
 from pathlib import Path
-from string import Template
+
+# modules only some features need are imported where they are used, to keep
+# the startup of a plain render fast (see 'benchmarks/startup.py')
 
 __version__ = "v1.0.1"
 __author__ = "gi8lino"
@@ -19,55 +22,53 @@ ITALIC = '\33[3m'
 UNDERLINE = '\033[4m'
 DEFAULT = '\033[0m'  # no color / no format
 
+CACHE_SIZE = 64 * 1024 * 1024  # default size limit of the template cache
+CHUNK_SIZE = 1024 * 1024  # characters read at once with '--stream'
+BINARY_CHECK_SIZE = 8000  # bytes searched for a NUL byte, like git does
+WATCH_INTERVAL = 1.0  # seconds between two polls with '--watch'
+
+logger = logging.getLogger("templator")
+
 pattern = re.compile(r"(?<!\$)(\$[a-zA-Z0-9_]+|\${[a-zA-Z0-9_]+})")
 
+# same rules as string.Template, so rendering matches 'safe_substitute'
+placeholder_pattern = re.compile(r"""
+    \$(?:
+      (?P<escaped>\$)                  |  # "$$" escape
+      (?P<named>[_a-z][_a-z0-9]*)      |  # $identifier
+      {(?P<braced>[_a-z][_a-z0-9]*)}   |  # ${identifier}
+      (?P<invalid>)                       # lone "$"
+    )
+    """, re.IGNORECASE | re.VERBOSE | re.ASCII)
+
+bytes_placeholder_pattern = re.compile(placeholder_pattern.pattern.encode(),
+                                       re.IGNORECASE | re.VERBOSE)
 
-class CustomHelpFormatter(argparse.HelpFormatter):
-    def __init__(self, prog):
-        # change max_help_position
-        super(CustomHelpFormatter, self).__init__(prog, max_help_position=42)
+# characters with a special meaning in '--exclude' and '--include' patterns
+glob_chars = re.compile(r"[*?[]")
+
+# placeholder at the end of a chunk which may continue in the next chunk
+incomplete_pattern = re.compile(
+    r"\$(?:[_a-z][_a-z0-9]*|{(?:[_a-z][_a-z0-9]*)?)?\Z",
+    re.IGNORECASE | re.ASCII)
 
-    def _format_action_invocation(self, action):
-        if not action.option_strings:
-            metavar, = self._metavar_formatter(action, action.dest)(1)
-            return metavar
-        else:
-            parts = []
-            # if the Optional doesn't take a value, format is:
-            #    -s, --long
-            if action.nargs == 0:
-                parts.extend(action.option_strings)
-
-            # if the Optional takes a value, format is:
-            #    -s, --long ARGS
-            else:
-                default = action.dest.upper()
-                args_string = self._format_args(action, default)
-                for option_string in action.option_strings:
-                    parts.append('%s' % option_string)
-                parts[-1] += ' %s' % args_string
-            return ', '.join(parts)
 
+class ColorFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord):
+        msg = super().format(record)
+        # Cyan/Green/Yellow/Red/Redder based on log level:
+        color = '\x1b[' + ('36m', '32m', '33m', '31m', '41m')[
+           min(4, int(4 * record.levelno / logging.FATAL))]
+        return color + record.levelname.ljust(7) + '\x1b[0m: ' + msg
 
-class CustomFormatter(CustomHelpFormatter,
-                      argparse.RawDescriptionHelpFormatter):
-    pass
+
+class InfoFilter(logging.Filter):
+    def filter(self, rec):
+        return rec.levelno in (logging.DEBUG, logging.INFO)
 
 
 class ColorStreamHandler(logging.StreamHandler):
     def __init__(self, *args, **kwargs):
-        class AddColor(logging.Formatter):
-            def format(self, record: logging.LogRecord):
-                msg = super().format(record)
-                # Cyan/Green/Yellow/Red/Redder based on log level:
-                color = '\x1b[' + ('36m', '32m', '33m', '31m', '41m')[
-                   min(4, int(4 * record.levelno / logging.FATAL))]
-                return color + record.levelname.ljust(7) + '\x1b[0m: ' + msg
-
-        class InfoFilter(logging.Filter):
-            def filter(self, rec):
-                return rec.levelno in (logging.DEBUG, logging.INFO)
-
         super().__init__(*args, **kwargs)
 
         if self.stream == sys.stdout:
@@ -76,451 +77,4383 @@ class ColorStreamHandler(logging.StreamHandler):
         elif self.stream == sys.stderr:
             self.setLevel(logging.WARNING)
 
-        self.setFormatter(AddColor())
+        self.setFormatter(ColorFormatter())
 
 
-def parse_args() -> argparse.Namespace:
-    """parse known args and return argparse.Namespace"""
-    parser = argparse.ArgumentParser(
-        formatter_class=CustomFormatter,
-        add_help=False,
-        description="""
-Replace all instances of $VAR and/or ${VAR} in a file with the
-corresponding passed values and send the result to stdout or to a file.
+class DeferredHandler(logging.Handler):
+    """replaced by the colored stdout and stderr handlers on the first record
+    the logger lets through, so a run that logs nothing never creates them"""
 
-Variables can be passed as followed:
-- directly with key=value pairs (parameter '-s KEY1=VALUE1 [KEY2=VALUE2 ...]')
-- from .json and/or .env files (parameter '-i PATH [PATH ...]')
-- from os environment variables (can be disabled with parameter '--no-os-env')
-""",
-        epilog=(
-            f"{BOLD}Supported variable types{DEFAULT}:\n\n"
-            """
-Supports $-based substitutions, using the following rules:
-- "$$" is an escape; it is replaced with a single "$".
-- "$identifier" names a substitution placeholder matching a mapping key of
-  "identifier". By default, "identifier" is restricted to any case-insensitive
-  ASCII alphanumeric string (including underscores) that starts with an
-  underscore or ASCII letter. The first non-identifier character after the
-  "$" character terminates this placeholder specification.
-- "${identifier}" is equivalent to "$identifier". It is required when valid
-  identifier characters follow the placeholder but are not part of the
-  placeholder, such as "${noun}ification".
-            """
-            f"\n{BOLD}replacement order:{DEFAULT}\n\n"
-            "The order of replacing variables is:\n"
-            f"- directly passed key=value pairs ('-s') {BOLD}*{DEFAULT}\n"
-            f"- input files ('-i') {BOLD}*{DEFAULT}\n"
-            f"- os environment variables (can be disabled with"
-            "   parameter '--no-os-env')"
-            f"\n\n{BOLD}*{DEFAULT}{ITALIC}in order you pass them to the "
-            f"script{DEFAULT}\n\n"
-            "see full documentation here: https://github.com/gi8lino/templator"
-        )
-    )
-    parser.add_argument(action="store",
-                        dest="src",
-                        nargs='+',
-                        metavar="PATH",
-                        help="path to template file or directory containing"
-                             " template files")
-    parser.add_argument("--diff",
-                        action="store_true",
-                        dest="diff",
-                        default=None,
-                        help="show replaced lines")
-    parser.add_argument("-r", "--recursive",
-                        action="store_true",
-                        dest="recursive",
-                        default=None,
-                        help="process templates directory recursively")
-    parser.add_argument("-e", "--exclude",
-                        action="store",
-                        dest="excludes",
-                        metavar="STRING",
-                        nargs='+',
-                        help="exclude path containing [STRING]")
-    parser.add_argument("--strict",
-                        action="store_true",
-                        dest="strict",
-                        default=None,
-                        help=f"raise an error if not {UNDERLINE}all{DEFAULT}"
-                             " variables could be replaced")
-    group_verbose = parser.add_mutually_exclusive_group(required=False)
-    group_verbose.add_argument("--debug",
-                               action="store_true",
-                               dest="debug",
-                               default=None,
-                               help="set log level to debug")
-    group_verbose.add_argument("-q", "--quiet",
-                               action="store_true",
-                               dest="quiet",
-                               default=None,
-                               help="do not output log")
-    parser.add_argument("-v", "--version",
-                        action="version",
-                        version=f"templater version {__version__}\n"
-                                f"by {__author__}",
-                        help="show version number and exit")
-    parser.add_argument('-h', '--help',
-                        action='help',
-                        default=argparse.SUPPRESS,
-                        help='show this help message and exit')
-    group_key_values = parser.add_argument_group("optional: set key=value")
-    group_key_values.add_argument("-s", "--set",
-                                  dest="key_value_list",
-                                  nargs='*',
-                                  metavar="KEY=VALUE",
-                                  help="pass key=value pairs as variable")
-    group_input = parser.add_argument_group("optional: input file")
-    group_input.add_argument("-i", "--input",
-                             dest="input_files",
-                             nargs='+',
-                             metavar="PATH",
-                             help="files containing variable(s)")
-    group_input.add_argument("-d", "--delimiter-in-file",
-                             action="store",
-                             dest="delimiter",
-                             default=None,
-                             help="set delimiter for key/value pairs in "
-                                  f"{UNDERLINE}files{DEFAULT}. "
-                                  "default: =")
-    group_env = parser.add_argument_group("optional: read os environment")
-    group_env.add_argument("-n", "--no-os-env",
-                           action="store_true",
-                           dest="no_os_env",
-                           default=False,
-                           help="do not use os environment")
-    group_output = parser.add_argument_group("optional output")
-    group_output.add_argument("-o", "--output",
-                              action="store",
-                              dest="dst",
-                              metavar="PATH",
-                              help="redirect output to file or a directory")
-    group_output.add_argument("-a", "--append",
-                              action="store_true",
-                              dest="append",
-                              default=None,
-                              help="append to output file PATH")
-    group_output.add_argument("-f", "--force",
-                              action="store_true",
-                              dest="force",
-                              default=None,
-                              help="replace existing output file")
+    def __init__(self, logger: logging.Logger):
+        super().__init__()
+        self.logger = logger
+        self.handlers = None
 
-    args, unknown = parser.parse_known_args()
+    def handle(self, record: logging.LogRecord) -> bool:
+        with self.lock:
+            if self.handlers is None:
+                self.handlers = [ColorStreamHandler(sys.stdout),
+                                 ColorStreamHandler(sys.stderr)]
+                # a new list, as the logger is iterating the current one
+                self.logger.handlers = [
+                    handler for handler in self.logger.handlers
+                    if handler is not self] + self.handlers
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
 
-    if unknown:
-        parser.print_usage()
-        sys.stderr.write("templator.py: error: unrecognized argument"
-                         f"{'s' if len(unknown) != 1 else ''}: "
-                         "'{0}'".format(
-                             "', '".join(unknown)))
-        sys.exit(1)
 
-    if args.delimiter and not args.input_files:
-        parser.print_usage()
-        sys.stderr.write("templator.py: error: you cannot set a delimiter "
-                         f"({args.delimiter}) without minimum one "
-                         "input file\n")
-        sys.exit(1)
+class PathFilter:
+    """compiled gitignore-style patterns for '--exclude' and '--include'
 
-    if (args.append or args.force) and not args.dst:
-        errs = [
-            "'-a|--append'" if args.append else None,
-            "'-f|--force'" if args.force else None,
-        ]
-        parser.print_usage()
-        sys.stderr.write("templator.py: error: you cannot set "
-                         f"{' and/or '.join(filter(None, errs))}"
-                         " without the parameter '-o|--output'\n")
-        sys.exit(1)
+    - a pattern without '/' matches the name of a file or directory at any
+      level, a pattern containing '/' matches the path relative to the
+      template directory. a leading '/' only anchors the pattern
+    - a trailing '/' only matches directories
+    - '*' and '?' match anything but '/', '[...]' matches one character of a
+      set and '**' matches any number of directories
+    - a pattern starting with '.' also matches files with this suffix and
+      '*.ext' only matches files ending with '.ext', not directories
+    - negation with a leading '!' is not supported and raises a ValueError.
+      a leading '\\!' matches a name starting with '!'
 
-    return args
+    names are looked up in dicts and all other patterns are combined into
+    one regex per kind, so the number of patterns barely matters.
+    """
+
+    def __init__(self, patterns: list = []):
+        self.patterns = list(patterns or [])
+        self.names, self.dir_names = {}, {}
+        self.suffixes = {}  # only matched against the names of files
+        self.groups = {}  # regex group: pattern
+        globs = {}  # (anchored, directories only): [regex, ...]
+        for number, pattern in enumerate(self.patterns):
+            if pattern.startswith("!"):
+                raise ValueError(f"negated pattern '{pattern}' is not "
+                                 "supported. use '\\!' to match a leading "
+                                 "'!'")
+            dir_only = len(pattern) > 1 and pattern.endswith("/")
+            rule = pattern.rstrip("/") if dir_only else pattern
+            if rule.startswith("\\!"):
+                rule = rule[1:]
+            anchored = "/" in rule
+            rule = rule.lstrip("/")
+            if not anchored and not glob_chars.search(rule):
+                names = self.dir_names if dir_only else self.names
+                names.setdefault(rule, pattern)
+                if rule.startswith(".") and not dir_only:
+                    self.suffixes.setdefault(rule, pattern)
+                continue
+            if (not anchored and not dir_only and rule.startswith("*.") and
+               "." not in rule[2:] and not glob_chars.search(rule[1:])):
+                self.suffixes.setdefault(rule[1:], pattern)
+                continue
+            group = f"p{number}"
+            self.groups[group] = pattern
+            globs.setdefault((anchored, dir_only), []).append(
+                f"(?P<{group}>{glob_regex(pattern=rule)})")
+        self.regexes = {key: re.compile("|".join(parts))
+                        for key, parts in globs.items()}
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def search(self, kind: tuple, text: str) -> str:
+        regex = self.regexes.get(kind)
+        if regex is None:
+            return None
+        match = regex.fullmatch(text)
+        return self.groups[match.lastgroup] if match else None
+
+    def match_name(self, name: str, is_dir: bool = False) -> str:
+        """first pattern matching the name of a file or directory, ignoring
+        patterns containing '/'
+
+        Arguments:
+            name {str} -- name of the file or directory
+
+        Keyword Arguments:
+            is_dir {bool} -- name is a directory (default: {False})
+
+        Returns:
+            str -- matching pattern or None
+        """
+        pattern = self.names.get(name)
+        if pattern is None and is_dir:
+            pattern = self.dir_names.get(name)
+        if pattern is None and self.suffixes and not is_dir:
+            dot = name.rfind(".")
+            if dot != -1:
+                pattern = self.suffixes.get(name[dot:])
+        if pattern is None:
+            pattern = self.search(kind=(False, False), text=name)
+        if pattern is None and is_dir:
+            pattern = self.search(kind=(False, True), text=name)
+        return pattern
+
+    def match(self, path: str, is_dir: bool = False) -> str:
+        """first pattern matching a path
+
+        Arguments:
+            path {str} -- path relative to the template directory, separated
+                          by '/'
+
+        Keyword Arguments:
+            is_dir {bool} -- path is a directory (default: {False})
+
+        Returns:
+            str -- matching pattern or None
+        """
+        pattern = self.match_name(name=path.rpartition("/")[2], is_dir=is_dir)
+        if pattern is None:
+            pattern = self.search(kind=(True, False), text=path)
+        if pattern is None and is_dir:
+            pattern = self.search(kind=(True, True), text=path)
+        return pattern
+
+
+class TemplateCache:
+    """on-disk cache of compiled templates and parsed input files
+
+    each template or input file is stored as a json file named after the
+    hash of its path. an entry is valid as long as size and mtime of the
+    file match. if only the mtime changed, the entry is reused when the
+    content hash matches. the least recently used entries are removed as
+    soon as the cache grows over 'max_size' bytes.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, max_size: int = CACHE_SIZE):
+        self.path = Path(path).expanduser()
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+        except Exception as e:
+            raise OSError(
+                    f"cannot create cache directory '{self.path}'. "
+                    f"{e.strerror}")
+        self.size = sum(entry.stat().st_size
+                        for entry in os.scandir(self.path)
+                        if entry.name.endswith(".json"))
+
+    def entry_path(self, template: str, kind: str = "") -> Path:
+        import hashlib
+        key = f"{kind}{Path(template).resolve()}".encode("utf-8",
+                                                         "surrogateescape")
+        return self.path.joinpath(f"{hashlib.sha256(key).hexdigest()}.json")
+
+    def read_entry(self, entry_path: Path) -> dict:
+        import json
+        try:
+            with open(entry_path, mode="r") as data:
+                entry = json.load(data)
+            if entry.get('version') == self.VERSION:
+                return entry
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def load_vars(self, path: str, delimiter: str = '=') -> dict:
+        """return the variables of an input file. the warnings about
+        invalid lines are logged again on a cache hit
+
+        Arguments:
+            path {str} -- path to .env or .json file
+
+        Keyword Arguments:
+            delimiter {str} -- delimiter of .env files (default: {'='})
+
+        Returns:
+            dict -- dictionary with extracted key/value pairs
+        """
+        import hashlib
+
+        stat = os.stat(path)
+        entry_path = self.entry_path(template=path, kind=f"vars{delimiter}\0")
+        entry = self.read_entry(entry_path=entry_path)
+        if (entry and entry['size'] == stat.st_size and
+           entry['mtime_ns'] == stat.st_mtime_ns):
+            logger.debug(f"use cached input file '{path}'")
+            try:
+                os.utime(entry_path)  # mark as recently used
+            except OSError:
+                pass
+        else:
+            with open(file=path, mode="rb") as data:
+                digest = hashlib.sha256(data.read()).hexdigest()
+            if entry and entry['sha256'] == digest:
+                logger.debug(f"use cached input file '{path}'")
+            else:
+                key_value_dict, warnings = parse_input_file(
+                                               path=path,
+                                               delimiter=delimiter)
+                entry = {'vars': key_value_dict, 'warnings': warnings}
+            entry = {
+                'version': self.VERSION,
+                'path': str(path),
+                'delimiter': delimiter,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': digest,
+                'vars': entry['vars'],
+                'warnings': entry['warnings'],
+            }
+            self.store(entry_path=entry_path, entry=entry)
+        for warning in entry['warnings']:
+            logger.warning(warning)
+        return entry['vars']
+
+    def load(self, template: str) -> tuple:
+        """return the compiled template and, if the template had to be
+        read, its content
+
+        Arguments:
+            template {str} -- path to template
+
+        Returns:
+            tuple -- (parts, content). content is None on a cache hit
+        """
+        import hashlib
+
+        stat = os.stat(template)
+        entry_path = self.entry_path(template)
+        entry = self.read_entry(entry_path=entry_path)
+
+        if (entry and entry['size'] == stat.st_size and
+           entry['mtime_ns'] == stat.st_mtime_ns):
+            logger.debug(f"use cached template '{template}'")
+            try:
+                os.utime(entry_path)  # mark as recently used
+            except OSError:
+                pass
+            return self.parts(entry), None
+
+        with open(file=template, mode="r") as data:
+            content = data.read()
+        digest = hashlib.sha256(
+                    content.encode("utf-8", "surrogateescape")).hexdigest()
+
+        if entry and entry['sha256'] == digest:
+            logger.debug(f"use cached template '{template}'")
+            parts = self.parts(entry)
+        else:
+            parts = compile_template(text=content)
+        self.store(entry_path=entry_path,
+                   entry={
+                       'version': self.VERSION,
+                       'path': str(template),
+                       'size': stat.st_size,
+                       'mtime_ns': stat.st_mtime_ns,
+                       'sha256': digest,
+                       'parts': parts,
+                   })
+        return parts, content
+
+    @staticmethod
+    def parts(entry: dict) -> list:
+        return [part if isinstance(part, str) else tuple(part)
+                for part in entry['parts']]
+
+    def store(self, entry_path: Path, entry: dict):
+        import json
+        data = json.dumps(entry, separators=(',', ':'))
+        tmp_path = None
+        try:
+            old_size = (entry_path.stat().st_size
+                        if entry_path.exists() else 0)
+            tmp_path = temp_file(dst=entry_path)
+            with open(tmp_path, mode="w") as output:
+                output.write(data)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            if tmp_path and os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            logger.warning(f"cannot write cache entry '{entry_path}'. {e}")
+            return
+        with self.lock:
+            self.size += len(data.encode()) - old_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """remove least recently used entries until the cache uses less than
+        90% of its size limit"""
+        entries = sorted(
+            (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.path)
+            if entry.name.endswith(".json"))
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+                logger.debug(f"remove cache entry '{path}'")
+            except OSError:
+                pass
+
+
+class MemoryCache:
+    """in-memory cache of compiled templates with the interface of
+    'TemplateCache'. an entry is valid as long as size and mtime of its
+    template match. the least recently used entries are dropped as soon as
+    more than 'max_entries' templates are cached. a template requested by
+    several threads at the same time is only compiled once.
+    """
+
+    def __init__(self, max_entries: int = 4096, parent: TemplateCache = None):
+        self.max_entries = max_entries
+        self.parent = parent
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.loading = {}  # template: lock held while it is compiled
+
+    def load(self, template: str) -> tuple:
+        """return the compiled template and, if the template had to be
+        read, its content
+
+        Arguments:
+            template {str} -- path to template
+
+        Returns:
+            tuple -- (parts, content). content is None on a cache hit
+        """
+        key = str(template)
+        stat = file_signature(path=template)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == stat:
+                self.entries.move_to_end(key)
+                return entry[1], None
+            loading = self.loading.setdefault(key, threading.Lock())
+
+        with loading:
+            try:
+                with self.lock:
+                    entry = self.entries.get(key)
+                    if entry and entry[0] == stat:
+                        self.entries.move_to_end(key)
+                        return entry[1], None
+
+                if self.parent:
+                    parts, content = self.parent.load(template=template)
+                else:
+                    with open(file=template, mode="r") as data:
+                        content = data.read()
+                    parts = compile_template(text=content)
+
+                with self.lock:
+                    self.entries[key] = (stat, parts)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+            finally:
+                with self.lock:
+                    self.loading.pop(key, None)
+        return parts, content
+
+
+class Manifest:
+    """record of rendered templates for '--incremental'
+
+    for each destination the manifest stores size, mtime and content hash of
+    its template, the variables the template references and a hash of their
+    values. a template is only rendered again if one of them or the
+    destination changed. entries of templates that were not checked during
+    the run (deleted or no longer selected) are dropped on 'save'.
+    """
+
+    NAME = ".templator-manifest.json"
+    VERSION = 1
+
+    def __init__(self, path: str):
+        import json
+
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.entries, self.pending = {}, {}
+        self.seen = set()  # keys checked during this run
+        self.changed = False
+        try:
+            with open(self.path, mode="r") as data:
+                manifest = json.load(data)
+            if manifest.get('version') == self.VERSION:
+                self.entries = manifest['templates']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @classmethod
+    def for_destination(cls, dst: Path):
+        """manifest inside destination directory or next to destination
+        file"""
+        if dst.is_dir() or not dst.suffix:
+            return cls(path=dst.joinpath(cls.NAME))
+        return cls(path=dst.with_name(f".{dst.name}{cls.NAME}"))
+
+    def key(self, dst: Path) -> str:
+        return os.path.relpath(dst, self.path.parent)
+
+    @staticmethod
+    def values_hash(names: list, layers: list) -> str:
+        import hashlib
+        import json
+
+        digest = hashlib.sha256()
+        for name, value in resolve_vars(names=names, layers=layers).items():
+            value = None if value is None else str(value)
+            digest.update(json.dumps([name, value]).encode())
+        return digest.hexdigest()
+
+    def is_current(self,
+                   template: Path,
+                   dst: Path,
+                   substitutions: list or dict = None) -> bool:
+        """check if dst is up to date
+
+        Arguments:
+            template {Path} -- path to template
+            dst {Path} -- path to rendered template
+
+        Keyword Arguments:
+            substitutions {list}/{dict} -- dict or list of dicts with keys
+                                           that match the placeholders in the
+                                           template (default: None)
+
+        Returns:
+            bool -- True if neither template, its variables nor dst changed
+        """
+        key = self.key(dst)
+        entry = self.entries.get(key)
+        stat = os.stat(template)
+        if (entry and entry['template'] == str(template) and
+           entry['size'] == stat.st_size and
+           entry['mtime_ns'] == stat.st_mtime_ns):
+            digest, names = entry['sha256'], entry['vars']
+        else:
+            digest, names = read_template_vars(template=template)
+
+        values = self.values_hash(
+                    names=names,
+                    layers=flatten_substitutions(substitutions=substitutions))
+        with self.lock:
+            self.seen.add(key)
+            self.pending[key] = {
+                'template': str(template),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': digest,
+                'vars': names,
+                'values': values,
+            }
+        if not entry or entry['sha256'] != digest or entry['values'] != values:
+            return False
+        try:
+            output = os.stat(dst)
+        except OSError:
+            return False
+        return entry.get('output') == [output.st_size, output.st_mtime_ns]
+
+    def update(self, dst: Path):
+        """record that dst was rendered"""
+        key = self.key(dst)
+        output = os.stat(dst)
+        with self.lock:
+            entry = self.pending.pop(key)
+            entry['output'] = [output.st_size, output.st_mtime_ns]
+            self.entries[key] = entry
+            self.changed = True
+
+    def save(self):
+        import json
+
+        for key in self.entries.keys() - self.seen:
+            logger.debug(f"remove '{key}' from manifest '{self.path}'")
+            del self.entries[key]
+            self.changed = True
+        if not self.changed:
+            return
+        tmp_path = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = temp_file(dst=self.path, create=new_file)
+            with open(tmp_path, mode="w") as output:
+                json.dump({'version': self.VERSION,
+                           'templates': self.entries}, output)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            if tmp_path and os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            raise OSError(f"cannot write manifest '{self.path}'. {e}")
+        self.changed = False
+
+
+class OutputWriter:
+    """write rendered templates to destination files
+
+    directories are only created once per writer and each destination is
+    only looked up once. the content is encoded once and written in binary
+    mode, without copying it to add the final newline.
+
+    with atomic, a template is written to a temporary file in the directory
+    of its destination, which then replaces the destination. so a
+    destination is never seen half written. with fsync, each file is
+    flushed to disk before it is closed and each directory once on 'close'.
+    with a store, destinations are linked to their content in the store
+    (see 'ContentStore'). with copy_static, templates without placeholders
+    and binary files are copied as they are (see 'write_static').
+    """
+
+    BUFFER_SIZE = 1024 * 1024  # buffer for templates written by a function
+
+    def __init__(self,
+                 atomic: bool = False,
+                 fsync: bool = False,
+                 store: "ContentStore" = None,
+                 copy_static: bool = False):
+        self.atomic = atomic
+        self.fsync = fsync
+        self.store = store
+        self.copy_static = copy_static
+        self.lock = threading.Lock()
+        self.dirs = set()  # directories known to exist
+        self.written_dirs = set()  # directories to flush on 'close'
+        self.encoding = text_encoding()
+
+    def make_dirs(self, directory: str):
+        if directory in self.dirs:
+            return
+        try:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+        except Exception as e:
+            raise OSError(
+                    f"cannot create directory '{directory}'. {e.strerror}")
+        self.dirs.add(directory)
+
+    def write(self,
+              content: str or callable,
+              dst: str,
+              append: bool = False,
+              force: bool = False,
+              if_changed: bool = False,
+              digest: str = None,
+              source: str = None) -> str:
+        """save content to dst
+
+        Arguments:
+            content {str} or {callable} -- see 'write_content'
+            dst {str} -- path to save
+
+        Keyword Arguments:
+            digest {str} -- link dst to this blob of the store instead of
+                            writing content (default: None)
+            source {str} -- copy this file with its mode instead of writing
+                            content (default: None)
+            see 'write_content' for the other arguments
+
+        Raises:
+            Exception: cannot write file
+
+        Returns:
+            str -- see 'write_content'
+        """
+        dst = str(dst)
+        try:
+            stat = os.lstat(dst)
+        except FileNotFoundError:
+            stat = None
+        if stat and not append and not force and not if_changed:
+            logger.warning(f"file '{dst}' already exists")
+            return "skipped"
+
+        directory = os.path.dirname(dst) or "."
+        self.make_dirs(directory)
+        try:
+            try:
+                status = self.save(content=content,
+                                   dst=dst,
+                                   stat=stat,
+                                   append=append and not force,
+                                   if_changed=if_changed,
+                                   digest=digest,
+                                   source=source)
+            except FileNotFoundError:
+                # directory was removed since it was created
+                self.dirs.discard(directory)
+                self.make_dirs(directory)
+                status = self.save(content=content,
+                                   dst=dst,
+                                   stat=stat,
+                                   append=append and not force,
+                                   if_changed=if_changed,
+                                   digest=digest,
+                                   source=source)
+        except Exception as e:
+            raise Exception(f"cannot write file '{dst}'. {str(e)}")
+
+        if status == "unchanged":
+            logger.debug(f"template unchanged in '{dst}'")
+            return status
+        if self.fsync:
+            with self.lock:
+                self.written_dirs.add(directory)
+        logger.info(f"{'append' if status == 'appended' else 'save'} "
+                    f"template to '{dst}'")
+        return status
+
+    def save(self,
+             content: str or callable,
+             dst: str,
+             stat: os.stat_result = None,
+             append: bool = False,
+             if_changed: bool = False,
+             digest: str = None,
+             source: str = None) -> str:
+        """write content to dst, see 'write'
+
+        Keyword Arguments:
+            stat {stat_result} -- lstat of the existing dst (default: None)
+        """
+        if digest:
+            return self.store.link(digest=digest, dst=dst)
+        if source:
+            return self.copy(source=source,
+                             dst=dst,
+                             stat=stat,
+                             if_changed=if_changed)
+        data = None if callable(content) else content.encode(self.encoding)
+        if self.store and data is not None and not append:
+            return self.store.link(
+                digest=self.store.add_bytes(data=data, suffix=b"\n"),
+                dst=dst)
+        buffering = self.BUFFER_SIZE if data is None else -1
+        if append:
+            with open(dst, "ab", buffering=buffering) as output:
+                self.dump(output=output, content=content, data=data)
+            return "appended" if stat else "saved"
+
+        if (stat and if_changed and data is not None and
+                stat.st_size == len(data) + 1 and
+                same_content(path=dst, data=data + b"\n")):
+            return "unchanged"
+
+        # a function writing the template is compared with an existing
+        # destination after it wrote to a temporary file. a linked
+        # destination is replaced, as writing into it would change the
+        # files linked to it as well
+        compare = bool(stat and if_changed and data is None)
+        linked = bool(stat and linked_file(path_stat=stat))
+        if not self.atomic and not compare and not linked:
+            with open(dst, "wb", buffering=buffering) as output:
+                self.dump(output=output, content=content, data=data)
+            return "saved"
+
+        tmp_path = temp_file(dst=dst, create=new_file)
+        try:
+            with open(tmp_path, "wb", buffering=buffering) as output:
+                self.dump(output=output, content=content, data=data)
+                mode = os.fstat(output.fileno()).st_mode & 0o7777
+            if stat:
+                if compare and same_files(path=tmp_path, other=dst):
+                    os.remove(tmp_path)
+                    return "unchanged"
+                if not linked and stat.st_mode & 0o7777 != mode:
+                    os.chmod(tmp_path, stat.st_mode & 0o7777)
+            os.replace(tmp_path, dst)
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return "saved"
+
+    def write_static(self,
+                     template: str,
+                     dst: str,
+                     force: bool = False,
+                     if_changed: bool = False) -> str:
+        """save a template without placeholders to dst, without decoding or
+        rendering it. with copy_static, the template is copied as it is,
+        together with its mode, otherwise it is linked from the store with
+        the newline of a rendered template. binary templates (a NUL byte in
+        the first BINARY_CHECK_SIZE bytes) are always copied with
+        copy_static
+
+        Arguments:
+            template {str} -- path to template
+            dst {str} -- path to save
+
+        Keyword Arguments:
+            force {bool} -- overwrite existing dst file (default: {False})
+            if_changed {bool} -- overwrite an existing dst file, also without
+                                 force, but only if its content differs
+                                 (default: {False})
+
+        Returns:
+            str -- see 'write_content'. None if the template has to be
+                   rendered
+        """
+        dst = str(dst)
+        if not force and not if_changed and os.path.lexists(dst):
+            logger.warning(f"file '{dst}' already exists")
+            return "skipped"
+        if self.store:
+            digest = self.store.add_static(template=template,
+                                           verbatim=self.copy_static)
+            if not digest:
+                return None
+            return self.write(content=None, dst=dst, force=force,
+                              digest=digest)
+        if not static_template(template=template):
+            return None
+        return self.write(content=None, dst=dst, force=force,
+                          if_changed=if_changed, source=template)
+
+    def copy(self,
+             source: str,
+             dst: str,
+             stat: os.stat_result = None,
+             if_changed: bool = False) -> str:
+        """copy source with its mode to dst by the kernel, see 'write'"""
+        import shutil
+
+        if (stat and if_changed and
+                stat.st_size == os.path.getsize(source) and
+                same_files(path=source, other=dst)):
+            return "unchanged"
+        replace = self.atomic or bool(stat and linked_file(path_stat=stat))
+        target = temp_file(dst=dst) if replace else dst
+        try:
+            shutil.copyfile(source, target)
+            shutil.copymode(source, target)
+            if self.fsync:
+                fd = os.open(target, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            if replace:
+                os.replace(target, dst)
+        except BaseException:
+            if replace and os.path.lexists(target):
+                os.remove(target)
+            raise
+        return "saved"
+
+    def dump(self, output, content: str or callable, data: bytes = None):
+        """write the encoded content to a binary file or let content write
+        itself to it"""
+        if data is None:
+            text = io.TextIOWrapper(output,
+                                    encoding=self.encoding,
+                                    write_through=True)
+            content(text)
+            text.flush()
+            text.detach()
+        else:
+            output.write(data)
+            output.write(b"\n")
+        if self.fsync:
+            output.flush()
+            os.fsync(output.fileno())
+
+    def close(self):
+        """flush the directories of the written files to disk"""
+        with self.lock:
+            directories, self.written_dirs = self.written_dirs, set()
+        for directory in directories:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+            except OSError as e:
+                logger.warning(f"cannot sync directory '{directory}'. {e}")
+                continue
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                logger.warning(f"cannot sync directory '{directory}'. {e}")
+            finally:
+                os.close(fd)
+
+
+class ContentStore:
+    """content-addressed store of rendered templates for '--store'
+
+    each distinct output is stored once as a read-only blob, named by the
+    sha256 of its content. destinations are links to the blobs (see
+    LINK_MODES), which replace a destination atomically. a destination
+    already linked to its blob is left untouched.
+    """
+
+    LINK_MODES = ("hardlink", "symlink", "reflink", "copy")
+    FICLONE = 0x40049409  # linux ioctl to share the blocks of a file
+
+    def __init__(self, path: str, link: str = "hardlink", fsync: bool = False):
+        if link not in self.LINK_MODES:
+            raise ValueError(f"unknown link mode '{link}'")
+        self.path = Path(path).expanduser().absolute()
+        self.link_mode = link
+        self.fsync = fsync
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            raise OSError(f"cannot create store '{self.path}'. {e.strerror}")
+
+    def blob_path(self, digest: str) -> Path:
+        return self.path.joinpath(digest[:2], digest[2:])
+
+    def add_bytes(self, data: bytes, suffix: bytes = b"") -> str:
+        """store data followed by suffix and return the digest"""
+        import hashlib
+
+        sha256 = hashlib.sha256(data)
+        sha256.update(suffix)
+        digest = sha256.hexdigest()
+        blob = self.blob_path(digest=digest)
+        if not os.path.exists(blob):
+            def write(path):
+                with open(path, "wb") as output:
+                    output.write(data)
+                    output.write(suffix)
+            self.save_blob(blob=blob, write=write)
+        return digest
+
+    def add_static(self, template: str, verbatim: bool = False) -> str:
+        """store a template without placeholders as it is rendered: its
+        content followed by a newline. the template is read in binary mode
+        and copied by the kernel
+
+        Arguments:
+            template {str} -- path to template
+
+        Keyword Arguments:
+            verbatim {bool} -- store the content as it is, without the
+                               newline. binary templates are stored even if
+                               they contain a '$' (default: {False})
+
+        Returns:
+            str -- digest or None if the template contains a '$' or a
+                   carriage return (without verbatim) and has to be
+                   rendered
+        """
+        import hashlib
+        import shutil
+
+        suffix = b"" if verbatim else b"\n"
+        sha256 = hashlib.sha256()
+        with open(template, "rb") as data:
+            chunk = data.read(CHUNK_SIZE)
+            binary = verbatim and b"\0" in chunk[:BINARY_CHECK_SIZE]
+            while chunk:
+                if not binary and (b"$" in chunk or
+                                   (not verbatim and b"\r" in chunk)):
+                    return None
+                sha256.update(chunk)
+                chunk = data.read(CHUNK_SIZE)
+        sha256.update(suffix)
+        digest = sha256.hexdigest()
+        blob = self.blob_path(digest=digest)
+        if not os.path.exists(blob):
+            def write(path):
+                shutil.copyfile(template, path)
+                if suffix:
+                    with open(path, "ab") as output:
+                        output.write(suffix)
+            self.save_blob(blob=blob, write=write)
+        return digest
+
+    def save_blob(self, blob: Path, write: callable):
+        """let write create a temporary file, which then becomes the
+        read-only blob"""
+        blob.parent.mkdir(exist_ok=True)
+        tmp_path = Path(temp_file(dst=blob))
+        try:
+            write(tmp_path)
+            if self.fsync:
+                fd = os.open(tmp_path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, blob)
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def link(self, digest: str, dst: str) -> str:
+        """point dst to the blob of digest
+
+        Arguments:
+            digest {str} -- digest returned by 'add_bytes' or 'add_static'
+            dst {str} -- destination
+
+        Returns:
+            str -- 'saved' or 'unchanged' if dst already was the blob
+        """
+        import shutil
+
+        blob = self.blob_path(digest=digest)
+        try:
+            current = os.lstat(dst)
+        except FileNotFoundError:
+            current = None
+        if current:
+            if self.link_mode == "symlink":
+                if os.path.islink(dst) and os.readlink(dst) == str(blob):
+                    return "unchanged"
+            elif self.link_mode == "hardlink":
+                blob_stat = os.stat(blob)
+                if (current.st_ino, current.st_dev) == \
+                        (blob_stat.st_ino, blob_stat.st_dev):
+                    return "unchanged"
+            elif not os.path.islink(dst) and same_files(path=blob, other=dst):
+                return "unchanged"
+
+        def create(path: str):
+            if self.link_mode == "symlink":
+                os.symlink(blob, path)
+                return
+            if self.link_mode == "hardlink":
+                try:
+                    os.link(blob, path)
+                    return
+                except FileExistsError:
+                    raise
+                except OSError as e:
+                    # other file system or no hard links supported
+                    logger.debug(f"cannot link '{dst}' to the store. {e}")
+            new_file(path)
+            if self.link_mode == "reflink":
+                self.clone(blob=blob, dst=path)
+            else:
+                shutil.copyfile(blob, path)
+
+        tmp_path = temp_file(dst=dst, create=create)
+        try:
+            os.replace(tmp_path, dst)
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return "saved"
+
+    def clone(self, blob: Path, dst: str):
+        """share the blocks of blob with dst or copy it, if the file system
+        does not support it"""
+        import shutil
+
+        try:
+            import fcntl
+
+            with open(blob, "rb") as source, open(dst, "wb") as output:
+                fcntl.ioctl(output.fileno(), self.FICLONE, source.fileno())
+        except (ImportError, OSError) as e:
+            logger.debug(f"cannot clone '{blob}'. {e}")
+            shutil.copyfile(blob, dst)
+
+
+class InputFiles:
+    """variables of input files. a file is read again as soon as it
+    changed"""
+
+    def __init__(self,
+                 paths: list = [],
+                 delimiter: str = '=',
+                 cache: TemplateCache = None):
+        self.delimiter = delimiter
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.files = {}
+        for path in paths or []:
+            self.files[path] = {
+                'stat': file_signature(path=path),
+                'vars': read_file(path=path, delimiter=delimiter, cache=cache),
+            }
+
+    @property
+    def vars(self) -> collections.ChainMap:
+        # later input files take precedence, like 'dict.update'
+        return collections.ChainMap(
+                *reversed([entry['vars'] for entry in self.files.values()]))
+
+    def refresh(self) -> set:
+        """read changed input files again
+
+        Returns:
+            set -- keys whose value changed
+        """
+        missing = object()
+        changed = set()
+        with self.lock:
+            for path, entry in self.files.items():
+                stat = file_signature(path=path)
+                if stat == entry['stat']:
+                    continue
+                entry['stat'] = stat
+                try:
+                    new_vars = read_file(path=path,
+                                         delimiter=self.delimiter,
+                                         cache=self.cache)
+                except Exception as e:
+                    logger.error(e)
+                    continue
+                logger.info(f"input file '{path}' changed")
+                old_vars = entry['vars']
+                keys = [key for key in set(old_vars) | set(new_vars)
+                        if old_vars.get(key, missing) !=
+                        new_vars.get(key, missing)]
+                before = self.vars
+                before = {key: before.get(key, missing) for key in keys}
+                entry['vars'] = new_vars
+                after = self.vars
+                changed.update(key for key in keys
+                               if after.get(key, missing) != before[key])
+        return changed
+
+
+class Stats:
+    """timings of the stages of a run for '--stats'
+
+    each stage is timed per template and in total. 'walk' is the time spent
+    finding the templates, including 'skip_path'.
+    """
+
+    STAGES = ("walk", "skip_path", "read", "index", "substitute", "diff",
+              "write")
+
+    def __init__(self, layers: list = []):
+        self.layers = layers
+        self.lock = threading.Lock()
+        self.totals = {stage: [0.0, 0] for stage in self.STAGES}
+        self.files = {}  # template: {stage: seconds}
+        self.bytes_in = self.bytes_out = 0
+        self.resolved = [0] * len(layers)
+        self.unresolved = 0
+        self.start = time.perf_counter()
+
+    def add(self, stage: str, start: float, template: str = None):
+        """add the time since start (time.perf_counter) to a stage"""
+        seconds = time.perf_counter() - start
+        with self.lock:
+            total = self.totals[stage]
+            total[0] += seconds
+            total[1] += 1
+            if template is not None:
+                timings = self.files.setdefault(str(template), {})
+                timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def add_bytes(self, bytes_in: int = 0, bytes_out: int = 0):
+        with self.lock:
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def walk(self, templates):
+        """time finding each (template, destination) of an iterable"""
+        templates = iter(templates)
+        while True:
+            start = time.perf_counter()
+            try:
+                template = next(templates)
+            except StopIteration:
+                self.add("walk", start)
+                return
+            self.add("walk", start)
+            yield template
+
+    def count_placeholders(self, index: dict, substitutions: list or dict):
+        """count the placeholders of a template resolved by each layer
+
+        Arguments:
+            index {dict} -- placeholders of the template (see
+                            'index_placeholders')
+            substitutions {list}/{dict} -- dict or list of dicts with keys
+                                           that match the placeholders
+        """
+        if not isinstance(substitutions, list):
+            substitutions = [substitutions]
+        layers = [flatten_substitutions(substitutions=layer)
+                  for layer in substitutions]
+        resolved, unresolved = [0] * len(layers), 0
+        for name, entries in index.items():
+            if name is None:
+                continue
+            for position, layer in enumerate(layers):
+                if any(name in item for item in layer):
+                    resolved[position] += len(entries)
+                    break
+            else:
+                unresolved += len(entries)
+        with self.lock:
+            if len(self.resolved) < len(resolved):
+                self.resolved.extend(
+                    [0] * (len(resolved) - len(self.resolved)))
+            for index, count in enumerate(resolved):
+                self.resolved[index] += count
+            self.unresolved += unresolved
+
+    def report(self, output=None):
+        """write the timings of each template and the totals to output
+        (default: stderr)"""
+        output = output or sys.stderr
+        stages = [stage for stage in self.STAGES if self.totals[stage][1]]
+        width = max([len(name) for name in self.files] + [8])
+
+        output.write(f"{'template':<{width}} " +
+                     " ".join(f"{stage:>10}" for stage in stages
+                              if stage not in ("walk", "skip_path")) +
+                     f" {'total':>10}\n")
+        for name, timings in sorted(self.files.items(),
+                                    key=lambda item: -sum(item[1].values())):
+            output.write(f"{name:<{width}} " +
+                         " ".join(f"{timings.get(stage, 0.0):>10.4f}"
+                                  for stage in stages
+                                  if stage not in ("walk", "skip_path")) +
+                         f" {sum(timings.values()):>10.4f}\n")
+
+        output.write(f"\n{'stage':<12} {'calls':>8} {'seconds':>10}\n")
+        for stage in stages:
+            seconds, calls = self.totals[stage]
+            output.write(f"{stage:<12} {calls:>8} {seconds:>10.4f}\n")
+        output.write(f"{'total':<12} {len(self.files):>8} "
+                     f"{time.perf_counter() - self.start:>10.4f}\n\n")
+
+        output.write(f"bytes in: {self.bytes_in}, "
+                     f"bytes out: {self.bytes_out}\n")
+        names = [self.layers[index] if index < len(self.layers) else
+                 f"layer {index}" for index in range(len(self.resolved))]
+        counts = [f"{name}: {count}"
+                  for name, count in zip(names, self.resolved)]
+        counts.append(f"unresolved: {self.unresolved}")
+        output.write(f"resolved placeholders: {', '.join(counts)}\n")
+        output.flush()
+
+
+class Watcher:
+    """render templates again as soon as they or their variables change
+
+    the watcher polls the templates and the input files. if an input file
+    changed, only the templates referencing one of the changed keys are
+    rendered. if a template changed or was added, only this template is
+    rendered. existing output files are always overwritten, like with
+    '--force', as each change renders the same output files again.
+    """
+
+    def __init__(self,
+                 src: list,
+                 dst: Path = None,
+                 recursive: bool = False,
+                 key_value_list: list = [],
+                 input_files: list = [],
+                 file_delimiter: str = '=',
+                 no_os_env: bool = True,
+                 strict: bool = False,
+                 excludes: list = [],
+                 includes: list = [],
+                 cache: TemplateCache = None,
+                 show_diff: bool = False,
+                 stream: bool = False,
+                 use_mmap: bool = False,
+                 if_changed: bool = False,
+                 writer: OutputWriter = None):
+        self.items = []
+        for item in src:
+            dst_dir = True if item.endswith("/") else False
+            item = Path(item).expanduser()
+            if not item.exists():
+                raise LookupError(f"'{str(item)}' not found")
+            self.items.append((item, dst_dir))
+
+        self.dst = dst
+        self.recursive = recursive
+        self.excludes = excludes
+        self.includes = includes
+        self.strict = strict
+        # the names of a template come from the parts it is rendered from
+        self.cache = MemoryCache(parent=cache)
+        self.show_diff = show_diff
+        self.stream = stream
+        self.use_mmap = use_mmap
+        self.if_changed = if_changed
+        self.writer = writer
+
+        self.key_values = read_key_value_list(
+                            key_value_list=key_value_list,
+                            delimiter='=') if key_value_list else {}
+        self.input_files = InputFiles(paths=input_files,
+                                      delimiter=file_delimiter,
+                                      cache=cache)
+        self.os_env = os.environ if not no_os_env else {}
+
+        self.templates = {}  # template: {'stat': ..., 'vars': [...]}
+        self.index = {}  # variable: {template, ...}
+
+    @property
+    def substitutions(self) -> list:
+        return [self.key_values, self.input_files.vars, self.os_env]
+
+    def find(self) -> dict:
+        templates = {}
+        for item, dst_dir in self.items:
+            templates.update(find_templates(item=item,
+                                            dst=self.dst,
+                                            dst_dir=dst_dir,
+                                            recursive=self.recursive,
+                                            excludes=self.excludes,
+                                            includes=self.includes))
+        return templates
+
+    def changed_inputs(self) -> set:
+        """re-read changed input files and return the templates referencing
+        a variable whose value changed"""
+        templates = set()
+        for key in self.input_files.refresh():
+            if key not in self.key_values:
+                templates.update(self.index.get(key, ()))
+        return templates
+
+    def render(self, template: Path, dst_file: Path):
+        for name in self.templates.get(template, {}).get('vars', []):
+            self.index.get(name, set()).discard(template)
+        self.templates[template] = {
+            'stat': file_signature(path=template),
+            'vars': sorted(referenced_names(
+                        src=[template],
+                        cache=self.cache,
+                        stream=self.stream or self.use_mmap)),
+        }
+        for name in self.templates[template]['vars']:
+            self.index.setdefault(name, set()).add(template)
+        output_file(src=template,
+                    dst=dst_file,
+                    force=True,
+                    substitutions=self.substitutions,
+                    strict=self.strict,
+                    show_diff=self.show_diff,
+                    cache=self.cache,
+                    stream=self.stream,
+                    use_mmap=self.use_mmap,
+                    if_changed=self.if_changed,
+                    writer=self.writer)
+
+    def poll(self) -> list:
+        """render changed templates
+
+        Returns:
+            list -- rendered templates
+        """
+        changed = self.changed_inputs()
+        templates = self.find()
+        for template in set(self.templates) - set(templates):
+            logger.info(f"template '{template}' removed")
+            for name in self.templates.pop(template)['vars']:
+                self.index.get(name, set()).discard(template)
+
+        rendered = []
+        for template, dst_file in templates.items():
+            entry = self.templates.get(template)
+            if (template not in changed and entry and
+               entry['stat'] == file_signature(path=template)):
+                continue
+            try:
+                self.render(template=template, dst_file=dst_file)
+                rendered.append(template)
+            except Exception as e:
+                logger.error(e)
+        if rendered and self.writer:
+            self.writer.close()
+        return rendered
+
+    def run(self, interval: float = WATCH_INTERVAL):
+        """poll every interval seconds until interrupted"""
+        logger.info("watch templates and input files. press ctrl+c to stop")
+        try:
+            while True:
+                self.poll()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            sys.stdout.flush()
+            logger.info("stop watching")
+
+
+class RenderServer:
+    """render templates on requests over a unix socket
+
+    the server keeps the variables of '-s', the input files and the
+    compiled templates in memory. input files are read again as soon as
+    they change.
+
+    a request is a json object per line:
+        template {str} -- absolute path to template
+        text {str} -- template content instead of a path
+        set {dict} or {list} -- variables with the highest precedence
+        strict {bool} -- fail if not all variables could be replaced
+        dst {str} -- save to absolute path instead of returning the content
+        append {bool} -- append to dst
+        force {bool} -- overwrite dst
+
+    each request is answered with a json object per line, containing either
+    'content', 'dst' or 'error'.
+    """
+
+    def __init__(self,
+                 path: str,
+                 key_value_list: list = [],
+                 input_files: list = [],
+                 file_delimiter: str = '=',
+                 no_os_env: bool = True,
+                 cache: TemplateCache = None):
+        self.key_values = read_key_value_list(
+                            key_value_list=key_value_list,
+                            delimiter='=') if key_value_list else {}
+        self.input_files = InputFiles(paths=input_files,
+                                      delimiter=file_delimiter,
+                                      cache=cache)
+        self.os_env = os.environ if not no_os_env else {}
+        self.cache = MemoryCache(parent=cache)
+        self.path = path
+
+    def listen(self):
+        """bind the unix socket
+
+        Returns:
+            socketserver.UnixStreamServer -- call 'serve_forever' to handle
+                                             requests in threads
+        """
+        import socketserver
+
+        server = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server.handle(rfile=self.rfile, wfile=self.wfile)
+
+        class ThreadingUnixStreamServer(socketserver.ThreadingMixIn,
+                                        socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        # bind with mode 0o600, so no other user can connect in between
+        umask = os.umask(0o177)
+        try:
+            return ThreadingUnixStreamServer(self.path, RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def handle(self, rfile, wfile):
+        """answer each request (json object per line) of a connection"""
+        import json
+
+        for line in rfile:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a json object")
+            except ValueError as e:
+                response = {'error': f"invalid request. {e}"}
+            else:
+                response = self.render(request=request)
+            wfile.write(json.dumps(response).encode() + b"\n")
+
+    def render(self, request: dict) -> dict:
+        """render the template of a request
+
+        Arguments:
+            request {dict} -- see class documentation
+
+        Returns:
+            dict -- response
+        """
+        try:
+            overrides = request.get('set') or {}
+            if isinstance(overrides, list):
+                overrides = read_key_value_list(key_value_list=overrides,
+                                                delimiter='=')
+            self.input_files.refresh()
+            substitutions = [overrides,
+                             self.key_values,
+                             self.input_files.vars,
+                             self.os_env]
+            strict = bool(request.get('strict'))
+            template = request.get('template')
+
+            if template is None:
+                parts = compile_template(text=str(request.get('text', "")))
+                if strict:
+                    check_placeholders(
+                        placeholders=(part for part in parts
+                                      if not isinstance(part, str) and
+                                      part[0]),
+                        substitutions=substitutions)
+                content = render_template(parts=parts,
+                                          substitutions=substitutions)
+            else:
+                content = parse_template(template=template,
+                                         substitutions=substitutions,
+                                         strict=strict,
+                                         cache=self.cache)
+
+            dst = request.get('dst')
+            if not dst:
+                return {'content': content}
+            if template and Path(template) == Path(dst):
+                raise SyntaxError("source and destination cannot be equal!")
+            write_content(content=content,
+                          dst=dst,
+                          append=bool(request.get('append')),
+                          force=bool(request.get('force')))
+            return {'dst': dst}
+        except Exception as e:
+            return {'error': str(e).strip('"')}
+
+
+class Renderer:
+    """render templates in-process with variables, options and caches that
+    are set up once
+
+    the variables are looked up in the order: variables of the call,
+    variables, input files, os environment. input files are read again as
+    soon as they change. compiled templates and strings are kept in memory.
+    a renderer can be used by several threads at the same time.
+
+        renderer = Renderer(variables={'env': 'prod'},
+                            input_files=["values.env"])
+        renderer.render_string("env: $env")
+        renderer.render_file("templates/nginx.yaml", variables={'port': 80})
+        renderer.render_tree("templates/", dst="out/", force=True)
+
+    Keyword Arguments:
+        variables {dict} or {list} -- dict or key=value strings
+                                      (default: None)
+        input_files {list} -- .env and .json files (default: [])
+        file_delimiter {str} -- delimiter of .env files (default: '=')
+        no_os_env {bool} -- do not use os environment (default: {True})
+        strict {bool} -- raise a LookupError if not all variables could be
+                         replaced (default: {False})
+        recursive, excludes, includes -- select the templates of
+                                         directories, see 'process'
+        force {bool} -- overwrite existing output files (default: {False})
+        cache_dir {str} -- also store compiled templates and input files in
+                           this directory (default: None)
+        cache_size {int} -- size limit of cache_dir (default: CACHE_SIZE)
+        write_if_changed, atomic, fsync, store, link, copy_static -- how
+                                         output files are written, see
+                                         'process'
+    """
+
+    Result = collections.namedtuple(
+        "Result", ["template", "dst", "status", "content", "error"])
+
+    STRING_CACHE_SIZE = 1024  # compiled strings of 'render_string'
+
+    def __init__(self,
+                 variables: dict or list = None,
+                 input_files: list = [],
+                 file_delimiter: str = '=',
+                 no_os_env: bool = True,
+                 strict: bool = False,
+                 recursive: bool = False,
+                 excludes: list = [],
+                 includes: list = [],
+                 force: bool = False,
+                 cache_dir: str = None,
+                 cache_size: int = CACHE_SIZE,
+                 write_if_changed: bool = False,
+                 atomic: bool = False,
+                 fsync: bool = False,
+                 store: str = None,
+                 link: str = None,
+                 copy_static: bool = False):
+        disk_cache = TemplateCache(path=cache_dir,
+                                   max_size=cache_size) if cache_dir else None
+        self.variables = self.read_variables(variables=variables)
+        self.input_files = InputFiles(paths=input_files,
+                                      delimiter=file_delimiter,
+                                      cache=disk_cache)
+        self.os_env = os.environ if not no_os_env else {}
+        self.cache = MemoryCache(parent=disk_cache)
+        self.strict = strict
+        self.recursive = recursive
+        self.excludes = excludes
+        self.includes = includes
+        self.force = force
+        self.if_changed = write_if_changed
+        self.writer = OutputWriter(
+            atomic=atomic,
+            fsync=fsync,
+            store=ContentStore(path=store,
+                               link=link or "hardlink",
+                               fsync=fsync) if store else None,
+            copy_static=copy_static)
+        self.compile = functools.lru_cache(
+            maxsize=self.STRING_CACHE_SIZE)(compile_template)
+
+    @staticmethod
+    def read_variables(variables: dict or list = None) -> dict:
+        if isinstance(variables, (list, tuple)):
+            return read_key_value_list(key_value_list=variables,
+                                       delimiter='=')
+        return variables or {}
+
+    def substitutions(self, variables: dict or list = None) -> list:
+        """layers of a call, with input files read again if they changed"""
+        self.input_files.refresh()
+        return [self.read_variables(variables=variables),
+                self.variables,
+                self.input_files.vars,
+                self.os_env]
+
+    def render_string(self,
+                      text: str,
+                      variables: dict or list = None) -> str:
+        """render a template string
+
+        Arguments:
+            text {str} -- template
+
+        Keyword Arguments:
+            variables {dict} or {list} -- variables with the highest
+                                          precedence (default: None)
+
+        Raises:
+            LookupError: 'strict' set and not all variables replaced
+
+        Returns:
+            str -- rendered template
+        """
+        parts = self.compile(text=text)
+        substitutions = self.substitutions(variables=variables)
+        if self.strict:
+            check_placeholders(
+                placeholders=(part for part in parts
+                              if not isinstance(part, str) and part[0]),
+                substitutions=substitutions)
+        return render_template(parts=parts, substitutions=substitutions)
+
+    def render_file(self,
+                    template: str,
+                    variables: dict or list = None) -> str:
+        """render a template file
+
+        Arguments:
+            template {str} -- path to template
+
+        Keyword Arguments:
+            variables {dict} or {list} -- variables with the highest
+                                          precedence (default: None)
+
+        Raises:
+            FileNotFoundError: template file not found
+            LookupError: 'strict' set and not all variables replaced
+
+        Returns:
+            str -- rendered template, without the final newline of an
+                   output file
+        """
+        return parse_template(template=str(template),
+                              substitutions=self.substitutions(
+                                  variables=variables),
+                              strict=self.strict,
+                              cache=self.cache)
+
+    def results(self,
+                src: str or list,
+                dst: str = None,
+                variables: dict or list = None):
+        """render the templates of each path in src, one after another
+
+        Arguments:
+            src {str} or {list} -- templates or directories. a directory
+                                   ending with '/' puts its templates
+                                   directly into dst
+
+        Keyword Arguments:
+            dst {str} -- output file or directory, which is created if it
+                         ends with '/'. without, the rendered templates are
+                         returned as 'content' (default: None)
+            variables {dict} or {list} -- variables with the highest
+                                          precedence (default: None)
+
+        Raises:
+            LookupError: path in src not found
+            SyntaxError: multiple templates and only one destination file
+
+        Yields:
+            Result -- template, dst, status (see 'write_content'), content
+                      and error of each template. a template that fails
+                      does not stop the others
+        """
+        src = [src] if isinstance(src, (str, Path)) else src
+        if dst and str(dst).endswith("/"):
+            os.makedirs(dst, exist_ok=True)
+        dst = Path(dst) if dst else None
+        substitutions = self.substitutions(variables=variables)
+        try:
+            for item in src:
+                dst_dir = str(item).endswith("/")
+                item = Path(item).expanduser()
+                if not item.exists():
+                    raise LookupError(f"'{str(item)}' not found")
+                if (dst and not dst.is_dir() and not dst.is_file() and
+                        (item.is_dir() or len(src) > 1)):
+                    raise SyntaxError("you cannot add multiple templates and "
+                                      "only one destination file")
+
+                for template, dst_file in find_templates(
+                        item=item,
+                        dst=dst,
+                        dst_dir=dst_dir,
+                        recursive=self.recursive,
+                        excludes=self.excludes,
+                        includes=self.includes):
+                    status, content = None, None
+                    try:
+                        if dst_file:
+                            status = output_file(src=template,
+                                                 dst=dst_file,
+                                                 force=self.force,
+                                                 substitutions=substitutions,
+                                                 strict=self.strict,
+                                                 cache=self.cache,
+                                                 if_changed=self.if_changed,
+                                                 writer=self.writer)
+                        else:
+                            content = parse_template(
+                                template=str(template),
+                                substitutions=substitutions,
+                                strict=self.strict,
+                                cache=self.cache)
+                    except Exception as e:
+                        yield self.Result(str(template), dst_file and
+                                          str(dst_file), None, None, e)
+                        continue
+                    yield self.Result(str(template), dst_file and
+                                      str(dst_file), status, content, None)
+        finally:
+            self.writer.close()
+
+    def render_tree(self,
+                    src: str or list,
+                    dst: str = None,
+                    variables: dict or list = None) -> list:
+        """render the templates of each path in src, see 'results'
+
+        Returns:
+            list -- Result of each template
+        """
+        return list(self.results(src=src, dst=dst, variables=variables))
+
+
+def parse_args():
+    """parse known args and return argparse.Namespace"""
+    import argparse
+
+    class CustomHelpFormatter(argparse.HelpFormatter):
+        def __init__(self, prog):
+            # change max_help_position
+            super(CustomHelpFormatter, self).__init__(prog,
+                                                      max_help_position=42)
+
+        def _format_action_invocation(self, action):
+            if not action.option_strings:
+                metavar, = self._metavar_formatter(action, action.dest)(1)
+                return metavar
+            else:
+                parts = []
+                # if the Optional doesn't take a value, format is:
+                #    -s, --long
+                if action.nargs == 0:
+                    parts.extend(action.option_strings)
+
+                # if the Optional takes a value, format is:
+                #    -s, --long ARGS
+                else:
+                    default = action.dest.upper()
+                    args_string = self._format_args(action, default)
+                    for option_string in action.option_strings:
+                        parts.append('%s' % option_string)
+                    parts[-1] += ' %s' % args_string
+                return ', '.join(parts)
+
+    class CustomFormatter(CustomHelpFormatter,
+                          argparse.RawDescriptionHelpFormatter):
+        pass
+
+    parser = argparse.ArgumentParser(
+        formatter_class=CustomFormatter,
+        add_help=False,
+        description="""
+Replace all instances of $VAR and/or ${VAR} in a file with the
+corresponding passed values and send the result to stdout or to a file.
+
+Variables can be passed as followed:
+- directly with key=value pairs (parameter '-s KEY1=VALUE1 [KEY2=VALUE2 ...]')
+- from .json and/or .env files (parameter '-i PATH [PATH ...]')
+- from os environment variables (can be disabled with parameter '--no-os-env')
+""",
+        epilog=(
+            f"{BOLD}Supported variable types{DEFAULT}:\n\n"
+            """
+Supports $-based substitutions, using the following rules:
+- "$$" is an escape; it is replaced with a single "$".
+- "$identifier" names a substitution placeholder matching a mapping key of
+  "identifier". By default, "identifier" is restricted to any case-insensitive
+  ASCII alphanumeric string (including underscores) that starts with an
+  underscore or ASCII letter. The first non-identifier character after the
+  "$" character terminates this placeholder specification.
+- "${identifier}" is equivalent to "$identifier". It is required when valid
+  identifier characters follow the placeholder but are not part of the
+  placeholder, such as "${noun}ification".
+            """
+            f"\n{BOLD}replacement order:{DEFAULT}\n\n"
+            "The order of replacing variables is:\n"
+            f"- directly passed key=value pairs ('-s') {BOLD}*{DEFAULT}\n"
+            f"- input files ('-i') {BOLD}*{DEFAULT}\n"
+            f"- os environment variables (can be disabled with"
+            "   parameter '--no-os-env')"
+            f"\n\n{BOLD}*{DEFAULT}{ITALIC}in order you pass them to the "
+            f"script{DEFAULT}\n\n"
+            "see full documentation here: https://github.com/gi8lino/templator"
+        )
+    )
+    parser.add_argument(action="store",
+                        dest="src",
+                        nargs='*',
+                        metavar="PATH",
+                        help="path to template file or directory containing"
+                             " template files")
+    parser.add_argument("--diff",
+                        action="store_true",
+                        dest="diff",
+                        default=None,
+                        help="show replaced lines")
+    parser.add_argument("-r", "--recursive",
+                        action="store_true",
+                        dest="recursive",
+                        default=None,
+                        help="process templates directory recursively")
+    parser.add_argument("-e", "--exclude",
+                        action="store",
+                        dest="excludes",
+                        metavar="PATTERN",
+                        nargs='+',
+                        help="exclude paths matching gitignore-style "
+                             "[PATTERN]")
+    parser.add_argument("--include",
+                        action="store",
+                        dest="includes",
+                        metavar="PATTERN",
+                        nargs='+',
+                        help="when PATH is a directory, only render files "
+                             "matching gitignore-style [PATTERN]")
+    parser.add_argument("--strict",
+                        action="store_true",
+                        dest="strict",
+                        default=None,
+                        help=f"raise an error if not {UNDERLINE}all{DEFAULT}"
+                             " variables could be replaced")
+    parser.add_argument("--stream",
+                        action="store_true",
+                        dest="stream",
+                        default=None,
+                        help="read and write templates chunk by chunk")
+    parser.add_argument("--mmap",
+                        action="store_true",
+                        dest="mmap",
+                        default=None,
+                        help="copy text between variables from memory-mapped"
+                             " utf-8 templates")
+    parser.add_argument("-w", "--watch",
+                        action="store_true",
+                        dest="watch",
+                        default=None,
+                        help="render templates again as soon as they or "
+                             "their variables change. implies '-f|--force'")
+    parser.add_argument("--watch-interval",
+                        action="store",
+                        dest="watch_interval",
+                        type=float,
+                        default=WATCH_INTERVAL,
+                        metavar="SECONDS",
+                        help="seconds between two checks for changes. "
+                             f"default: {WATCH_INTERVAL:g}")
+    parser.add_argument("-j", "--jobs",
+                        action="store",
+                        dest="jobs",
+                        type=int,
+                        default=1,
+                        metavar="N",
+                        help="render N templates at the same time. default: 1")
+    parser.add_argument("--pipeline",
+                        action="store",
+                        dest="pipeline",
+                        type=int,
+                        default=0,
+                        metavar="N",
+                        help="overlap finding, reading, rendering and "
+                             "writing of templates with an asyncio pipeline "
+                             "of N tasks")
+    parser.add_argument("--stats",
+                        action="store_true",
+                        dest="stats",
+                        default=None,
+                        help="report the time of each stage per template and "
+                             "in total to stderr")
+    parser.add_argument("--profile",
+                        action="store",
+                        dest="profile",
+                        metavar="FILE",
+                        help="save cProfile statistics of the run to FILE")
+    group_verbose = parser.add_mutually_exclusive_group(required=False)
+    group_verbose.add_argument("--debug",
+                               action="store_true",
+                               dest="debug",
+                               default=None,
+                               help="set log level to debug")
+    group_verbose.add_argument("-q", "--quiet",
+                               action="store_true",
+                               dest="quiet",
+                               default=None,
+                               help="do not output log")
+    parser.add_argument("-v", "--version",
+                        action="version",
+                        version=f"templater version {__version__}\n"
+                                f"by {__author__}",
+                        help="show version number and exit")
+    parser.add_argument('-h', '--help',
+                        action='help',
+                        default=argparse.SUPPRESS,
+                        help='show this help message and exit')
+    group_key_values = parser.add_argument_group("optional: set key=value")
+    group_key_values.add_argument("-s", "--set",
+                                  dest="key_value_list",
+                                  nargs='*',
+                                  metavar="KEY=VALUE",
+                                  help="pass key=value pairs as variable")
+    group_input = parser.add_argument_group("optional: input file")
+    group_input.add_argument("-i", "--input",
+                             dest="input_files",
+                             nargs='+',
+                             metavar="PATH",
+                             help="files containing variable(s)")
+    group_input.add_argument("-d", "--delimiter-in-file",
+                             action="store",
+                             dest="delimiter",
+                             default=None,
+                             help="set delimiter for key/value pairs in "
+                                  f"{UNDERLINE}files{DEFAULT}. "
+                                  "default: =")
+    group_env = parser.add_argument_group("optional: read os environment")
+    group_env.add_argument("-n", "--no-os-env",
+                           action="store_true",
+                           dest="no_os_env",
+                           default=False,
+                           help="do not use os environment")
+    group_env.add_argument("--referenced-only",
+                           action="store_true",
+                           dest="referenced_only",
+                           default=None,
+                           help="only look up the variables used by the "
+                                "templates in the input files and the os "
+                                "environment")
+    group_output = parser.add_argument_group("optional output")
+    group_output.add_argument("-o", "--output",
+                              action="store",
+                              dest="dst",
+                              metavar="PATH",
+                              help="redirect output to file or a directory")
+    group_output.add_argument("-a", "--append",
+                              action="store_true",
+                              dest="append",
+                              default=None,
+                              help="append to output file PATH")
+    group_output.add_argument("-f", "--force",
+                              action="store_true",
+                              dest="force",
+                              default=None,
+                              help="replace existing output file")
+    group_output.add_argument("--atomic",
+                              action="store_true",
+                              dest="atomic",
+                              default=None,
+                              help="write each output file to a temporary "
+                                   "file, which then replaces it")
+    group_output.add_argument("--fsync",
+                              action="store_true",
+                              dest="fsync",
+                              default=None,
+                              help="flush each output file and once each "
+                                   "output directory to disk")
+    group_output.add_argument("--copy-static",
+                              action="store_true",
+                              dest="copy_static",
+                              default=None,
+                              help="copy templates without variables and "
+                                   "binary files as they are")
+    group_output.add_argument("--store",
+                              action="store",
+                              dest="store",
+                              metavar="DIR",
+                              help="store each distinct output once in DIR "
+                                   "and link the output files to it")
+    group_output.add_argument("--link",
+                              action="store",
+                              dest="link",
+                              choices=ContentStore.LINK_MODES,
+                              default=None,
+                              help="how output files are linked to the "
+                                   "store. default: hardlink")
+    group_output.add_argument("--write-if-changed",
+                              action="store_true",
+                              dest="write_if_changed",
+                              default=None,
+                              help="replace an existing output file only if "
+                                   "its content changed. implies "
+                                   "'-f|--force' for changed files")
+    group_output.add_argument("--incremental",
+                              action="store_true",
+                              dest="incremental",
+                              default=None,
+                              help="only render templates whose content or "
+                                   "variables changed")
+    group_batch = parser.add_argument_group("optional: batch")
+    group_batch.add_argument("--batch",
+                             action="store",
+                             dest="batch",
+                             metavar="MANIFEST",
+                             help="render the entries of the json lines file "
+                                  "MANIFEST instead of PATH")
+    group_batch.add_argument("--matrix",
+                             action="store",
+                             dest="matrix",
+                             metavar="ROWS",
+                             help="render template PATH once for each row of "
+                                  "the .csv, .jsonl or .json file ROWS")
+    group_server = parser.add_argument_group("optional: server")
+    group_server_mode = group_server.add_mutually_exclusive_group()
+    group_server_mode.add_argument("--serve",
+                                   action="store",
+                                   dest="serve",
+                                   metavar="SOCKET",
+                                   help="render templates on requests over "
+                                        "the unix socket SOCKET. PATH are "
+                                        "optional and compiled on start")
+    group_server_mode.add_argument("--connect",
+                                   action="store",
+                                   dest="connect",
+                                   metavar="SOCKET",
+                                   help="let the server listening on SOCKET "
+                                        "render the templates")
+    group_cache = parser.add_argument_group("optional: cache")
+    group_cache.add_argument("--cache-dir",
+                             action="store",
+                             dest="cache_dir",
+                             metavar="PATH",
+                             help="store compiled templates in directory PATH")
+    group_cache.add_argument("--cache-size",
+                             action="store",
+                             dest="cache_size",
+                             type=int,
+                             default=CACHE_SIZE // (1024 * 1024),
+                             metavar="MB",
+                             help="size limit of the cache directory. "
+                                  f"default: {CACHE_SIZE // (1024 * 1024)}")
+
+    args, unknown = parser.parse_known_args()
+
+    if unknown:
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: unrecognized argument"
+                         f"{'s' if len(unknown) != 1 else ''}: "
+                         "'{0}'".format(
+                             "', '".join(unknown)))
+        sys.exit(1)
+
+    if not args.src and not (args.batch or args.serve):
+        parser.error("the following arguments are required: PATH")
+
+    if args.batch:
+        errs = [
+            "PATH" if args.src else None,
+            "'-o|--output'" if args.dst else None,
+            "'--diff'" if args.diff else None,
+            "'--stream'" if args.stream else None,
+            "'--mmap'" if args.mmap else None,
+            "'-w|--watch'" if args.watch else None,
+            "'--incremental'" if args.incremental else None,
+            "'--serve'" if args.serve else None,
+            "'--connect'" if args.connect else None,
+        ]
+        if any(errs):
+            parser.print_usage()
+            sys.stderr.write("templator.py: error: you cannot set "
+                             f"{' and/or '.join(filter(None, errs))} with "
+                             "'--batch'\n")
+            sys.exit(1)
+
+    if args.matrix:
+        errs = [
+            "'--batch'" if args.batch else None,
+            "'-a|--append'" if args.append else None,
+            "'--diff'" if args.diff else None,
+            "'--stream'" if args.stream else None,
+            "'--mmap'" if args.mmap else None,
+            "'-j|--jobs'" if args.jobs > 1 else None,
+            "'--pipeline'" if args.pipeline else None,
+            "'-w|--watch'" if args.watch else None,
+            "'--incremental'" if args.incremental else None,
+            "'--referenced-only'" if args.referenced_only else None,
+            "'--copy-static'" if args.copy_static else None,
+            "'--stats'" if args.stats else None,
+            "'--serve'" if args.serve else None,
+            "'--connect'" if args.connect else None,
+        ]
+        if any(errs):
+            parser.print_usage()
+            sys.stderr.write("templator.py: error: you cannot set "
+                             f"{' and/or '.join(filter(None, errs))} with "
+                             "'--matrix'\n")
+            sys.exit(1)
+        if len(args.src) != 1:
+            parser.print_usage()
+            sys.stderr.write("templator.py: error: '--matrix' renders exactly "
+                             "one template PATH\n")
+            sys.exit(1)
+
+    if args.delimiter and not args.input_files and not args.batch:
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set a delimiter "
+                         f"({args.delimiter}) without minimum one "
+                         "input file\n")
+        sys.exit(1)
+
+    if sum(1 for arg in (args.stream, args.mmap, args.diff) if arg) > 1:
+        errs = [
+            "'--stream'" if args.stream else None,
+            "'--mmap'" if args.mmap else None,
+            "'--diff'" if args.diff else None,
+        ]
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set "
+                         f"{' and '.join(filter(None, errs))} together\n")
+        sys.exit(1)
+
+    if args.jobs < 1:
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: '-j|--jobs' must be greater "
+                         "than 0\n")
+        sys.exit(1)
+
+    if args.pipeline < 0:
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: '--pipeline' must not be "
+                         "negative\n")
+        sys.exit(1)
+
+    if args.pipeline:
+        errs = [
+            "'-j|--jobs'" if args.jobs > 1 else None,
+            "'-w|--watch'" if args.watch else None,
+            "'--batch'" if args.batch else None,
+            "'--serve'" if args.serve else None,
+            "'--connect'" if args.connect else None,
+        ]
+        if any(errs):
+            parser.print_usage()
+            sys.stderr.write("templator.py: error: you cannot set "
+                             f"{' and/or '.join(filter(None, errs))} with "
+                             "'--pipeline'\n")
+            sys.exit(1)
+
+    if (args.jobs > 1 or args.pipeline) and (args.stream or args.mmap):
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set " +
+                         ("'--stream'" if args.stream else "'--mmap'") +
+                         " and " + ("'-j|--jobs'\n" if args.jobs > 1 else
+                                    "'--pipeline'\n"))
+        sys.exit(1)
+
+    if args.connect:
+        errs = [
+            "'--diff'" if args.diff else None,
+            "'--stream'" if args.stream else None,
+            "'--mmap'" if args.mmap else None,
+            "'-w|--watch'" if args.watch else None,
+            "'--incremental'" if args.incremental else None,
+            "'-i|--input'" if args.input_files else None,
+            "'-n|--no-os-env'" if args.no_os_env else None,
+            "'--cache-dir'" if args.cache_dir else None,
+            "'--write-if-changed'" if args.write_if_changed else None,
+            "'--atomic'" if args.atomic else None,
+            "'--fsync'" if args.fsync else None,
+        ]
+        if any(errs):
+            parser.print_usage()
+            sys.stderr.write("templator.py: error: you cannot set "
+                             f"{' and/or '.join(filter(None, errs))} with "
+                             "'--connect'\n")
+            sys.exit(1)
+
+    if args.stats and (args.watch or args.serve or args.connect):
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set '--stats' and " +
+                         ("'-w|--watch'\n" if args.watch else
+                          "'--serve'\n" if args.serve else
+                          "'--connect'\n"))
+        sys.exit(1)
+
+    if args.referenced_only and (args.watch or args.serve or args.connect):
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set "
+                         "'--referenced-only' and " +
+                         ("'-w|--watch'\n" if args.watch else
+                          "'--serve'\n" if args.serve else
+                          "'--connect'\n"))
+        sys.exit(1)
+
+    if args.watch and (args.append or args.incremental):
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set '-w|--watch' "
+                         "and " + ("'-a|--append'\n" if args.append else
+                                   "'--incremental'\n"))
+        sys.exit(1)
+
+    if args.incremental and (args.append or not args.dst):
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set "
+                         "'--incremental' " +
+                         ("and '-a|--append'\n" if args.append else
+                          "without the parameter '-o|--output'\n"))
+        sys.exit(1)
+
+    if args.link and not args.store:
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set '--link' "
+                         "without the parameter '--store'\n")
+        sys.exit(1)
+
+    if args.store:
+        errs = [
+            "'-a|--append'" if args.append else None,
+            "'--stream'" if args.stream else None,
+            "'--mmap'" if args.mmap else None,
+            "'--serve'" if args.serve else None,
+            "'--connect'" if args.connect else None,
+        ]
+        if any(errs):
+            parser.print_usage()
+            sys.stderr.write("templator.py: error: you cannot set "
+                             f"{' and/or '.join(filter(None, errs))} with "
+                             "'--store'\n")
+            sys.exit(1)
+
+    if args.copy_static and (args.append or args.serve or args.connect):
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set "
+                         "'--copy-static' and " +
+                         ("'-a|--append'\n" if args.append else
+                          "'--serve'\n" if args.serve else
+                          "'--connect'\n"))
+        sys.exit(1)
+
+    if (args.append or args.force or args.write_if_changed or
+            args.atomic or args.fsync or args.store or args.copy_static) \
+            and not args.dst and not args.batch:
+        errs = [
+            "'-a|--append'" if args.append else None,
+            "'-f|--force'" if args.force else None,
+            "'--write-if-changed'" if args.write_if_changed else None,
+            "'--atomic'" if args.atomic else None,
+            "'--fsync'" if args.fsync else None,
+            "'--store'" if args.store else None,
+            "'--copy-static'" if args.copy_static else None,
+        ]
+        parser.print_usage()
+        sys.stderr.write("templator.py: error: you cannot set "
+                         f"{' and/or '.join(filter(None, errs))}"
+                         " without the parameter '-o|--output'\n")
+        sys.exit(1)
+
+    return args
+
+
+def setup_logger(debug=False):
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG if debug else logging.INFO)
+
+    # the stream handlers are only created once something is logged
+    root_logger.addHandler(DeferredHandler(logger=root_logger))
+
+
+def process(src: list,
+            dst: str = None,
+            show_diff: bool = False,
+            recursive: bool = False,
+            key_value_list: list = [],
+            input_files: list = [],
+            file_delimiter: str = '=',
+            no_os_env: bool = True,
+            strict: bool = False,
+            append: bool = False,
+            force: bool = False,
+            excludes: list = [],
+            includes: list = [],
+            cache_dir: str = None,
+            cache_size: int = CACHE_SIZE,
+            jobs: int = 1,
+            stream: bool = False,
+            use_mmap: bool = False,
+            incremental: bool = False,
+            watch: bool = False,
+            watch_interval: float = WATCH_INTERVAL,
+            stats: bool = False,
+            referenced_only: bool = False,
+            pipeline: int = 0,
+            write_if_changed: bool = False,
+            atomic: bool = False,
+            fsync: bool = False,
+            store: str = None,
+            link: str = None,
+            copy_static: bool = False):
+
+    dst = Path(dst) if dst else None
+    cache = TemplateCache(path=cache_dir,
+                          max_size=cache_size) if cache_dir else None
+    if incremental and not dst:
+        raise SyntaxError("you cannot set '--incremental' without a "
+                          "destination")
+    manifest = Manifest.for_destination(dst=dst) if incremental else None
+    writer = OutputWriter(
+        atomic=atomic,
+        fsync=fsync,
+        store=ContentStore(path=store,
+                           link=link or "hardlink",
+                           fsync=fsync) if store else None,
+        copy_static=copy_static) if dst else None
+
+    if watch:
+        Watcher(src=src,
+                dst=dst,
+                recursive=recursive,
+                key_value_list=key_value_list,
+                input_files=input_files,
+                file_delimiter=file_delimiter,
+                no_os_env=no_os_env,
+                strict=strict,
+                excludes=excludes,
+                includes=includes,
+                cache=cache,
+                show_diff=show_diff,
+                stream=stream,
+                use_mmap=use_mmap,
+                if_changed=write_if_changed,
+                writer=writer).run(interval=watch_interval)
+        return
+
+    pool = None
+    if (jobs > 1 or pipeline) and (show_diff or stream or use_mmap):
+        if show_diff:
+            logger.debug("option '--diff' renders one template after "
+                         "another")
+        else:
+            logger.warning(f"option '--{'stream' if stream else 'mmap'}' "
+                           "renders one template after another")
+        pipeline = 0
+    elif jobs > 1:
+        import concurrent.futures
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+    parsed_key_value_list, os_env = {}, {}
+
+    if key_value_list:
+        parsed_key_value_list = read_key_value_list(
+                                    key_value_list=key_value_list,
+                                    delimiter='=')
+    # later input files take precedence, like 'dict.update'
+    parsed_files_vars = collections.ChainMap(*reversed([
+        read_file(path=input_file, delimiter=file_delimiter, cache=cache)
+        for input_file in input_files or []]))
+    if not no_os_env:
+        os_env = os.environ
+
+    substitutions = [
+        parsed_key_value_list,
+        parsed_files_vars,
+        os_env,
+    ]
+    if referenced_only:
+        if not (stream or use_mmap):
+            # templates compiled to collect their names are rendered from
+            # memory
+            cache = MemoryCache(parent=cache)
+        substitutions = referenced_layers(
+            substitutions=substitutions,
+            names=referenced_names(src=src,
+                                   recursive=recursive,
+                                   excludes=excludes,
+                                   includes=includes,
+                                   cache=cache,
+                                   stream=stream or use_mmap))
+    stats = Stats(layers=["set", "input files", "os environment"]) \
+        if stats else None
+    counts = collections.Counter()
+
+    try:
+        render_sources(src=src,
+                       dst=dst,
+                       substitutions=substitutions,
+                       show_diff=show_diff,
+                       recursive=recursive,
+                       strict=strict,
+                       append=append,
+                       force=force,
+                       excludes=excludes,
+                       includes=includes,
+                       cache=cache,
+                       pool=pool,
+                       jobs=jobs,
+                       stream=stream,
+                       use_mmap=use_mmap,
+                       manifest=manifest,
+                       stats=stats,
+                       pipeline=pipeline,
+                       if_changed=write_if_changed,
+                       counts=counts,
+                       writer=writer)
+    finally:
+        if pool:
+            pool.shutdown()
+        if writer:
+            writer.close()
+        if stats:
+            sys.stdout.flush()
+            stats.report()
+
+    if write_if_changed:
+        log_counts(counts=counts)
+
+    if manifest:
+        manifest.save()
+
+
+def render_sources(src: list,
+                   dst: Path = None,
+                   substitutions: list or dict = None,
+                   show_diff: bool = False,
+                   recursive: bool = False,
+                   strict: bool = False,
+                   append: bool = False,
+                   force: bool = False,
+                   excludes: list = [],
+                   includes: list = [],
+                   cache: TemplateCache = None,
+                   pool=None,
+                   jobs: int = 1,
+                   stream: bool = False,
+                   use_mmap: bool = False,
+                   manifest: Manifest = None,
+                   stats: Stats = None,
+                   pipeline: int = 0,
+                   if_changed: bool = False,
+                   counts: collections.Counter = None,
+                   writer: OutputWriter = None):
+    """render the templates of each path in src
+
+    Arguments:
+        src {list} -- templates or directories. a directory ending with '/'
+                      puts its templates directly into dst
+
+    Keyword Arguments:
+        dst {Path} -- output file or directory (default: {None})
+        substitutions {list}/{dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+        pool {Executor} -- render the templates of a directory with this
+                           pool (default: None)
+        pipeline {int} -- render the templates with an asyncio pipeline of
+                          this many tasks, if greater than 0 (default: 0)
+        if_changed {bool} -- overwrite an existing dst file, also without
+                             force, but only if its content differs
+                             (default: {False})
+        counts {Counter} -- count what happened to the destinations (see
+                            'write_content') (default: None)
+        writer {OutputWriter} -- save the destinations with this writer
+                                 (default: None)
+        see 'process' for the other arguments
+
+    Raises:
+        LookupError: path in src not found
+        SyntaxError: multiple templates and only one destination file
+    """
+    for item in src:
+        dst_dir = True if item.endswith("/") else False
+        item = Path(item).expanduser()
+
+        if not item.exists():
+            raise LookupError(f"'{str(item)}' not found")
+
+        if (dst and
+           (not dst.is_dir() and not dst.is_file()) and
+           (item.is_dir() or len(src) > 1) and
+           not append):
+            raise SyntaxError("you cannot add multiple templates and only one "
+                              "destination file without parameter "
+                              "'-a|--append'")
+
+        templates = find_templates(item=item,
+                                   dst=dst,
+                                   dst_dir=dst_dir,
+                                   recursive=recursive,
+                                   excludes=excludes,
+                                   includes=includes,
+                                   stats=stats)
+        if stats:
+            templates = stats.walk(templates=templates)
+        if manifest:
+            templates = outdated_templates(templates=templates,
+                                           manifest=manifest,
+                                           substitutions=substitutions)
+        if pipeline:
+            render_pipeline(templates=templates,
+                            concurrency=pipeline,
+                            append=append,
+                            force=force or bool(manifest),
+                            substitutions=substitutions,
+                            strict=strict,
+                            cache=cache,
+                            manifest=manifest,
+                            stats=stats,
+                            if_changed=if_changed,
+                            counts=counts,
+                            writer=writer)
+            continue
+        if pool:
+            render_parallel(pool=pool,
+                            templates=templates,
+                            jobs=jobs,
+                            append=append,
+                            force=force or bool(manifest),
+                            substitutions=substitutions,
+                            strict=strict,
+                            cache=cache,
+                            manifest=manifest,
+                            stats=stats,
+                            if_changed=if_changed,
+                            counts=counts,
+                            writer=writer)
+            continue
+
+        for template, dst_file in templates:
+            try:
+                status = output_file(src=template,
+                                     dst=dst_file,
+                                     append=append,
+                                     force=force or bool(manifest),
+                                     substitutions=substitutions,
+                                     strict=strict,
+                                     show_diff=show_diff,
+                                     cache=cache,
+                                     stream=stream,
+                                     use_mmap=use_mmap,
+                                     stats=stats,
+                                     if_changed=if_changed,
+                                     writer=writer)
+                if counts is not None and status:
+                    counts[status] += 1
+                if manifest:
+                    manifest.update(dst=dst_file)
+            except Exception as e:
+                logger.error(e)
+
+
+def outdated_templates(templates, manifest: Manifest,
+                       substitutions: list or dict = None):
+    """yield only the templates whose destination is not up to date
+
+    Arguments:
+        templates {iterable} -- (template, destination) tuples
+        manifest {Manifest} -- record of rendered templates
+
+    Keyword Arguments:
+        substitutions {list}/{dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+    """
+    for template, dst_file in templates:
+        if manifest.is_current(template=template,
+                               dst=dst_file,
+                               substitutions=substitutions):
+            logger.debug(f"skip unchanged template '{template}'")
+            continue
+        yield template, dst_file
+
+
+def serve(socket_path: str,
+          src: list = [],
+          recursive: bool = False,
+          key_value_list: list = [],
+          input_files: list = [],
+          file_delimiter: str = '=',
+          no_os_env: bool = True,
+          excludes: list = [],
+          includes: list = [],
+          cache_dir: str = None,
+          cache_size: int = CACHE_SIZE):
+    """render templates on requests over a unix socket until interrupted
+
+    Arguments:
+        socket_path {str} -- path to the unix socket
+
+    Keyword Arguments:
+        src {list} -- templates or directories to compile on start
+                      (default: [])
+        see 'process' for the other arguments
+
+    Raises:
+        OSError: socket is used by another server
+    """
+    import socket
+
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_path)
+            except OSError:
+                os.remove(socket_path)  # left over from a stopped server
+            else:
+                raise OSError(f"socket '{socket_path}' already in use")
+
+    cache = TemplateCache(path=cache_dir,
+                          max_size=cache_size) if cache_dir else None
+    server = RenderServer(path=socket_path,
+                          key_value_list=key_value_list,
+                          input_files=input_files,
+                          file_delimiter=file_delimiter,
+                          no_os_env=no_os_env,
+                          cache=cache)
+    with server.listen() as listener:
+        for item in src:
+            item = Path(item).expanduser()
+            if not item.exists():
+                raise LookupError(f"'{str(item)}' not found")
+            for template, _ in find_templates(item=item,
+                                              recursive=recursive,
+                                              excludes=excludes,
+                                              includes=includes):
+                try:
+                    server.cache.load(template=str(template.absolute()))
+                except Exception as e:
+                    logger.error(e)
+
+        logger.info(f"listen on '{socket_path}'. press ctrl+c to stop")
+        try:
+            listener.serve_forever()
+        except KeyboardInterrupt:
+            sys.stdout.flush()
+            logger.info("stop server")
+        finally:
+            os.remove(socket_path)
+
+
+def render_remote(socket_path: str,
+                  src: list,
+                  dst: str = None,
+                  recursive: bool = False,
+                  key_value_list: list = [],
+                  strict: bool = False,
+                  append: bool = False,
+                  force: bool = False,
+                  excludes: list = [],
+                  includes: list = []):
+    """let a running server ('--serve') render templates
+
+    Arguments:
+        socket_path {str} -- path to the unix socket of the server
+        src {list} -- templates or directories. '-' reads a template
+                      from stdin
+
+    Keyword Arguments:
+        see 'process'
+
+    Raises:
+        ConnectionError: cannot connect to server
+    """
+    import json
+    import socket
+
+    dst = Path(dst) if dst else None
+    overrides = read_key_value_list(key_value_list=key_value_list,
+                                    delimiter='=') if key_value_list else {}
+
+    def requests():
+        for item in src:
+            request = {'set': overrides, 'strict': bool(strict)}
+            if item == "-":
+                request['text'] = sys.stdin.read()
+                yield request, dst
+                continue
+            dst_dir = True if item.endswith("/") else False
+            item = Path(item).expanduser()
+            if not item.exists():
+                raise LookupError(f"'{str(item)}' not found")
+            for template, dst_file in find_templates(item=item,
+                                                     dst=dst,
+                                                     dst_dir=dst_dir,
+                                                     recursive=recursive,
+                                                     excludes=excludes,
+                                                     includes=includes):
+                yield dict(request,
+                           template=str(template.absolute())), dst_file
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            raise ConnectionError(
+                    f"cannot connect to '{socket_path}'. {e.strerror}")
+        stream = sock.makefile("rwb")
+        for request, dst_file in requests():
+            if dst_file:
+                request.update(dst=str(dst_file.absolute()),
+                               append=bool(append),
+                               force=bool(force))
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            line = stream.readline()
+            if not line:
+                raise ConnectionError(f"server '{socket_path}' closed the "
+                                      "connection")
+            response = json.loads(line)
+            if 'error' in response:
+                logger.error(response['error'])
+            elif 'dst' in response:
+                logger.info(f"save template to '{response['dst']}'")
+            else:
+                sys.stdout.write(f"{response['content']}\n")
+        sys.stdout.flush()
+
+
+def log_counts(counts: collections.Counter):
+    """log how many destination files were written and left unchanged"""
+    logger.info(f"{counts['saved'] + counts['appended']} written, "
+                f"{counts['unchanged']} unchanged")
+
+
+def render_batch(manifest: str,
+                 recursive: bool = False,
+                 key_value_list: list = [],
+                 input_files: list = [],
+                 file_delimiter: str = '=',
+                 no_os_env: bool = True,
+                 strict: bool = False,
+                 append: bool = False,
+                 force: bool = False,
+                 excludes: list = [],
+                 includes: list = [],
+                 cache_dir: str = None,
+                 cache_size: int = CACHE_SIZE,
+                 jobs: int = 1,
+                 stats: bool = False,
+                 referenced_only: bool = False,
+                 write_if_changed: bool = False,
+                 atomic: bool = False,
+                 fsync: bool = False,
+                 store: str = None,
+                 link: str = None,
+                 copy_static: bool = False):
+    """render the entries of a batch manifest in one process
+
+    each template is compiled once for all entries and each input file is
+    read once, even if several entries use it. the variables of an entry
+    are looked up in the order:
+    'set' of the entry, '-s', 'input' of the entry, '-i', os environment
+
+    Arguments:
+        manifest {str} -- path to the batch manifest (see 'read_batch')
+
+    Keyword Arguments:
+        jobs {int} -- render N entries at the same time. output of entries
+                      without destination is not ordered then (default: 1)
+        see 'process' for the other arguments
+
+    Raises:
+        Exception: not all entries could be rendered
+    """
+    entries = read_batch(path=manifest)
+    disk_cache = TemplateCache(path=cache_dir,
+                               max_size=cache_size) if cache_dir else None
+
+    files = {}
+    for path in list(input_files or []) + [path for entry in entries
+                                           for path in entry['input']]:
+        if path not in files:
+            files[path] = read_file(path=path,
+                                    delimiter=file_delimiter,
+                                    cache=disk_cache)
+
+    key_values = read_key_value_list(key_value_list=key_value_list,
+                                     delimiter='=') if key_value_list else {}
+    os_env = os.environ if not no_os_env else {}
+    cache = MemoryCache(parent=disk_cache)
+    if referenced_only:
+        names = referenced_names(src=[item for entry in entries
+                                      for item in entry['src']],
+                                 recursive=recursive,
+                                 excludes=excludes,
+                                 includes=includes,
+                                 cache=cache)
+        files = {path: referenced_layers(substitutions=[values],
+                                         names=names)[0]
+                 for path, values in files.items()}
+        key_values, os_env = referenced_layers(
+            substitutions=[key_values, os_env], names=names)
+    # later input files take precedence
+    global_files = [files[path] for path in reversed(input_files or [])]
+    writer = OutputWriter(
+        atomic=atomic,
+        fsync=fsync,
+        store=ContentStore(path=store,
+                           link=link or "hardlink",
+                           fsync=fsync) if store else None,
+        copy_static=copy_static)
+    stats = Stats(layers=["entry set", "set", "entry input files",
+                          "input files", "os environment"]) if stats else None
+
+    def render_entry(entry: dict):
+        if entry['dst'] and entry['dst'].endswith("/"):
+            os.makedirs(entry['dst'], exist_ok=True)
+        substitutions = [
+            entry['set'],
+            key_values,
+            [files[path] for path in reversed(entry['input'])],
+            global_files,
+            os_env,
+        ]
+        entry_counts = collections.Counter()
+        render_sources(src=entry['src'],
+                       dst=Path(entry['dst']) if entry['dst'] else None,
+                       substitutions=substitutions,
+                       recursive=recursive,
+                       strict=strict,
+                       append=append,
+                       force=force,
+                       excludes=excludes,
+                       includes=includes,
+                       cache=cache,
+                       stats=stats,
+                       if_changed=write_if_changed,
+                       counts=entry_counts,
+                       writer=writer)
+        return entry_counts
+
+    failed = 0
+    counts = collections.Counter()
+    try:
+        if jobs > 1:
+            import concurrent.futures
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=jobs) as pool:
+                futures = [(entry, pool.submit(render_entry, entry))
+                           for entry in entries]
+                for entry, future in futures:
+                    try:
+                        counts.update(future.result())
+                    except Exception as e:
+                        failed += 1
+                        logger.error(f"entry on line {entry['line']}: {e}")
+        else:
+            for entry in entries:
+                try:
+                    counts.update(render_entry(entry))
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"entry on line {entry['line']}: {e}")
+    finally:
+        writer.close()
+        if stats:
+            sys.stdout.flush()
+            stats.report()
+
+    if write_if_changed:
+        log_counts(counts=counts)
+    if failed:
+        raise Exception(f"{failed} of {len(entries)} entries in batch "
+                        f"manifest '{manifest}' failed")
+
+
+def render_matrix(rows_file: str,
+                  template: str,
+                  dst: str = None,
+                  key_value_list: list = [],
+                  input_files: list = [],
+                  file_delimiter: str = '=',
+                  no_os_env: bool = True,
+                  strict: bool = False,
+                  force: bool = False,
+                  cache_dir: str = None,
+                  cache_size: int = CACHE_SIZE,
+                  write_if_changed: bool = False,
+                  atomic: bool = False,
+                  fsync: bool = False,
+                  store: str = None,
+                  link: str = None):
+    """render one template for each row of a rows file
+
+    the template is compiled once. the variables of a row are looked up
+    first, followed by '-s', '-i' and the os environment. dst is a pattern,
+    rendered with the variables of each row (e.g. 'out/${host}.conf').
+    without dst, each row is written to stdout as a json object per line
+    with the keys 'row' and 'content' or 'error'.
+
+    Arguments:
+        rows_file {str} -- path to the rows (see 'read_rows')
+        template {str} -- path to template
+
+    Keyword Arguments:
+        dst {str} -- destination pattern (default: None)
+        see 'process' for the other arguments
+
+    Raises:
+        SyntaxError: dst does not contain a variable
+        Exception: not all rows could be rendered
+    """
+    import json
+
+    disk_cache = TemplateCache(path=cache_dir,
+                               max_size=cache_size) if cache_dir else None
+    template = str(Path(template).expanduser())
+    if not os.path.isfile(template):
+        raise FileNotFoundError(f"template '{template}' not found")
+    parts, _ = MemoryCache(parent=disk_cache).load(template=template)
+    placeholders = [part for part in parts
+                    if not isinstance(part, str) and part[0]]
+
+    dst_parts = compile_template(text=str(dst)) if dst else None
+    dst_placeholders = [part for part in dst_parts or []
+                        if not isinstance(part, str) and part[0]]
+    if dst and not dst_placeholders:
+        raise SyntaxError("the destination of '--matrix' must contain a "
+                          "variable, e.g. 'out/${name}.conf'")
+
+    key_values = read_key_value_list(key_value_list=key_value_list,
+                                     delimiter='=') if key_value_list else {}
+    # later input files take precedence, like 'dict.update'
+    files_vars = collections.ChainMap(*reversed([
+        read_file(path=input_file, delimiter=file_delimiter,
+                  cache=disk_cache)
+        for input_file in input_files or []]))
+    os_env = os.environ if not no_os_env else {}
+    writer = OutputWriter(
+        atomic=atomic,
+        fsync=fsync,
+        store=ContentStore(path=store,
+                           link=link or "hardlink",
+                           fsync=fsync) if store else None) if dst else None
+
+    destinations = {}  # dst: row
+    counts = collections.Counter()
+    failed = total = 0
+    try:
+        for nr, row in read_rows(path=rows_file):
+            total += 1
+            substitutions = [row, key_values, files_vars, os_env]
+            try:
+                if strict:
+                    check_placeholders(placeholders=placeholders,
+                                       substitutions=substitutions)
+                content = render_template(parts=parts,
+                                          substitutions=substitutions)
+                if not dst:
+                    sys.stdout.write(json.dumps({'row': nr,
+                                                 'content': content}) + "\n")
+                    continue
+
+                try:
+                    check_placeholders(placeholders=dst_placeholders,
+                                       substitutions=substitutions)
+                except LookupError:
+                    raise LookupError("cannot resolve the destination "
+                                      f"'{dst}'")
+                dst_file = render_template(parts=dst_parts,
+                                           substitutions=substitutions)
+                if os.path.abspath(dst_file) == os.path.abspath(template):
+                    raise SyntaxError("source and destination cannot be "
+                                      "equal!")
+                if dst_file in destinations:
+                    raise ValueError(f"destination '{dst_file}' already "
+                                     f"rendered for row "
+                                     f"{destinations[dst_file]}")
+                destinations[dst_file] = nr
+                status = write_content(content=content,
+                                       dst=dst_file,
+                                       force=force,
+                                       if_changed=write_if_changed,
+                                       writer=writer)
+                if status:
+                    counts[status] += 1
+            except Exception as e:
+                failed += 1
+                msg = str(e).strip('"')
+                if dst:
+                    logger.error(f"row {nr} in '{rows_file}': {msg}")
+                else:
+                    sys.stdout.write(json.dumps({'row': nr,
+                                                 'error': msg}) + "\n")
+    finally:
+        sys.stdout.flush()
+        if writer:
+            writer.close()
+
+    if write_if_changed:
+        log_counts(counts=counts)
+    if failed:
+        raise Exception(f"{failed} of {total} rows in '{rows_file}' failed")
+
+
+def read_rows(path: str):
+    """read the variables of each row of a .csv, .jsonl (or .ndjson) or
+    .json file, one after another
+
+    the first line of a .csv file names the columns. each line of a .jsonl
+    file is a json object, empty lines are skipped. a .json file contains a
+    list of objects. missing csv values and json nulls are left out of a row,
+    like variables the row does not set.
+
+    Arguments:
+        path {str} -- path to the rows
+
+    Raises:
+        FileNotFoundError: file not found
+        TypeError: unknown suffix
+        ValueError: invalid row
+
+    Yields:
+        tuple -- number (line of .jsonl files) and variables of a row
+    """
+    import json
+
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"rows file '{path}' not found")
+    suffix = Path(path).suffix
+    if suffix not in (".csv", ".jsonl", ".ndjson", ".json"):
+        raise TypeError(f"rows file '{path}' does not end with '.csv', "
+                        "'.jsonl', '.ndjson' or '.json'")
+
+    with open(file=path, mode="r",
+              newline="" if suffix == ".csv" else None) as data:
+        if suffix == ".csv":
+            import csv
+            rows = enumerate(csv.DictReader(data), start=1)
+        elif suffix == ".json":
+            rows = json.load(data)
+            if not isinstance(rows, list):
+                raise ValueError(f"rows file '{path}' must contain a list "
+                                 "of objects")
+            rows = enumerate(rows, start=1)
+        else:
+            rows = ((nr, line) for nr, line in enumerate(data, start=1)
+                    if line.strip())
+
+        for nr, row in rows:
+            if isinstance(row, str):
+                try:
+                    row = json.loads(row)
+                except ValueError as e:
+                    raise ValueError(f"line {nr} in rows file '{path}' is "
+                                     f"invalid. {e}")
+            if not isinstance(row, dict):
+                raise ValueError(f"row {nr} in rows file '{path}' must be "
+                                 "an object")
+            # csv values without a column, missing csv values and json nulls
+            yield nr, {key: value for key, value in row.items()
+                       if key is not None and value is not None}
+
+
+def read_batch(path: str) -> list:
+    """read a batch manifest. each line is a json object with the keys:
+        src {str} or {list} -- templates or directories (required)
+        dst {str} -- output file or directory. stdout if not set. a
+                     directory ending with '/' is created
+        set {dict} or {list} -- variables as dict or 'key=value' strings
+        input {str} or {list} -- .env or .json files containing variables
+    empty lines and lines starting with '#' are skipped
+
+    Arguments:
+        path {str} -- path to the manifest
+
+    Raises:
+        FileNotFoundError: manifest not found
+        ValueError: invalid entry
+
+    Returns:
+        list -- entries with the keys 'line', 'src', 'dst', 'set' and
+                'input'
+    """
+    import json
+
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"batch manifest '{path}' not found")
+
+    entries = []
+    with open(file=path, mode="r") as data:
+        for nr, line in enumerate(data, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+                if not isinstance(entry, dict):
+                    raise ValueError("entry must be a json object")
+                unknown = set(entry) - {'src', 'dst', 'set', 'input'}
+                if unknown:
+                    raise ValueError("unknown key{0} '{1}'".format(
+                        's' if len(unknown) != 1 else '',
+                        "', '".join(sorted(unknown))))
+                src = entry.get('src')
+                src = [src] if isinstance(src, str) else src
+                if (not src or not isinstance(src, list) or
+                   not all(isinstance(item, str) for item in src)):
+                    raise ValueError("'src' must be a path or a list of "
+                                     "paths")
+                dst = entry.get('dst')
+                if dst is not None and not isinstance(dst, str):
+                    raise ValueError("'dst' must be a path")
+                inputs = entry.get('input') or []
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                if (not isinstance(inputs, list) or
+                   not all(isinstance(item, str) for item in inputs)):
+                    raise ValueError("'input' must be a path or a list of "
+                                     "paths")
+                overrides = entry.get('set') or {}
+                if isinstance(overrides, list):
+                    overrides = read_key_value_list(key_value_list=overrides,
+                                                    delimiter='=')
+                if not isinstance(overrides, dict):
+                    raise ValueError("'set' must be an object or a list of "
+                                     "'key=value' strings")
+            except (ValueError, KeyError) as e:
+                msg = str(e).strip('"')
+                raise ValueError(f"line {nr} in batch manifest '{path}' is "
+                                 f"invalid. {msg}")
+            entries.append({
+                'line': nr,
+                'src': src,
+                'dst': dst,
+                'set': overrides,
+                'input': inputs,
+            })
+    return entries
+
+
+def find_templates(item: Path,
+                   dst: Path = None,
+                   dst_dir: bool = False,
+                   recursive: bool = False,
+                   excludes: list = [],
+                   includes: list = [],
+                   stats: Stats = None):
+    """yield each template of item with its destination
+
+    Arguments:
+        item {Path} -- template file or directory containing templates
+
+    Keyword Arguments:
+        dst {Path} -- output file or directory (default: {None})
+        dst_dir {bool} -- put the templates of directory item directly into
+                          dst (default: {False})
+        recursive {bool} -- search templates recursively (default: {False})
+        excludes {list} -- skip paths matching one of the gitignore-style
+                           patterns (default: [])
+        includes {list} -- only yield templates of directory item matching
+                           one of the gitignore-style patterns (default: [])
+        stats {Stats} -- time 'skip_path' (default: None)
+
+    Yields:
+        tuple -- path to template and its destination (None for stdout)
+    """
+    if item.is_file():
+        start = time.perf_counter()
+        skip = skip_path(path=item, excludes=excludes)
+        if stats:
+            stats.add("skip_path", start)
+        if skip:
+            return
+        yield item, (None if not dst else
+                     dst if dst.suffix else
+                     dst.joinpath("/".join(item.parts[-1:])))
+        return
+
+    exclude_filter = compile_patterns(patterns=tuple(excludes or ()))
+    include_filter = compile_patterns(patterns=tuple(includes or ()))
+    if exclude_filter:
+        parts = item.parts[1:] if item.anchor else item.parts
+        for part in parts:
+            pattern = exclude_filter.match_name(name=part, is_dir=True)
+            if pattern is not None:
+                logger.debug(f"skip directory '{item}' because of "
+                             f"'{pattern}'")
+                return
+
+    prefix = "" if dst_dir else item.name
+    for template, relative in walk_templates(item=item,
+                                             recursive=recursive,
+                                             exclude_filter=exclude_filter,
+                                             include_filter=include_filter,
+                                             stats=stats):
+        dst_file = None
+        if dst:
+            dst_file = (dst if dst.suffix else
+                        dst.joinpath(prefix, relative))
+        yield template, dst_file
+
+
+def walk_templates(item: Path,
+                   recursive: bool = False,
+                   exclude_filter: PathFilter = None,
+                   include_filter: PathFilter = None,
+                   stats: Stats = None):
+    """yield each file of a directory with its path relative to the
+    directory
+
+    the walk uses the file type info of os.scandir, so no extra stat is
+    needed per entry. excluded directories are not descended. the order is
+    the same as with 'Path.glob'. symlinks to directories are not followed.
+
+    Arguments:
+        item {Path} -- directory containing templates
+
+    Keyword Arguments:
+        recursive {bool} -- search templates recursively (default: {False})
+        exclude_filter {PathFilter} -- skip excluded files and directories
+                                       (default: None)
+        include_filter {PathFilter} -- only yield files matching it
+                                       (default: None)
+        stats {Stats} -- time matching the patterns (default: None)
+
+    Yields:
+        tuple -- path to template and its relative path, separated by '/'
+    """
+    stack = [(str(item), "")]
+    while stack:
+        directory, relative = stack.pop()
+        try:
+            with os.scandir(directory) as scan:
+                entries = list(scan)
+        except OSError as e:
+            logger.debug(f"cannot read directory '{directory}'. "
+                         f"{e.strerror}")
+            continue
+
+        directories = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir and (not recursive or entry.is_symlink()):
+                continue
+            path = f"{relative}/{entry.name}" if relative else entry.name
+            if exclude_filter or (include_filter and not is_dir):
+                start = time.perf_counter()
+                pattern = None
+                if exclude_filter:
+                    pattern = exclude_filter.match(path=path, is_dir=is_dir)
+                included = (is_dir or not include_filter or
+                            include_filter.match(path=path) is not None)
+                if stats:
+                    stats.add("skip_path", start)
+                if pattern is not None:
+                    kind = "directory" if is_dir else "file"
+                    logger.debug(f"skip {kind} '{entry.path}' because of "
+                                 f"'{pattern}'")
+                    continue
+                if not included:
+                    logger.debug(f"skip file '{entry.path}' because it is "
+                                 "not included")
+                    continue
+            if is_dir:
+                directories.append((entry.path, path))
+            else:
+                yield Path(entry.path), path
+        stack.extend(reversed(directories))
+
+
+def render_parallel(pool,
+                    templates,
+                    jobs: int,
+                    append: bool = False,
+                    force: bool = False,
+                    substitutions: list or dict = None,
+                    strict: bool = False,
+                    cache: TemplateCache = None,
+                    manifest: Manifest = None,
+                    stats: Stats = None,
+                    if_changed: bool = False,
+                    counts: collections.Counter = None,
+                    writer: OutputWriter = None):
+    """render templates with a pool of workers
+
+    templates with their own destination file are rendered and saved by the
+    workers. output to stdout or appended to one file is written in the
+    order of the templates as soon as its template is rendered. errors are
+    logged in the same order.
+
+    Arguments:
+        pool {Executor} -- pool to submit the templates to
+        templates {iterable} -- (template, destination) tuples
+        jobs {int} -- number of workers
+
+    Keyword Arguments:
+        append {bool} -- if dst file exists, append template (default: {False})
+        force {bool} -- overwrite existing dst file (default: {False})
+        substitutions {list}/{dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+        strict {bool} -- stop processing if not all variables could
+                         be replaced (default: {False})
+        cache {TemplateCache} -- reuse compiled templates (default: None)
+        manifest {Manifest} -- record rendered templates (default: None)
+        stats {Stats} -- time the stages of each template (default: None)
+        if_changed {bool} -- overwrite an existing dst file, also without
+                             force, but only if its content differs
+                             (default: {False})
+        counts {Counter} -- count what happened to the destinations (see
+                            'write_content') (default: None)
+        writer {OutputWriter} -- save the destinations with this writer
+                                 (default: None)
+    """
+    def submit(template: Path, dst_file: Path):
+        if dst_file and not append:
+            return pool.submit(output_file,
+                               src=template,
+                               dst=dst_file,
+                               force=force,
+                               substitutions=substitutions,
+                               strict=strict,
+                               cache=cache,
+                               stats=stats,
+                               if_changed=if_changed,
+                               writer=writer)
+        if dst_file and template == dst_file:
+            raise SyntaxError("source and destination cannot be equal!")
+        return pool.submit(parse_template,
+                           template=template,
+                           substitutions=substitutions,
+                           strict=strict,
+                           cache=cache,
+                           stats=stats)
+
+    def collect(template: Path, dst_file: Path, future):
+        try:
+            if dst_file and not append:
+                status = future.result()
+            else:
+                content = future.result()
+                start = time.perf_counter()
+                status = write_content(content=content,
+                                       dst=dst_file,
+                                       append=append,
+                                       force=force,
+                                       writer=writer)
+                if stats:
+                    stats.add("write", start, template=template)
+                    stats.add_bytes(bytes_out=content_size(content=content))
+            if counts is not None and status:
+                counts[status] += 1
+            if manifest:
+                manifest.update(dst=dst_file)
+        except Exception as e:
+            logger.error(e)
+
+    # bounded window of pending templates, so rendered content does not
+    # pile up while an earlier template is still in progress
+    pending = collections.deque()
+    for template, dst_file in templates:
+        try:
+            pending.append((template, dst_file, submit(template, dst_file)))
+        except Exception as e:
+            logger.error(e)
+        if len(pending) >= jobs * 4:
+            collect(*pending.popleft())
+    while pending:
+        collect(*pending.popleft())
+
+
+def render_pipeline(templates,
+                    concurrency: int,
+                    append: bool = False,
+                    force: bool = False,
+                    substitutions: list or dict = None,
+                    strict: bool = False,
+                    cache: TemplateCache = None,
+                    manifest: Manifest = None,
+                    stats: Stats = None,
+                    if_changed: bool = False,
+                    counts: collections.Counter = None,
+                    writer: OutputWriter = None):
+    """render templates with an asyncio pipeline
+
+    finding the templates, reading, rendering and writing them overlap.
+    the templates are found in a thread of their own and passed through a
+    bounded queue to concurrency tasks, which run the blocking file
+    operations in a thread pool. templates with their own destination file
+    are saved by the tasks. output to stdout or appended to one file is
+    written by a single task in the order of the templates. at most
+    concurrency * 4 rendered templates wait for it.
+
+    Arguments:
+        templates {iterable} -- (template, destination) tuples
+        concurrency {int} -- number of templates in progress at a time
+
+    Keyword Arguments:
+        see 'render_parallel'
+    """
+    import asyncio
+    import concurrent.futures
+
+    done = object()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=concurrency * 2)
+        ordered = asyncio.Queue(maxsize=concurrency * 4)
+
+        async def find():
+            templates_iter = iter(templates)
+            try:
+                while True:
+                    item = await loop.run_in_executor(finder,
+                                                      next,
+                                                      templates_iter,
+                                                      done)
+                    if item is done:
+                        break
+                    template, dst_file = item
+                    slot = None
+                    if not dst_file or append:
+                        slot = loop.create_future()
+                        await ordered.put((template, dst_file, slot))
+                    await queue.put((template, dst_file, slot))
+            except Exception as e:
+                logger.error(e)
+            finally:
+                for _ in range(concurrency):
+                    await queue.put(done)
+                await ordered.put(done)
+
+        async def render():
+            while True:
+                item = await queue.get()
+                if item is done:
+                    return
+                template, dst_file, slot = item
+                try:
+                    if slot is None:
+                        status = await loop.run_in_executor(
+                            pool, functools.partial(
+                                output_file,
+                                src=template,
+                                dst=dst_file,
+                                force=force,
+                                substitutions=substitutions,
+                                strict=strict,
+                                cache=cache,
+                                stats=stats,
+                                if_changed=if_changed,
+                                writer=writer))
+                        if counts is not None and status:
+                            counts[status] += 1
+                        if manifest:
+                            manifest.update(dst=dst_file)
+                        continue
+                    if dst_file and template == dst_file:
+                        raise SyntaxError("source and destination cannot be "
+                                          "equal!")
+                    slot.set_result(await loop.run_in_executor(
+                        pool, functools.partial(parse_template,
+                                                template=template,
+                                                substitutions=substitutions,
+                                                strict=strict,
+                                                cache=cache,
+                                                stats=stats)))
+                except Exception as e:
+                    if slot is None:
+                        logger.error(e)
+                    else:
+                        slot.set_exception(e)
+
+        async def write():
+            while True:
+                item = await ordered.get()
+                if item is done:
+                    return
+                template, dst_file, slot = item
+                try:
+                    content = await slot
+                    start = time.perf_counter()
+                    status = await loop.run_in_executor(
+                        pool, functools.partial(write_content,
+                                                content=content,
+                                                dst=dst_file,
+                                                append=append,
+                                                force=force,
+                                                writer=writer))
+                    if stats:
+                        stats.add("write", start, template=template)
+                        stats.add_bytes(
+                            bytes_out=content_size(content=content))
+                    if counts is not None and status:
+                        counts[status] += 1
+                    if manifest:
+                        manifest.update(dst=dst_file)
+                except Exception as e:
+                    logger.error(e)
+
+        await asyncio.gather(find(),
+                             write(),
+                             *(render() for _ in range(concurrency)))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as finder, \
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=concurrency) as pool:
+        asyncio.run(run())
+
+
+def skip_path(path: str, excludes: list = []) -> bool:
+    """match a path against exclude patterns
+
+    Arguments:
+        path {str} -- path to a file
+
+    Keyword Arguments:
+        excludes {list} -- gitignore-style patterns (see 'PathFilter'),
+                           matched against each directory of path and the
+                           file (default: [])
+
+    Returns:
+        [bool] -- True if path or one of its directories is excluded else
+                  False
+    """
+    if not excludes:
+        return False
+    path_filter = compile_patterns(patterns=tuple(excludes))
+    path = Path(path)
+    parts = path.parts[1:] if path.anchor else path.parts
+    for index in range(len(parts)):
+        is_dir = index < len(parts) - 1
+        pattern = path_filter.match(path="/".join(parts[:index + 1]),
+                                    is_dir=is_dir)
+        if pattern is not None:
+            logger.debug(f"skip file '{path}' because of '{pattern}'")
+            return True
+    return False
+
+
+@functools.lru_cache(maxsize=32)
+def compile_patterns(patterns: tuple) -> PathFilter:
+    """compiled '--exclude' or '--include' patterns, reused for the same
+    patterns"""
+    return PathFilter(patterns=patterns)
+
+
+def glob_regex(pattern: str) -> str:
+    """translate a gitignore-style glob into a regex
+
+    Arguments:
+        pattern {str} -- glob without leading or trailing '/'
+
+    Returns:
+        str -- regex matching a whole name or relative path
+    """
+    regex, index = [], 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**", index):
+            start = index == 0 or pattern[index - 1] == "/"
+            end = index + 2 == len(pattern) or pattern[index + 2] == "/"
+            if start and end:
+                if index + 2 == len(pattern):
+                    regex.append(".*")  # 'dir/**': everything inside
+                else:
+                    regex.append("(?:.*/)?")  # '**/': any directories
+                    index += 1
+                index += 2
+                continue
+            regex.append("[^/]*")
+            index += 2
+            continue
+        if char == "*":
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", index + 2)
+            if end == -1:
+                regex.append(re.escape(char))
+            else:
+                chars = pattern[index + 1:end]
+                if chars[0] in "!^":
+                    chars = "^" + chars[1:]
+                regex.append("[{0}]".format(chars.replace("\\", "\\\\")))
+                index = end
+        else:
+            regex.append(re.escape(char))
+        index += 1
+    return "".join(regex)
+
+
+def output_file(src: str,
+                dst: str = None,
+                append: bool = False,
+                force: bool = False,
+                substitutions: list or dict = None,
+                strict: bool = False,
+                show_diff: bool = False,
+                cache: TemplateCache = None,
+                stream: bool = False,
+                use_mmap: bool = False,
+                stats: Stats = None,
+                if_changed: bool = False,
+                writer: OutputWriter = None) -> str:
+    """parse template and send it to stdout. if dst defined, save to file
+
+    Arguments:
+        src {str} -- path to template
+
+    Keyword Arguments:
+        dst {str} -- path to save (default: {None})
+        append {bool} -- if dst file exists, append template (default: {False})
+        force {bool} -- overwrite existing dst file (default: {False})
+        substitutions {list}/{dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+        strict {bool} -- stop processing if not all variables could
+                         be replaced (default: {False})
+        show_diff {bool} - show replaced files
+        cache {TemplateCache} -- reuse compiled templates (default: None)
+        stream {bool} -- read and write the template chunk by chunk
+                         (default: {False})
+        use_mmap {bool} -- copy the text between the placeholders from a
+                           memory-mapped utf-8 template (default: {False})
+        stats {Stats} -- time the stages of the template (default: None)
+        if_changed {bool} -- overwrite an existing dst file, also without
+                             force, but only if its content differs
+                             (default: {False})
+        writer {OutputWriter} -- save dst with this writer (default: None)
+
+    Raises:
+        SyntaxError: source and destination is equal
+        FileNotFoundError: template file not found
+        Exception: cannot write file
+
+    Returns:
+        str -- what happened to dst (see 'write_content')
+    """
+
+    if dst and src == dst:
+        raise SyntaxError("source and destination cannot be equal!")
+
+    if (writer and (writer.store or writer.copy_static) and dst and
+            not append):
+        start = time.perf_counter()
+        status = writer.write_static(template=src,
+                                     dst=dst,
+                                     force=force,
+                                     if_changed=if_changed)
+        if status:
+            if stats:
+                stats.add("write", start, template=src)
+            return status
+
+    if stats and (stream or use_mmap):
+        # the template is rendered while it is written
+        start = time.perf_counter()
+        status = output_file(src=src,
+                             dst=dst,
+                             append=append,
+                             force=force,
+                             substitutions=substitutions,
+                             strict=strict,
+                             stream=stream,
+                             use_mmap=use_mmap,
+                             if_changed=if_changed,
+                             writer=writer)
+        stats.add("write", start, template=src)
+        stats.add_bytes(bytes_in=os.path.getsize(src))
+        if dst and not append:
+            stats.add_bytes(bytes_out=os.path.getsize(dst))
+        return status
+
+    if stream:
+        if not os.path.isfile(src):
+            raise FileNotFoundError(f"template '{src}' not found")
+        if strict:
+            check_placeholders(
+                placeholders=stream_placeholders(template=src),
+                substitutions=substitutions)
+        return write_content(
+            content=lambda output: stream_template(
+                template=src,
+                output=output,
+                substitutions=substitutions),
+            dst=dst,
+            append=append,
+            force=force,
+            if_changed=if_changed,
+            writer=writer)
+
+    if use_mmap:
+        if not os.path.isfile(src):
+            raise FileNotFoundError(f"template '{src}' not found")
+        if strict:
+            check_placeholders(
+                placeholders=mapped_placeholders(template=src),
+                substitutions=substitutions)
+        return write_content(
+            content=lambda output: map_template(
+                template=src,
+                output=output,
+                substitutions=substitutions),
+            dst=dst,
+            append=append,
+            force=force,
+            if_changed=if_changed,
+            writer=writer)
+
+    content = parse_template(template=src,
+                             substitutions=substitutions,
+                             strict=strict,
+                             show_diff=show_diff,
+                             cache=cache,
+                             stats=stats)
+    start = time.perf_counter()
+    status = write_content(content=content,
+                           dst=dst,
+                           append=append,
+                           force=force,
+                           if_changed=if_changed,
+                           writer=writer)
+    if stats:
+        stats.add("write", start, template=src)
+        stats.add_bytes(bytes_out=content_size(content=content))
+    return status
+
+
+def write_content(content: str or callable,
+                  dst: str = None,
+                  append: bool = False,
+                  force: bool = False,
+                  if_changed: bool = False,
+                  writer: OutputWriter = None) -> str:
+    """send content to stdout. if dst defined, save to file
+
+    Arguments:
+        content {str} or {callable} -- rendered template or a function
+                                       writing the rendered template to the
+                                       stream it gets passed
+
+    Keyword Arguments:
+        dst {str} -- path to save (default: {None})
+        append {bool} -- if dst file exists, append content (default: {False})
+        force {bool} -- overwrite existing dst file (default: {False})
+        if_changed {bool} -- overwrite an existing dst file, also without
+                             force, but only if its content differs
+                             (default: {False})
+        writer {OutputWriter} -- save dst with this writer (default: None)
+
+    Raises:
+        Exception: cannot write file
+
+    Returns:
+        str -- 'saved', 'appended', 'unchanged' or 'skipped'. None for
+               stdout
+    """
+    if not dst:
+        sys.stdout.flush()
+        if callable(content):
+            content(sys.stdout)
+        else:
+            sys.stdout.write(f"{content}\n")
+        return None
+
+    if writer:
+        return writer.write(content=content,
+                            dst=dst,
+                            append=append,
+                            force=force,
+                            if_changed=if_changed)
+
+    if os.path.exists(dst) and not append and not force and not if_changed:
+        logger.warning(f"file '{dst}' already exists")
+        return "skipped"
+
+    try:
+        dst_parent = Path(dst).parent
+        dst_parent.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        raise OSError(
+                f"cannot create directory '{dst_parent}'. {e.strerror}")
+
+    try:
+        linked = linked_file(path_stat=os.lstat(dst))
+    except FileNotFoundError:
+        linked = False
+    if linked and (force or not append):
+        # writing into a link would change the files linked to it as well
+        try:
+            if not replace_changed(content=content,
+                                   dst=dst,
+                                   compare=if_changed,
+                                   linked=True):
+                logger.debug(f"template unchanged in '{dst}'")
+                return "unchanged"
+        except Exception as e:
+            raise Exception(f"cannot write file '{dst}'. {str(e)}")
+        logger.info(f"save template to '{dst}'")
+        return "saved"
+
+    if if_changed and not append and os.path.isfile(dst):
+        try:
+            if not replace_changed(content=content, dst=dst):
+                logger.debug(f"template unchanged in '{dst}'")
+                return "unchanged"
+        except Exception as e:
+            raise Exception(f"cannot write file '{dst}'. {str(e)}")
+        logger.info(f"save template to '{dst}'")
+        return "saved"
+
+    try:
+        mode = f"{'append' if os.path.exists(dst) and append else 'save'}"
+        with open(str(dst), "a" if append and not force else "w") as output:
+            if callable(content):
+                content(output)
+            else:
+                output.write(f"{content}\n")
+        logger.info(f"{mode} "
+                    f"template to '{dst}'")
+    except Exception as e:
+        raise Exception(f"cannot write file '{dst}'. {str(e)}")
+    return "appended" if mode == "append" else "saved"
+
+
+def replace_changed(content: str or callable,
+                    dst: str,
+                    compare: bool = True,
+                    linked: bool = False) -> bool:
+    """replace an existing file only if the content differs
+
+    a rendered template is compared with the file chunk by chunk after
+    comparing the size. a function writing the template is run with a
+    temporary file next to dst, which replaces dst if both files differ.
+
+    Arguments:
+        content {str} or {callable} -- see 'write_content'
+        dst {str} -- path to existing file
+
+    Keyword Arguments:
+        compare {bool} -- only replace dst if the content differs
+                          (default: {True})
+        linked {bool} -- dst is a link (see 'linked_file'). it is replaced
+                         by a new file with the default mode instead of
+                         written into (default: {False})
+
+    Returns:
+        bool -- True if dst was replaced
+    """
+    if not callable(content) and not linked:
+        data = f"{content}\n".encode(text_encoding())
+        if compare and same_content(path=dst, data=data):
+            return False
+        with open(str(dst), "w") as output:
+            output.write(f"{content}\n")
+        return True
+
+    import shutil
+
+    tmp_path = Path(temp_file(dst=dst, create=new_file))
+    try:
+        with open(tmp_path, "w") as output:
+            if callable(content):
+                content(output)
+            else:
+                output.write(f"{content}\n")
+        if compare and os.path.isfile(dst) and \
+                same_files(path=tmp_path, other=dst):
+            return False
+        if not linked:
+            shutil.copymode(str(dst), str(tmp_path))
+        os.replace(tmp_path, dst)
+        return True
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def temp_file(dst: str, create: callable = None) -> str:
+    """create a temporary file next to dst, which then replaces dst. its
+    name is made unique by 'tempfile.mkstemp', so it cannot be guessed
+    beforehand and no existing file or link is ever written to
+
+    Arguments:
+        dst {str} -- path the temporary file replaces
+
+    Keyword Arguments:
+        create {callable} -- create the file at the path passed to it instead
+                             of an empty file with mode 0o600. it has to
+                             raise FileExistsError if the path exists, like
+                             'os.link', 'os.symlink' or 'new_file'
+                             (default: {None})
+
+    Returns:
+        str -- path to the temporary file
+    """
+    import tempfile
+
+    directory, name = os.path.split(str(dst))
+    while True:
+        fd, path = tempfile.mkstemp(prefix=f".{name}.",
+                                    suffix=".tmp",
+                                    dir=directory or os.curdir)
+        os.close(fd)
+        if create is None:
+            return path
+        os.remove(path)
+        try:
+            create(path)
+        except FileExistsError:
+            continue  # taken in the meantime, try another name
+        except BaseException:
+            if os.path.lexists(path):
+                os.remove(path)
+            raise
+        return path
+
+
+def new_file(path: str):
+    """create an empty file with the default mode (0o666 without the bits of
+    the umask)
+
+    Raises:
+        FileExistsError: path already exists, also as a link
+    """
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+
+
+def linked_file(path_stat: os.stat_result) -> bool:
+    """check if writing into an existing file would change other paths as
+    well: it is a symbolic link or has more than one hard link (e.g. to a
+    blob of a 'ContentStore')
+
+    Arguments:
+        path_stat {stat_result} -- lstat of the file
+    """
+    import stat
+
+    return stat.S_ISLNK(path_stat.st_mode) or path_stat.st_nlink > 1
+
+
+def same_content(path: str, data: bytes) -> bool:
+    """compare the size and then the content of a file chunk by chunk with
+    data"""
+    if os.path.getsize(path) != len(data):
+        return False
+    view = memoryview(data)
+    with open(path, "rb") as existing:
+        for offset in range(0, len(data), CHUNK_SIZE):
+            if existing.read(CHUNK_SIZE) != view[offset:offset + CHUNK_SIZE]:
+                return False
+    return True
+
+
+def same_files(path: str, other: str) -> bool:
+    """compare the size and then the content of two files chunk by chunk"""
+    if os.path.getsize(path) != os.path.getsize(other):
+        return False
+    with open(path, "rb") as first, open(other, "rb") as second:
+        while True:
+            chunk = first.read(CHUNK_SIZE)
+            if chunk != second.read(CHUNK_SIZE):
+                return False
+            if not chunk:
+                return True
+
+
+def text_encoding() -> str:
+    """encoding of files opened in text mode"""
+    import locale
+    return locale.getpreferredencoding(False)
+
+
+def static_template(template: str) -> bool:
+    """check if a template can be copied as it is, without decoding it: it
+    is binary (a NUL byte in the first BINARY_CHECK_SIZE bytes) or has no
+    '$'
+
+    Arguments:
+        template {str} -- path to template
+
+    Returns:
+        bool -- True if the template has no placeholders
+    """
+    with open(template, "rb") as data:
+        chunk = data.read(CHUNK_SIZE)
+        if b"\0" in chunk[:BINARY_CHECK_SIZE]:
+            return True
+        while chunk:
+            if b"$" in chunk:
+                return False
+            chunk = data.read(CHUNK_SIZE)
+    return True
+
+
+def parse_template(template: str,
+                   substitutions: list or dict = None,
+                   strict: bool = False,
+                   show_diff: bool = False,
+                   cache: TemplateCache = None,
+                   stats: Stats = None) -> str:
+    """replace $VAR / ${VAR} in a file
+
+    Arguments:
+        templates {str} -- path to templates
+
+    Keyword Arguments:
+        substitutions {list} or {dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+        strict {bool} -- raise an LookupError if not all variables could
+                         be replaced (default: {False})
+        show_diff {bool} - show replaced files
+        cache {TemplateCache} -- reuse compiled templates (default: None)
+        stats {Stats} -- time the stages of the template (default: None)
+
+    Raises:
+        FileNotFoundError: template file not found
+        LookupError: 'strict' option set and not all variables replaced
+    """
+    if not os.path.isfile(template):
+        raise FileNotFoundError(f"template '{template}' not found")
+
+    try:
+        start = time.perf_counter()
+        if cache:
+            parts, original_content = cache.load(template=template)
+        else:
+            with open(file=template, mode="r") as data:
+                original_content = data.read()
+            parts = compile_template(text=original_content)
+        if stats:
+            stats.add("read", start, template=template)
+            stats.add_bytes(bytes_in=os.path.getsize(template))
+
+        logger.debug(f"parse template '{template}'")
+
+        start = time.perf_counter()
+        index = index_placeholders(parts=parts)
+        found_variable_len = sum(len(entries)
+                                 for name, entries in index.items() if name)
+        if logger.isEnabledFor(logging.DEBUG):
+            found_variables = [raw for _, raw in sorted(
+                entry for name, entries in index.items() if name
+                for entry in entries)]
+            found_variable_joined = "'{0}'".format(
+                                        "', '".join(found_variables))
+            logger.debug(
+                f"found {found_variable_len} variable"
+                f"{'s' if found_variable_len != 1 else ''}"
+                f"{'!' if found_variable_len == 0 else ': '}"
+                f"{'' if not found_variable_len else found_variable_joined}")
+        unprocessed_vars = unresolved_placeholders(
+                               index=index,
+                               substitutions=substitutions)
+        if stats:
+            stats.add("index", start, template=template)
+
+        start = time.perf_counter()
+        content = render_template(parts=parts, substitutions=substitutions)
+        if stats:
+            stats.add("substitute", start, template=template)
+            stats.count_placeholders(index=index, substitutions=substitutions)
+
+        if show_diff:
+            if found_variable_len == len(unprocessed_vars):
+                logger.warning(
+                    f"no lines in file '{template}' replaced!")
+            else:
+                logger.info(f"replaced lines in file '{template}'")
+                if original_content is None:
+                    original_content = template_source(parts=parts)
+                start = time.perf_counter()
+                print_placeholder_diff(text=original_content,
+                                       index=index,
+                                       substitutions=substitutions)
+                if stats:
+                    stats.add("diff", start, template=template)
+
+        if strict and unprocessed_vars:
+            msg = replaced_message(found_variable_len=found_variable_len,
+                                   unprocessed_vars=unprocessed_vars)
+            raise LookupError(f"you set option '--strict' and {msg}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                replaced_message(found_variable_len=found_variable_len,
+                                 unprocessed_vars=unprocessed_vars))
+
+        return content
+    except Exception:
+        raise
+
+
+def stream_template(template: str,
+                    output,
+                    substitutions: list or dict = None,
+                    chunk_size: int = CHUNK_SIZE):
+    """replace $VAR / ${VAR} in a file chunk by chunk and write the result
+    to output. memory usage does not depend on the size of the template.
+
+    Arguments:
+        template {str} -- path to template
+        output {file} -- writable text stream
+
+    Keyword Arguments:
+        substitutions {list} or {dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+        chunk_size {int} -- number of characters to read at once
+                            (default: {CHUNK_SIZE})
+    """
+    logger.debug(f"stream template '{template}'")
+    layers = flatten_substitutions(substitutions=substitutions)
+    with open(file=template, mode="r") as data:
+        for parts in iter_template_chunks(data=data, chunk_size=chunk_size):
+            output.write(render_template(parts=parts, substitutions=layers))
+    output.write("\n")
+
+
+def map_template(template: str,
+                 output,
+                 substitutions: list or dict = None):
+    """replace $VAR / ${VAR} in a memory-mapped file. the text between the
+    placeholders is copied from the mapping without decoding it, so the
+    template must be encoded in utf-8
+
+    Arguments:
+        template {str} -- path to template
+        output {file} -- writable text stream
+
+    Keyword Arguments:
+        substitutions {list} or {dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+    """
+    import mmap
+
+    logger.debug(f"map template '{template}'")
+    layers = flatten_substitutions(substitutions=substitutions)
+    if hasattr(output, "buffer"):
+        output.flush()
+        write = output.buffer.write
+    else:
+        def write(data):
+            output.write(bytes(data).decode("utf-8"))
+
+    with open(file=template, mode="rb") as data:
+        if not os.fstat(data.fileno()).st_size:
+            write(b"\n")
+            return
+        with mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            start = 0
+            for match in bytes_placeholder_pattern.finditer(mapped):
+                name = match.group('named') or match.group('braced')
+                if name is None and match.group('escaped') is None:
+                    continue  # a lone '$' stays part of the literal text
+                if name is None:
+                    value = b"$"
+                else:
+                    name = name.decode("ascii")
+                    for layer in layers:
+                        if name in layer:
+                            value = str(layer[name]).encode("utf-8")
+                            break
+                    else:
+                        continue  # placeholder stays part of the literal text
+                write(view[start:match.start()])
+                write(value)
+                start = match.end()
+            write(view[start:])
+            view.release()
+    write(b"\n")
+
+
+def mapped_placeholders(template: str):
+    """yield (name, raw) of each placeholder in a memory-mapped file
+
+    Arguments:
+        template {str} -- path to template
+    """
+    import mmap
+
+    with open(file=template, mode="rb") as data:
+        if not os.fstat(data.fileno()).st_size:
+            return
+        with mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for match in bytes_placeholder_pattern.finditer(mapped):
+                name = match.group('named') or match.group('braced')
+                if name:
+                    yield name.decode("ascii"), match.group().decode("ascii")
+
+
+def stream_placeholders(template: str, chunk_size: int = CHUNK_SIZE):
+    """yield (name, raw) of each placeholder in a file read chunk by chunk
+
+    Arguments:
+        template {str} -- path to template
+
+    Keyword Arguments:
+        chunk_size {int} -- number of characters to read at once
+                            (default: {CHUNK_SIZE})
+    """
+    with open(file=template, mode="r") as data:
+        for parts in iter_template_chunks(data=data, chunk_size=chunk_size):
+            for part in parts:
+                if not isinstance(part, str) and part[0]:
+                    yield part
+
+
+def check_placeholders(placeholders, substitutions: list or dict = None):
+    """check if all placeholders can be replaced
 
+    Arguments:
+        placeholders {iterable} -- (name, raw) of each placeholder
 
-def setup_logger(debug=False):
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG if debug else logging.INFO)
+    Keyword Arguments:
+        substitutions {list} or {dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
 
-    stdout_handler = ColorStreamHandler(sys.stdout)
-    stderr_handler = ColorStreamHandler(sys.stderr)
+    Raises:
+        LookupError: not all variables can be replaced
+    """
+    layers = flatten_substitutions(substitutions=substitutions)
+    found_variable_len, unprocessed_vars = 0, []
+    for name, raw in placeholders:
+        found_variable_len += 1
+        if not any(name in layer for layer in layers):
+            unprocessed_vars.append(raw)
+    if unprocessed_vars:
+        msg = replaced_message(found_variable_len=found_variable_len,
+                               unprocessed_vars=unprocessed_vars)
+        raise LookupError(f"you set option '--strict' and {msg}")
 
-    root_logger.addHandler(stdout_handler)
-    root_logger.addHandler(stderr_handler)
 
+def iter_template_chunks(data, chunk_size: int = CHUNK_SIZE):
+    """read a template chunk by chunk and yield each compiled chunk.
+    a placeholder at the end of a chunk is kept back until it is complete
 
-def process(src: list,
-            dst: str = None,
-            show_diff: bool = False,
-            recursive: bool = False,
-            key_value_list: list = [],
-            input_files: list = [],
-            file_delimiter: str = '=',
-            no_os_env: bool = True,
-            strict: bool = False,
-            append: bool = False,
-            force: bool = False,
-            excludes: list = []):
+    Arguments:
+        data {file} -- readable text stream
 
-    dst = Path(dst) if dst else None
+    Keyword Arguments:
+        chunk_size {int} -- number of characters to read at once
+                            (default: {CHUNK_SIZE})
 
-    parsed_key_value_list, parsed_files_vars, os_env = {}, {}, {}
+    Yields:
+        list -- compiled part of the template (see 'compile_template')
+    """
+    buffer = ""
+    while True:
+        chunk = data.read(chunk_size)
+        if not chunk:
+            if buffer:
+                yield compile_template(text=buffer)
+            return
+        buffer += chunk
+        cut = len(buffer)
+        last = buffer.rfind('$')
+        if last != -1:
+            first = last
+            while first and buffer[first - 1] == '$':
+                first -= 1
+            # an even run of '$' are escapes, otherwise the last '$' starts a
+            # placeholder which may continue in the next chunk
+            if (last - first) % 2 == 0 and incomplete_pattern.match(buffer,
+                                                                   last):
+                cut = last
+        if cut:
+            yield compile_template(text=buffer[:cut])
+            buffer = buffer[cut:]
 
-    if key_value_list:
-        parsed_key_value_list = read_key_value_list(
-                                    key_value_list=key_value_list,
-                                    delimiter='=')
-    if input_files:
-        for input_file in input_files:
-            parsed_files_vars.update(read_file(
-                path=input_file,
-                delimiter=file_delimiter)
-            )
-    if not no_os_env:
-        os_env_vars = os.environ
 
-    substitutions = [
-        parsed_key_value_list,
-        parsed_files_vars,
-        os_env_vars,
-    ]
+def replaced_message(found_variable_len: int, unprocessed_vars: list) -> str:
+    """summary of replaced and remaining variables"""
+    unprocessed_vars_len = len(unprocessed_vars)
+    unprocessed_vars_joined = "'{0}'".format("', '".join(unprocessed_vars))
+    return (
+        f"{found_variable_len - unprocessed_vars_len}/{found_variable_len}"
+        " variable"
+        f"{'s' if found_variable_len - unprocessed_vars_len != 1 else ''}"
+        f" replaced{'!' if not unprocessed_vars_len else '.'}"
+        f"{'' if not unprocessed_vars_len else  'Remaining variables: '}"
+        f"{'' if not unprocessed_vars_len else unprocessed_vars_joined}"
+    )
 
-    for item in src:
-        dst_dir = True if item.endswith("/") else False
-        item = Path(item).expanduser()
 
-        if not item.exists():
-            raise LookupError(f"'{str(item)}' not found")
+def content_size(content: str) -> int:
+    """number of bytes written for a rendered template"""
+    return len(content.encode("utf-8", "surrogateescape")) + 1
 
-        if (dst and
-           (not dst.is_dir() and not dst.is_file()) and
-           (item.is_dir() or len(src) > 1) and
-           not append):
-            raise SyntaxError("you cannot add multiple templates and only one "
-                              "destination file without parameter "
-                              "'-a|--append'")
 
-        try:
-            if item.is_file():
-                dst_file = (None if not dst else
-                            dst if dst.suffix else
-                            dst.joinpath("/".join(item.parts[-1:])))
-                if skip_path(path=item, excludes=excludes):
-                    continue
-                output_file(src=item,
-                            dst=dst_file,
-                            append=append,
-                            force=force,
-                            substitutions=substitutions,
-                            strict=strict,
-                            show_diff=show_diff)
-                continue
+def compile_template(text: str) -> list:
+    """split a template into literal text and placeholders
 
-            item_parts = len(item.parts) if dst_dir else len(item.parts) - 1
-            for i in item.glob('**/*' if recursive else '*'):
-                if i.is_dir():
-                    continue
-                if skip_path(path=i, excludes=excludes):
-                    continue
-                dst_file = None
-                if dst:
-                    parts = i.parts[item_parts:]
-                    dst_file = dst.joinpath("/".join(parts))
-                    dst_file = dst_file if not dst.suffix else dst
-                output_file(src=i,
-                            dst=dst_file,
-                            append=append,
-                            force=force,
-                            substitutions=substitutions,
-                            strict=strict,
-                            show_diff=show_diff)
+    Arguments:
+        text {str} -- content of the template
 
-        except Exception as e:
-            logging.error(e)
+    Returns:
+        list -- literal strings and a (name, raw) tuple for each placeholder.
+                a '$$' escape is stored as (None, '$$')
+    """
+    parts, start = [], 0
+    for match in placeholder_pattern.finditer(text):
+        name = match.group('named') or match.group('braced')
+        if name is None and match.group('escaped') is None:
+            continue  # a lone '$' stays part of the literal text
+        if match.start() > start:
+            parts.append(text[start:match.start()])
+        parts.append((name, match.group()))
+        start = match.end()
+    if start < len(text):
+        parts.append(text[start:])
+    return parts
 
 
-def skip_path(path: str, excludes: list = []) -> bool:
-    """search in path a string
+def index_placeholders(parts: list) -> dict:
+    """collect the placeholders of a compiled template
 
     Arguments:
-        path {str} -- string to be searched
-
-    Keyword Arguments:
-        excludes {list} -- list with string to compare with path (default: [])
+        parts {list} -- compiled template (see 'compile_template')
 
     Returns:
-        [bool] -- True if path contains entry of excludes else False
+        dict -- {name: [(offset, raw), ...]} with the offset in the template
+                of each occurrence. '$$' escapes are stored under None
     """
-    if not excludes:
-        return False
-    path = Path(path)
-    # exclude is in file extension or in path
-    excluded = [entry for entry in excludes if
-                entry in path.parts or entry.lstrip('*') == path.suffix]
-    if excluded:
-        logging.debug(f"skip file '{path}' because of "
-                      "'{VARS}'".format(VARS="', '".join(excluded)))
-        return True
-    return False
+    index, offset = {}, 0
+    for part in parts:
+        if isinstance(part, str):
+            offset += len(part)
+            continue
+        name, raw = part
+        index.setdefault(name, []).append((offset, raw))
+        offset += len(raw)
+    return index
 
 
-def output_file(src: str,
-                dst: str = None,
-                append: bool = False,
-                force: bool = False,
-                substitutions: list or dict = None,
-                strict: bool = False,
-                show_diff: bool = False):
-    """parse template and send it to stdout. if dst defined, save to file
+def unresolved_placeholders(index: dict,
+                            substitutions: list or dict = None) -> list:
+    """placeholders of a template without a value
 
     Arguments:
-        src {str} -- path to template
+        index {dict} -- placeholders of the template (see
+                        'index_placeholders')
 
     Keyword Arguments:
-        dst {str} -- path to save (default: {None})
-        append {bool} -- if dst file exists, append template (default: {False})
-        force {bool} -- overwrite existing dst file (default: {False})
-        substitutions {list}/{dict} -- dict or list of dicts with keys that
+        substitutions {list} or {dict} -- dict or list of dicts with keys that
                                        match the placeholders in the template
                                        (default: None)
-        strict {bool} -- stop processing if not all variables could
-                         be replaced (default: {False})
-        show_diff {bool} - show replaced files
 
-    Raises:
-        SyntaxError: source and destination is equal
-        Exception: cannot write file
+    Returns:
+        list -- raw text of each placeholder without a value, in the order of
+                the template
     """
+    layers = flatten_substitutions(substitutions=substitutions)
+    unresolved = []
+    for name, entries in index.items():
+        if name is None or any(name in layer for layer in layers):
+            continue
+        unresolved.extend(entries)
+    return [raw for _, raw in sorted(unresolved)]
 
-    if dst and src == dst:
-        raise SyntaxError("source and destination cannot be equal!")
-
-    content = parse_template(template=src,
-                             substitutions=substitutions,
-                             strict=strict,
-                             show_diff=show_diff)
-    if not dst:
-        sys.stdout.flush()
-        sys.stdout.write(f"{content}\n")
-        return
-
-    if os.path.exists(dst) and not append and not force:
-        logging.warning(f"file '{dst}' already exists")
-        return
-
-    try:
-        dst_parent = Path(dst).parent
-        dst_parent.mkdir(parents=True, exist_ok=True)
-    except Exception as e:
-        raise OSError(
-                f"cannot create directory '{dst_parent}'. {e.strerror}")
-
-    try:
-        mode = f"{'append' if os.path.exists(dst) and append else 'save'}"
-        with open(str(dst), "a" if append and not force else "w") as output:
-            output.write(f"{content}\n")
-        logging.info(f"{mode} "
-                     f"template to '{dst}'")
-    except Exception as e:
-        raise Exception(f"cannot write file '{dst}'. {str(e)}")
 
+def template_source(parts: list) -> str:
+    """return the original text of a compiled template"""
+    return "".join(part if isinstance(part, str) else part[1]
+                   for part in parts)
 
-def parse_template(template: str,
-                   substitutions: list or dict = None,
-                   strict: bool = False,
-                   show_diff: bool = False) -> str:
-    """replace $VAR / ${VAR} in a file
 
-    Arguments:
-        templates {str} -- path to templates
+def flatten_substitutions(substitutions: list or dict = None) -> list:
+    """turn a dict or a (nested) list of dicts into a list of lookup layers
 
     Keyword Arguments:
         substitutions {list} or {dict} -- dict or list of dicts with keys that
                                        match the placeholders in the template
                                        (default: None)
-        strict {bool} -- raise an LookupError if not all variables could
-                         be replaced (default: {False})
-        show_diff {bool} - show replaced files
 
     Raises:
-        FileNotFoundError: template file not found
-        LookupError: 'strict' option set and not all variables replaced
+        AttributeError: substitutions is not a dict or a list of dicts
+
+    Returns:
+        list -- non empty dicts, ordered by precedence
     """
-    def substitute_vars(content: str, var_list: list or dict) -> str:
-        if not var_list:
-            return content
-        if isinstance(var_list, dict):
-            return Template(content).safe_substitute(item)
-        if not isinstance(var_list, list):
+    if not substitutions:
+        return []
+    if not isinstance(substitutions, list):
+        if not hasattr(substitutions, "keys"):
             raise AttributeError(
                     "you only can pass a {dict} or a list of dicts")
-        for item in var_list:
-            if not item:
-                continue
-            if isinstance(item, list):
-                substitute_vars(content=content, var_list=item)
-                continue
-            content = Template(content).safe_substitute(item)
-        return content
+        return [substitutions]
+    layers = []
+    for item in substitutions:
+        layers.extend(flatten_substitutions(substitutions=item))
+    return layers
 
-    if not os.path.isfile(template):
-        raise FileNotFoundError(f"template '{template}' not found")
 
-    try:
-        with open(file=template, mode="r") as data:
-            original_content = data.read()
-
-        logging.debug(f"parse template '{template}'")
-
-        found_variables = find_vars(text=original_content)
-        found_variable_len = len(found_variables)
-        found_variable_joined = "'{0}'".format("', '".join(found_variables))
-
-        logging.debug(
-            f"found {found_variable_len} variable"
-            f"{'s' if found_variable_len != 1 else ''}"
-            f"{'!' if found_variable_len == 0 else ': '}"
-            f"{'' if not found_variable_len else found_variable_joined}")
-
-        content = substitute_vars(content=original_content,
-                                  var_list=substitutions)
-
-        unprocessed_vars = find_vars(text=content)
-        unprocessed_vars_len = len(unprocessed_vars)
-        unprocessed_vars_joined = "'{0}'".format("', '".join(unprocessed_vars))
-        msg = (
-            f"{found_variable_len - unprocessed_vars_len}/{found_variable_len}"
-            " variable"
-            f"{'s' if found_variable_len - unprocessed_vars_len != 1 else ''}"
-            f" replaced{'!' if not unprocessed_vars_len else '.'}"
-            f"{'' if not unprocessed_vars_len else  'Remaining variables: '}"
-            f"{'' if not unprocessed_vars_len else unprocessed_vars_joined}"
-        )
+def render_template(parts: list, substitutions: list or dict = None) -> str:
+    """replace the placeholders of a compiled template in a single pass
 
-        if show_diff:
-            if (not found_variable_len or
-               found_variable_len == unprocessed_vars_len):
-                logging.warning(
-                    f"no lines in file '{template}' replaced!")
-            else:
-                logging.info(f"replaced lines in file '{template}'")
-                print_diff(
-                    template_name=str(template),
-                    original_content=original_content,
-                    new_content=content)
+    every placeholder is resolved against the first layer containing its
+    name. placeholders without a value are left as they are.
 
-        if strict and unprocessed_vars:
-            raise LookupError(f"you set option '--strict' and {msg}")
-        logging.debug(msg)
+    Arguments:
+        parts {list} -- compiled template (see 'compile_template')
 
-        return content
-    except Exception:
-        raise
+    Keyword Arguments:
+        substitutions {list} or {dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+
+    Returns:
+        str -- rendered content
+    """
+    layers = flatten_substitutions(substitutions=substitutions)
+    content = []
+    for part in parts:
+        if isinstance(part, str):
+            content.append(part)
+            continue
+        name, raw = part
+        if name is None:
+            content.append('$')
+            continue
+        for layer in layers:
+            if name in layer:
+                content.append(str(layer[name]))
+                break
+        else:
+            content.append(raw)
+    return "".join(content)
 
 
 def print_diff(template_name: str, original_content: str, new_content: str):
-    """print replaced lines"""
+    """print replaced lines
+
+    '--diff' uses 'print_placeholder_diff'. this compares two complete
+    contents with difflib and is kept as a public helper for contents
+    without a placeholder index.
+    """
+    import difflib
+
     DEFAULT = '\x1b[0m'
     GREEN = '\x1b[32m'
     RED = '\x1b[31m'
@@ -547,6 +4480,81 @@ def print_diff(template_name: str, original_content: str, new_content: str):
             sys.stdout.write(f"{color}{diff}{DEFAULT}{msg[0]}\n")
 
 
+def print_placeholder_diff(text: str,
+                           index: dict,
+                           substitutions: list or dict = None):
+    """print replaced lines without comparing the whole content
+
+    only the lines containing a placeholder with a value (or a '$$'
+    escape) can change. each of them is found with the offsets of the
+    placeholder index and rendered again. consecutive changed lines are
+    printed as one block, first the original and then the new lines, and
+    all of it is written at once.
+
+    Arguments:
+        text {str} -- content of the template
+        index {dict} -- placeholders of the template (see
+                        'index_placeholders')
+
+    Keyword Arguments:
+        substitutions {list} or {dict} -- dict or list of dicts with keys that
+                                       match the placeholders in the template
+                                       (default: None)
+    """
+    DEFAULT = '\x1b[0m'
+    GREEN = '\x1b[32m'
+    RED = '\x1b[31m'
+
+    layers = flatten_substitutions(substitutions=substitutions)
+    values = {None: '$'}
+    for name in index:
+        if name is None:
+            continue
+        for layer in layers:
+            if name in layer:
+                values[name] = str(layer[name])
+                break
+    replacements = sorted((offset, len(raw), values[name])
+                          for name, entries in index.items()
+                          if name in values
+                          for offset, raw in entries)
+
+    changed = []  # (start, end, new line) of each changed line
+
+    def add_line(start: int, end: int, pieces: list, position: int):
+        pieces.append(text[position:end])
+        line = "".join(pieces)
+        if line != text[start:end]:
+            changed.append((start, end, line))
+
+    start = end = -1
+    for offset, length, value in replacements:
+        if offset > end:
+            if start >= 0:
+                add_line(start, end, pieces, position)
+            start = text.rfind("\n", 0, offset) + 1
+            end = text.find("\n", offset)
+            if end < 0:
+                end = len(text)
+            pieces, position = [], start
+        pieces.append(text[position:offset])
+        pieces.append(value)
+        position = offset + length
+    if start >= 0:
+        add_line(start, end, pieces, position)
+
+    output, removed, added = [], [], []
+    for nr, (start, end, line) in enumerate(changed):
+        removed.append(f"{RED}-{DEFAULT}{text[start:end]}\n")
+        added.extend(f"{GREEN}+{DEFAULT}{new_line}\n"
+                     for new_line in line.split("\n"))
+        if nr + 1 == len(changed) or changed[nr + 1][0] != end + 1:
+            output.extend(removed)
+            output.extend(added)
+            removed, added = [], []
+    sys.stdout.write("".join(output))
+
+
 def read_key_value_list(key_value_list: list,
                         delimiter: str = '=') -> dict:
     """extract key=value from string in a list of strings
@@ -567,16 +4575,16 @@ def read_key_value_list(key_value_list: list,
     key_value_dict = {}
     for key_value in key_value_list:
         if delimiter not in key_value:
-            logging.warning(f"'{key_value}' has no valid delimiter "
-                            f"({delimiter})")
+            logger.warning(f"'{key_value}' has no valid delimiter "
+                           f"({delimiter})")
             continue
 
         key, value = key_value.split(delimiter, 1)
         if not key:
-            logging.warning(f"cannot get key from '{key_value}'")
+            logger.warning(f"cannot get key from '{key_value}'")
             continue
         if not value:
-            logging.warning(f"cannot get value from '{key_value}'")
+            logger.warning(f"cannot get value from '{key_value}'")
             continue
         if key_value_dict.get(key):
             raise KeyError("you cannot pass the same key "
@@ -587,7 +4595,8 @@ def read_key_value_list(key_value_list: list,
 
 
 def read_file(path: str,
-              delimiter: str = '=') -> dict:
+              delimiter: str = '=',
+              cache: TemplateCache = None) -> dict:
     """read .env or .json file and generate a dictionary with key: value
 
     Arguments:
@@ -595,62 +4604,197 @@ def read_file(path: str,
 
     Keyword Arguments:
         delimiter {str} -- delimiter (default: {'='})
+        cache {TemplateCache} -- reuse the variables of an unchanged file
+                                 (default: None)
 
     Raises:
-        ValueError: no delemiter for file is None
         FileNotFoundError: file to read does not exists
         TypeError: file suffix does not end with .env or .json
+        ValueError: no delemiter for file is None
 
     Returns:
         dict -- dictionary with extracted key/value pairs
     """
+    # a missing or unsupported file is reported before a missing delimiter
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"file '{path}' not found")
+
+    if Path(path).suffix not in (".env", ".json"):
+        raise TypeError(
+                f"input file '{path}' does not end with '.env' or '.json'")
 
     if not delimiter:
         raise ValueError("no delemiter for file passed")
 
-    key_value_dict = {}
+    if cache:
+        return cache.load_vars(path=path, delimiter=delimiter)
 
-    if not os.path.isfile(path):
-        raise FileNotFoundError(f"file '{path}' not found")
+    key_value_dict, warnings = parse_input_file(path=path,
+                                                delimiter=delimiter)
+    for warning in warnings:
+        logger.warning(warning)
+    return key_value_dict
 
-    extension = Path(path).suffix
-    if extension == ".env":
-        nr = 0
-        with open(file=path, mode="r") as data:
-            for line in data.readlines():
-                nr += 1
-                line = line.strip()
-                try:
-                    if not line.strip() or line.startswith("#"):
-                        continue
-                    if delimiter not in line:
-                        raise SyntaxError(f"line {nr} in file '{path}' has no"
-                                          f" valid delimiter ({delimiter})'")
-
-                    key, value = line.split(delimiter, 1)
-                    if not key:
-                        raise KeyError(f"cannot get key from line {nr} "
-                                       f"from file '{path}'")
-                    if not value:
-                        raise ValueError(f"cannot get value from line {nr}"
-                                         f" from file '{path}'")
-
-                    existing_value = key_value_dict.get(key)
-                    if existing_value:
-                        raise ReferenceError(f"key '{key}' in file '{path}' "
-                                             f"(line {nr}) already set")
-
-                    key_value_dict[key.strip()] = value.strip(' \'"\n')
-                except Exception as e:
-                    logging.warning(str(e).strip('"'))
 
-    elif extension == ".json":
+def parse_input_file(path: str, delimiter: str = '=') -> tuple:
+    """parse a .env or .json file
+
+    a .env file is read line by line. a warning is only formatted for an
+    invalid line.
+
+    Arguments:
+        path {str} -- path to .env or .json file
+
+    Keyword Arguments:
+        delimiter {str} -- delimiter of .env files (default: {'='})
+
+    Returns:
+        tuple -- dictionary with extracted key/value pairs and a list of
+                 warnings about invalid lines
+    """
+    if Path(path).suffix == ".json":
+        import json
         with open(file=path, mode="r") as data:
-            key_value_dict = json.load(data)
-    else:
-        raise TypeError(
-                f"input file '{path}' does not end with '.env' or '.json'")
-    return key_value_dict
+            return json.load(data), []
+
+    key_value_dict, warnings = {}, []
+    with open(file=path, mode="r") as data:
+        for nr, line in enumerate(data, start=1):
+            line = line.strip()
+            if not line or line[0] == "#":
+                continue
+            key, found, value = line.partition(delimiter)
+            if not found:
+                warnings.append(f"line {nr} in file '{path}' has no valid "
+                                f"delimiter ({delimiter})'")
+            elif not key:
+                # same text as a logged KeyError
+                warnings.append(repr(f"cannot get key from line {nr} from "
+                                     f"file '{path}'").strip('"'))
+            elif not value:
+                warnings.append(f"cannot get value from line {nr} from "
+                                f"file '{path}'")
+            elif key_value_dict.get(key):
+                warnings.append(f"key '{key}' in file '{path}' (line {nr}) "
+                                "already set")
+            else:
+                key_value_dict[key.strip()] = value.strip(' \'"\n')
+    return key_value_dict, warnings
+
+
+def read_template_vars(template: str) -> tuple:
+    """read a template without decoding it and collect its variables
+
+    Arguments:
+        template {str} -- path to template
+
+    Returns:
+        tuple -- sha256 of the content and sorted list of variable names
+    """
+    import hashlib
+
+    with open(file=template, mode="rb") as data:
+        content = data.read()
+    names = {(match.group('named') or match.group('braced')).decode()
+             for match in bytes_placeholder_pattern.finditer(content)
+             if match.group('named') or match.group('braced')}
+    return hashlib.sha256(content).hexdigest(), sorted(names)
+
+
+def resolve_vars(names: list, layers: list) -> dict:
+    """value of each name from the first layer containing it, else None"""
+    values = {}
+    for name in names:
+        for layer in layers:
+            if name in layer:
+                values[name] = layer[name]
+                break
+        else:
+            values[name] = None
+    return values
+
+
+def referenced_names(src: list,
+                     recursive: bool = False,
+                     excludes: list = [],
+                     includes: list = [],
+                     cache: MemoryCache = None,
+                     stream: bool = False) -> set:
+    """collect the variable names of all templates of src
+
+    each template is compiled through cache, so rendering it afterwards
+    does not read it again. with stream, templates are scanned chunk by
+    chunk instead, so memory does not depend on their size
+
+    Arguments:
+        src {list} -- templates or directories
+
+    Keyword Arguments:
+        cache {MemoryCache} -- keeps the compiled templates for rendering
+                               (default: None)
+        stream {bool} -- scan templates chunk by chunk (default: {False})
+        see 'process' for the other arguments
+
+    Returns:
+        set -- variable names
+    """
+    cache = cache or MemoryCache()
+    names = set()
+    for item in src:
+        item = Path(item).expanduser()
+        if not item.exists():
+            continue  # reported when rendering
+        for template, _ in find_templates(item=item,
+                                          recursive=recursive,
+                                          excludes=excludes,
+                                          includes=includes):
+            try:
+                if stream:
+                    names.update(name for name, _ in
+                                 stream_placeholders(template=template))
+                else:
+                    parts, _ = cache.load(template=template)
+                    names.update(name for name in
+                                 index_placeholders(parts=parts) if name)
+            except (OSError, ValueError) as e:
+                # reported when rendering
+                logger.debug(f"cannot read '{template}'. {e}")
+    return names
+
+
+def referenced_layers(substitutions: list, names: set) -> list:
+    """copy only the given names out of each layer
+
+    each layer of substitutions becomes one dict, so the precedence of the
+    layers does not change. nested layers are resolved in their own order.
+
+    Arguments:
+        substitutions {list} -- dicts, mappings or lists of them
+        names {set} -- variable names to look up
+
+    Returns:
+        list -- one dict per layer
+    """
+    layers = []
+    for layer in substitutions:
+        lookups = flatten_substitutions(substitutions=layer)
+        values = {}
+        for name in names:
+            for lookup in lookups:
+                if name in lookup:
+                    values[name] = lookup[name]
+                    break
+        layers.append(values)
+    return layers
+
+
+def file_signature(path: str) -> tuple:
+    """size and mtime of a file or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
 
 
 def find_vars(text: str) -> list:
@@ -666,12 +4810,89 @@ def find_vars(text: str) -> list:
 
 
 def main():
+    profiler = None
     try:
         args = parse_args()
 
         if not args.quiet:
             setup_logger(debug=args.debug)
 
+        if args.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        if args.serve:
+            serve(socket_path=args.serve,
+                  src=args.src,
+                  recursive=args.recursive,
+                  key_value_list=args.key_value_list,
+                  input_files=args.input_files,
+                  file_delimiter=args.delimiter or '=',
+                  no_os_env=args.no_os_env,
+                  excludes=args.excludes,
+                  includes=args.includes,
+                  cache_dir=args.cache_dir,
+                  cache_size=args.cache_size * 1024 * 1024)
+            return
+
+        if args.matrix:
+            render_matrix(rows_file=args.matrix,
+                          template=args.src[0],
+                          dst=args.dst,
+                          key_value_list=args.key_value_list,
+                          input_files=args.input_files,
+                          file_delimiter=args.delimiter or '=',
+                          no_os_env=args.no_os_env,
+                          strict=args.strict,
+                          force=args.force,
+                          cache_dir=args.cache_dir,
+                          cache_size=args.cache_size * 1024 * 1024,
+                          write_if_changed=args.write_if_changed,
+                          atomic=args.atomic,
+                          fsync=args.fsync,
+                          store=args.store,
+                          link=args.link)
+            return
+
+        if args.batch:
+            render_batch(manifest=args.batch,
+                         recursive=args.recursive,
+                         key_value_list=args.key_value_list,
+                         input_files=args.input_files,
+                         file_delimiter=args.delimiter or '=',
+                         no_os_env=args.no_os_env,
+                         strict=args.strict,
+                         append=args.append,
+                         force=args.force,
+                         excludes=args.excludes,
+                         includes=args.includes,
+                         cache_dir=args.cache_dir,
+                         cache_size=args.cache_size * 1024 * 1024,
+                         jobs=args.jobs,
+                         stats=args.stats,
+                         referenced_only=args.referenced_only,
+                         write_if_changed=args.write_if_changed,
+                         atomic=args.atomic,
+                         fsync=args.fsync,
+                         store=args.store,
+                         link=args.link,
+                         copy_static=args.copy_static)
+            return
+
+        if args.connect:
+            render_remote(socket_path=args.connect,
+                          src=args.src,
+                          dst=args.dst,
+                          recursive=args.recursive,
+                          key_value_list=args.key_value_list,
+                          strict=args.strict,
+                          append=args.append,
+                          force=args.force,
+                          excludes=args.excludes,
+                          includes=args.includes)
+            return
+
         process(src=args.src,
                 dst=args.dst,
                 show_diff=args.diff,
@@ -683,16 +4904,42 @@ def main():
                 no_os_env=args.no_os_env,
                 append=args.append,
                 force=args.force,
-                excludes=args.excludes)
+                excludes=args.excludes,
+                includes=args.includes,
+                cache_dir=args.cache_dir,
+                cache_size=args.cache_size * 1024 * 1024,
+                jobs=args.jobs,
+                stream=args.stream,
+                use_mmap=args.mmap,
+                incremental=args.incremental,
+                watch=args.watch,
+                watch_interval=args.watch_interval,
+                stats=args.stats,
+                referenced_only=args.referenced_only,
+                pipeline=args.pipeline,
+                write_if_changed=args.write_if_changed,
+                atomic=args.atomic,
+                fsync=args.fsync,
+                store=args.store,
+                link=args.link,
+                copy_static=args.copy_static)
 
     except KeyboardInterrupt:
         sys.stdout.flush()  # flush stream to prevent output mixup
-        logging.warning(f"you manually abort\n")
+        logger.warning(f"you manually abort\n")
         sys.exit(1)
     except Exception as e:
         sys.stdout.flush()  # flush stream to prevent output mixup
-        logging.error(str(e).strip('"'))
+        logger.error(str(e).strip('"'))
         sys.exit(1)
+    finally:
+        if profiler:
+            profiler.disable()
+            try:
+                profiler.dump_stats(args.profile)
+            except OSError as e:
+                logger.error(f"cannot write profile '{args.profile}'. "
+                             f"{e.strerror}")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,14 @@
 import copy
+import itertools
 import json
 import os
+import subprocess
 import sys
+import tempfile
 import unittest
 from io import StringIO
+from pathlib import Path
+from string import Template
 from unittest import mock
 from contextlib import contextmanager
 
@@ -100,6 +105,20 @@ class TestSum(unittest.TestCase):
         with mock.patch('sys.argv', args):
             templator.parse_args()
 
+        # --stream or --mmap with -j|--jobs or --pipeline
+        for option in (["-j", "2"], ["--pipeline", "2"]):
+            with captured_output() as (out, err):
+                args = ["templator.py", "template.txt", "--stream"] + option
+                with mock.patch('sys.argv', args), \
+                        self.assertRaises(SystemExit):
+                    templator.parse_args()
+                self.assertIn("you cannot set '--stream'", err.getvalue())
+
+        # --serve without PATH
+        args = ["templator.py", "--serve", "templator.sock"]
+        with mock.patch('sys.argv', args):
+            self.assertEqual(templator.parse_args().serve, "templator.sock")
+
     def test_skip_path(self):
         path = "path/dir/file.md"
 
@@ -134,6 +153,87 @@ class TestSum(unittest.TestCase):
         excludes = ['test', '*.txt']
         self.assertFalse(templator.skip_path(path=path, excludes=excludes))
 
+    def test_path_filter(self):
+        path_filter = templator.PathFilter(patterns=[
+            "node_modules", "*.md", ".txt", "build/", "/conf/*.yaml",
+            "**/cache/**", "tmp?.j[!x]on", "docs/**/*.rst"])
+
+        for path, is_dir, pattern in [
+                ("node_modules", True, "node_modules"),
+                ("a/node_modules", True, "node_modules"),
+                ("README.md", False, "*.md"),
+                ("dir.md", True, None),
+                ("a/b.txt", False, ".txt"),
+                (".txt", False, ".txt"),
+                ("a.txt", True, None),
+                ("build", True, "build/"),
+                ("build", False, None),
+                ("conf/app.yaml", False, "/conf/*.yaml"),
+                ("a/conf/app.yaml", False, None),
+                ("conf/a/app.yaml", False, None),
+                ("a/cache/b/c.txt", False, ".txt"),
+                ("cache/b/c", False, "**/cache/**"),
+                ("cache", True, None),
+                ("tmp1.json", False, "tmp?.j[!x]on"),
+                ("tmp1.jxon", False, None),
+                ("docs/file.rst", False, "docs/**/*.rst"),
+                ("docs/a/b/file.rst", False, "docs/**/*.rst"),
+                ("a/b.yaml", False, None)]:
+            self.assertEqual(path_filter.match(path=path, is_dir=is_dir),
+                             pattern, path)
+
+        self.assertEqual(path_filter.match_name(name="app.yaml"), None)
+        self.assertFalse(templator.PathFilter(patterns=None))
+
+        with self.assertRaises(ValueError):
+            templator.PathFilter(patterns=["*.md", "!README.md"])
+        path_filter = templator.PathFilter(patterns=["\\!important.txt"])
+        self.assertEqual(path_filter.match(path="a/!important.txt"),
+                         "\\!important.txt")
+
+    def test_walk_templates(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ("a.txt", "sub/b.txt", "sub/deep/c.md",
+                         "node_modules/pkg/d.txt"):
+                os.makedirs(os.path.dirname(os.path.join(tmp, name)),
+                            exist_ok=True)
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write(name)
+
+            def walk(**kwargs):
+                return sorted(relative for _, relative in
+                              templator.walk_templates(item=Path(tmp),
+                                                       **kwargs))
+
+            self.assertEqual(walk(), ["a.txt"])
+            self.assertEqual(walk(recursive=True),
+                             ["a.txt", "node_modules/pkg/d.txt", "sub/b.txt",
+                              "sub/deep/c.md"])
+
+            # excluded directories are not read
+            with mock.patch("os.scandir", wraps=os.scandir) as scandir:
+                self.assertEqual(
+                    walk(recursive=True,
+                         exclude_filter=templator.PathFilter(
+                             patterns=["node_modules", "*.md"])),
+                    ["a.txt", "sub/b.txt"])
+            scanned = [call.args[0] for call in scandir.call_args_list]
+            self.assertNotIn(os.path.join(tmp, "node_modules"), scanned)
+            self.assertIn(os.path.join(tmp, "sub", "deep"), scanned)
+
+            # includes only apply to files
+            self.assertEqual(
+                walk(recursive=True,
+                     exclude_filter=templator.PathFilter(patterns=["sub/"]),
+                     include_filter=templator.PathFilter(
+                         patterns=["*.txt", "*.md"])),
+                ["a.txt", "node_modules/pkg/d.txt"])
+            self.assertEqual(
+                walk(recursive=True,
+                     include_filter=templator.PathFilter(
+                         patterns=["sub/**/*.md"])),
+                ["sub/deep/c.md"])
+
     def test_out_file(self):
 
         patcher = mock.patch('templator.parse_template')
@@ -193,6 +293,15 @@ class TestSum(unittest.TestCase):
                                                          substitutions=[])
         self.assertEqual(src_content, processed_content)
 
+        # an escaped '$' is not an unresolved variable
+        mock_open = mock.mock_open(read_data="$$VAR $VAR")
+        with mock.patch("builtins.open", mock_open):
+            processed_content = templator.parse_template(
+                                    template=path,
+                                    substitutions={'VAR': "value"},
+                                    strict=True)
+        self.assertEqual(processed_content, "$VAR value")
+
     def test_print_diff(self):
         templates = [
             {
@@ -226,6 +335,40 @@ class TestSum(unittest.TestCase):
                 for result in template['results']:
                     self.assertIn(result, template['results'])
 
+    def test_print_placeholder_diff(self):
+        text = ("line 1\n$A and $A\n${B}\nline 4 $UNKNOWN\n$$ $B\n"
+                "line 6\n$A\n$C")
+        substitutions = [{'A': "a"}, {'B': "b1\nb2", 'C': "$C"}]
+        parts = templator.compile_template(text=text)
+        with captured_output() as (out, err):
+            templator.print_placeholder_diff(
+                text=text,
+                index=templator.index_placeholders(parts=parts),
+                substitutions=substitutions)
+        lines = [line.replace('\x1b[31m', '').replace('\x1b[32m', '')
+                 .replace('\x1b[0m', '') for line in
+                 out.getvalue().splitlines()]
+        self.assertEqual(lines, [
+            "-$A and $A",
+            "-${B}",
+            "+a and a",
+            "+b1",
+            "+b2",
+            "-$$ $B",
+            "+$ b1",
+            "+b2",
+            "-$A",
+            "+a",
+        ])
+
+        # the output is written at once
+        with mock.patch('sys.stdout') as stdout:
+            templator.print_placeholder_diff(
+                text=text,
+                index=templator.index_placeholders(parts=parts),
+                substitutions=substitutions)
+        self.assertEqual(stdout.write.call_count, 1)
+
     def test_read_key_value_list(self):
         with self.assertLogs() as logs:
             templator.read_key_value_list(key_value_list=["key: value"])
@@ -327,6 +470,639 @@ class TestSum(unittest.TestCase):
             result = templator.find_vars(text=content['txt'])
             self.assertEqual(len(result), content['len'])
 
+    def test_compile_template(self):
+        text = "a $VAR b ${VAR}c $$ d $ e ${1} $$VAR"
+        parts = templator.compile_template(text=text)
+        self.assertEqual(parts, [
+            "a ", ("VAR", "$VAR"), " b ", ("VAR", "${VAR}"), "c ",
+            (None, "$$"), " d $ e ${1} ", (None, "$$"), "VAR"])
+        # compiled template keeps the original text
+        self.assertEqual(
+            "".join(p if isinstance(p, str) else p[1] for p in parts), text)
+        self.assertEqual(templator.compile_template(text=""), [])
+
+    def test_index_placeholders(self):
+        parts = templator.compile_template(text="a $VAR b ${VAR}c $$ $OTHER")
+        index = templator.index_placeholders(parts=parts)
+        self.assertEqual(index, {
+            "VAR": [(2, "$VAR"), (9, "${VAR}")],
+            None: [(17, "$$")],
+            "OTHER": [(20, "$OTHER")],
+        })
+        self.assertEqual(templator.index_placeholders(parts=[]), {})
+
+        # unresolved placeholders keep the order of the template
+        index = templator.index_placeholders(
+            parts=templator.compile_template(text="$B $A ${B} $$C $C"))
+        self.assertEqual(
+            templator.unresolved_placeholders(index=index,
+                                              substitutions=[{}, {'A': 1}]),
+            ["$B", "${B}", "$C"])
+        self.assertEqual(
+            templator.unresolved_placeholders(
+                index=index, substitutions={'A': 1, 'B': 2, 'C': 3}),
+            [])
+
+    def test_render_template(self):
+        texts = [
+            "",
+            "no variables\n",
+            "$VAR ${VAR} $UNKNOWN ${UNKNOWN}\n$$ $$$ $ ${ $1 ${VAR",
+            "${VAR}ification $VAR_2 $_var\n$NUM",
+        ]
+        values = {'VAR': "value", 'VAR_2': "ü", '_var': "x", 'NUM': 1}
+        for text in texts:
+            parts = templator.compile_template(text=text)
+            self.assertEqual(
+                templator.render_template(parts=parts, substitutions=values),
+                Template(text).safe_substitute(values))
+
+        # same result as one 'safe_substitute' per layer
+        layers = [{'VAR': "first"}, {'VAR': "second", 'VAR_2': "2"}, {}]
+        for text in texts:
+            text = text.replace("$$", "")
+            expected = text
+            for layer in layers:
+                if layer:
+                    expected = Template(expected).safe_substitute(layer)
+            parts = templator.compile_template(text=text)
+            self.assertEqual(
+                templator.render_template(parts=parts, substitutions=layers),
+                expected)
+
+        # nested lists
+        parts = templator.compile_template(text="$A $B $C")
+        self.assertEqual(
+            templator.render_template(
+                parts=parts, substitutions=[{'A': 1}, [{'B': 2}, [{}]]]),
+            "1 2 $C")
+
+        with self.assertRaises(AttributeError):
+            templator.render_template(parts=parts, substitutions=["A=1"])
+
+    def test_template_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            template = os.path.join(tmp, "template.txt")
+            with open(template, "w") as f:
+                f.write("a $VAR b")
+            cache = templator.TemplateCache(path=os.path.join(tmp, "cache"))
+
+            # miss
+            parts, content = cache.load(template=template)
+            self.assertEqual(content, "a $VAR b")
+            self.assertEqual(parts, ["a ", ("VAR", "$VAR"), " b"])
+
+            # hit, template not read
+            parts, content = templator.TemplateCache(
+                path=os.path.join(tmp, "cache")).load(template=template)
+            self.assertIsNone(content)
+            self.assertEqual(parts, ["a ", ("VAR", "$VAR"), " b"])
+
+            # changed mtime, same content
+            os.utime(template, ns=(0, 0))
+            parts, content = cache.load(template=template)
+            self.assertEqual(content, "a $VAR b")
+            self.assertIsNone(cache.load(template=template)[1])
+
+            # changed content
+            with open(template, "w") as f:
+                f.write("${OTHER}")
+            parts, content = cache.load(template=template)
+            self.assertEqual(parts, [("OTHER", "${OTHER}")])
+
+            # evict least recently used entries
+            cache = templator.TemplateCache(path=os.path.join(tmp, "lru"),
+                                            max_size=300)
+            for nr in range(5):
+                path = os.path.join(tmp, f"{nr}.txt")
+                with open(path, "w") as f:
+                    f.write(f"$VAR_{nr}")
+                cache.load(template=path)
+            self.assertLessEqual(cache.size, 300)
+            self.assertLess(len(os.listdir(os.path.join(tmp, "lru"))), 5)
+            self.assertIsNone(cache.load(template=path)[1])
+
+            # failed write leaves no temporary file
+            size = cache.size
+            with mock.patch('os.replace', side_effect=OSError("failed")), \
+                    self.assertLogs(level="WARNING"):
+                cache.store(entry_path=cache.entry_path(template=path),
+                            entry={'version': cache.VERSION})
+            self.assertEqual(cache.size, size)
+            self.assertFalse([name for name in
+                              os.listdir(os.path.join(tmp, "lru"))
+                              if name.endswith(".tmp")])
+
+    def test_input_file_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "values.env")
+            with open(path, "w") as f:
+                f.write("A=1\nB\nC='3'\n")
+            cache = templator.TemplateCache(path=os.path.join(tmp, "cache"))
+
+            with mock.patch('templator.parse_input_file',
+                            wraps=templator.parse_input_file) as parse:
+                # miss
+                with self.assertLogs() as logs:
+                    values = templator.read_file(path=path, cache=cache)
+                self.assertEqual(values, {'A': "1", 'C': "3"})
+                self.assertIn("line 2 in file", logs.output[0])
+
+                # hit, warnings are logged again
+                with self.assertLogs() as cached_logs:
+                    values = templator.read_file(
+                        path=path,
+                        cache=templator.TemplateCache(
+                            path=os.path.join(tmp, "cache")))
+                self.assertEqual(values, {'A': "1", 'C': "3"})
+                self.assertEqual(
+                    [line for line in cached_logs.output
+                     if line.startswith("WARNING")], logs.output)
+
+                # changed mtime, same content
+                os.utime(path, ns=(0, 0))
+                templator.read_file(path=path, cache=cache)
+                self.assertEqual(parse.call_count, 1)
+
+                # changed content and other delimiter
+                with open(path, "w") as f:
+                    f.write("A:2\n")
+                self.assertEqual(templator.read_file(path=path,
+                                                     delimiter=":",
+                                                     cache=cache),
+                                 {'A': "2"})
+                self.assertEqual(parse.call_count, 2)
+
+    def test_iter_template_chunks(self):
+        texts = [
+            "",
+            "$VAR",
+            "a $VAR b ${VAR}c $$ d $ e ${1} $$VAR $$$VAR ${VAR",
+            "$$$$${VAR}$VAR_LONG_NAME$\n${UNKNOWN}$",
+        ]
+        values = {'VAR': "value", 'VAR_LONG_NAME': "long"}
+        for text in texts:
+            expected = templator.render_template(
+                parts=templator.compile_template(text=text),
+                substitutions=values)
+            for chunk_size in range(1, 8):
+                content = "".join(
+                    templator.render_template(parts=parts,
+                                              substitutions=values)
+                    for parts in templator.iter_template_chunks(
+                        data=StringIO(text), chunk_size=chunk_size))
+                self.assertEqual(content, expected)
+
+    def test_output_file_stream(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            template = os.path.join(tmp, "template.txt")
+            with open(template, "w") as f:
+                f.write("a $VAR b ${MISSING}")
+
+            with captured_output() as (out, err):
+                templator.output_file(src=template,
+                                      substitutions={'VAR': 1},
+                                      stream=True)
+            self.assertEqual(out.getvalue(), "a 1 b ${MISSING}\n")
+
+            dst = os.path.join(tmp, "dst", "template.txt")
+            with self.assertRaises(LookupError):
+                templator.output_file(src=template,
+                                      dst=dst,
+                                      substitutions={'VAR': 1},
+                                      strict=True,
+                                      stream=True)
+            self.assertFalse(os.path.exists(dst))
+
+            templator.output_file(src=template,
+                                  dst=dst,
+                                  substitutions={'VAR': 1, 'MISSING': 2},
+                                  strict=True,
+                                  stream=True)
+            with open(dst) as f:
+                self.assertEqual(f.read(), "a 1 b 2\n")
+
+    def test_write_if_changed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            template = os.path.join(tmp, "template.txt")
+            with open(template, "w") as f:
+                f.write("a $VAR ü")
+            dst = os.path.join(tmp, "dst.txt")
+
+            for options, force in itertools.product(
+                    ({}, {'stream': True}, {'use_mmap': True}), (True, False)):
+                if os.path.exists(dst):
+                    os.remove(dst)
+
+                def render(value) -> str:
+                    return templator.output_file(src=template,
+                                                 dst=dst,
+                                                 force=force,
+                                                 substitutions={'VAR': value},
+                                                 if_changed=True,
+                                                 **options)
+
+                self.assertEqual(render(1), "saved")
+                os.chmod(dst, 0o640)
+                os.utime(dst, ns=(0, 0))
+                self.assertEqual(render(1), "unchanged")
+                self.assertEqual(os.stat(dst).st_mtime_ns, 0)
+
+                # same size, other content
+                self.assertEqual(render(2), "saved")
+                self.assertNotEqual(os.stat(dst).st_mtime_ns, 0)
+                self.assertEqual(os.stat(dst).st_mode & 0o777, 0o640)
+                with open(dst) as f:
+                    self.assertEqual(f.read(), "a 2 ü\n")
+                self.assertEqual(render(10), "saved")
+                self.assertEqual(sorted(os.listdir(tmp)),
+                                 ["dst.txt", "template.txt"])
+
+    def test_output_writer(self):
+        for atomic in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                # the process-wide umask is never changed
+                with mock.patch('os.umask') as umask:
+                    writer = templator.OutputWriter(atomic=atomic, fsync=True)
+                umask.assert_not_called()
+                dst = os.path.join(tmp, "a", "b", "file.txt")
+                other = os.path.join(tmp, "a", "b", "other.txt")
+
+                with mock.patch('pathlib.Path.mkdir', autospec=True,
+                                side_effect=Path.mkdir) as mkdir, \
+                        mock.patch('os.fsync', wraps=os.fsync) as fsync:
+                    self.assertEqual(writer.write(content="ä 1", dst=dst),
+                                     "saved")
+                    calls = mkdir.call_count
+                    self.assertEqual(writer.write(content="2", dst=other),
+                                     "saved")
+                    self.assertEqual(mkdir.call_count, calls)
+                    self.assertEqual(fsync.call_count, 2)
+                    writer.close()
+                    self.assertEqual(fsync.call_count, 3)
+
+                with open(dst, encoding=writer.encoding) as f:
+                    self.assertEqual(f.read(), "ä 1\n")
+                with self.assertLogs(level="WARNING"):
+                    self.assertEqual(writer.write(content="x", dst=dst),
+                                     "skipped")
+
+                # the mode of an existing file is kept
+                os.chmod(dst, 0o751)
+                inode = os.stat(dst).st_ino
+                self.assertEqual(
+                    writer.write(content="3", dst=dst, force=True), "saved")
+                self.assertEqual(os.stat(dst).st_mode & 0o777, 0o751)
+                self.assertEqual(os.stat(dst).st_ino != inode, atomic)
+                self.assertEqual(
+                    writer.write(content="3", dst=dst, force=True,
+                                 if_changed=True),
+                    "unchanged")
+                self.assertEqual(
+                    writer.write(content=lambda output: output.write("4\n"),
+                                 dst=dst, append=True),
+                    "appended")
+                with open(dst) as f:
+                    self.assertEqual(f.read(), "3\n4\n")
+                self.assertEqual(sorted(os.listdir(os.path.dirname(dst))),
+                                 ["file.txt", "other.txt"])
+
+                # removed directory is created again
+                os.remove(dst)
+                os.remove(other)
+                os.rmdir(os.path.dirname(dst))
+                self.assertEqual(writer.write(content="5", dst=dst), "saved")
+                with open(dst) as f:
+                    self.assertEqual(f.read(), "5\n")
+
+    def test_temp_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            dst = os.path.join(tmp, "file.txt")
+            first = templator.temp_file(dst=dst)
+            second = templator.temp_file(dst=dst)
+            self.assertNotEqual(first, second)
+            for path in (first, second):
+                self.assertEqual(os.path.dirname(path), tmp)
+                self.assertRegex(os.path.basename(path), r"^\.file\.txt\.")
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+                os.remove(path)
+
+            # new files get the default mode, like open
+            Path(dst).touch()
+            path = templator.temp_file(dst=dst, create=templator.new_file)
+            self.assertEqual(os.stat(path).st_mode, os.stat(dst).st_mode)
+            os.remove(path)
+
+            # a name taken in the meantime is not used
+            taken = []
+
+            def create(path):
+                if not taken:
+                    taken.append(path)
+                    raise FileExistsError(path)
+                os.symlink(dst, path)
+
+            path = templator.temp_file(dst=dst, create=create)
+            self.assertNotEqual(path, taken[0])
+            self.assertTrue(os.path.islink(path))
+            os.remove(path)
+
+            def fail(path):
+                templator.new_file(path)
+                raise OSError("no space left")
+
+            with self.assertRaises(OSError):
+                templator.temp_file(dst=dst, create=fail)
+            self.assertEqual(os.listdir(tmp), ["file.txt"])
+
+    def test_content_store(self):
+        for link in templator.ContentStore.LINK_MODES:
+            with tempfile.TemporaryDirectory() as tmp:
+                store = templator.ContentStore(
+                    path=os.path.join(tmp, "store"), link=link)
+                writer = templator.OutputWriter(store=store)
+                first = os.path.join(tmp, "out", "first.txt")
+                second = os.path.join(tmp, "out", "second.txt")
+                static = os.path.join(tmp, "static.txt")
+                Path(static).write_bytes(b"no \xff placeholders")
+                template = os.path.join(tmp, "template.txt")
+                Path(template).write_text("$VAR")
+
+                self.assertEqual(writer.write(content="ä", dst=first),
+                                 "saved")
+                self.assertEqual(writer.write(content="ä", dst=second),
+                                 "saved")
+                self.assertEqual(
+                    writer.write(content="ä", dst=second, force=True),
+                    "unchanged")
+                blobs = [path for path in Path(tmp, "store").rglob("*")
+                         if path.is_file()]
+                self.assertEqual(len(blobs), 1)
+                self.assertEqual(blobs[0].stat().st_mode & 0o777, 0o444)
+                for dst in (first, second):
+                    with open(dst, encoding=writer.encoding) as f:
+                        self.assertEqual(f.read(), "ä\n")
+                    self.assertEqual(os.path.islink(dst), link == "symlink")
+                    self.assertEqual(os.path.samefile(dst, blobs[0]),
+                                     link in ("hardlink", "symlink"))
+
+                # templates without placeholders are copied as rendered
+                self.assertEqual(
+                    writer.write_static(template=static, dst=first,
+                                        force=True),
+                    "saved")
+                self.assertEqual(Path(first).read_bytes(),
+                                 b"no \xff placeholders\n")
+                self.assertIsNone(
+                    writer.write_static(template=template, dst=first,
+                                        force=True))
+                with self.assertLogs(level="WARNING"):
+                    self.assertEqual(
+                        writer.write_static(template=static, dst=first),
+                        "skipped")
+                self.assertEqual(
+                    writer.write(content="ä", dst=first, force=True),
+                    "saved")
+                self.assertEqual(sorted(os.listdir(os.path.join(tmp, "out"))),
+                                 ["first.txt", "second.txt"])
+
+        with self.assertRaises(ValueError):
+            templator.ContentStore(path="store", link="unknown")
+
+    def test_copy_static(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = {
+                "static.txt": b"no placeholders\r\n",
+                "template.txt": b"a $VAR",
+                "binary.dat": b"\x89PNG\x00$VAR\xff",
+                "late.dat": (b"$VAR" + b" " * templator.BINARY_CHECK_SIZE +
+                             b"\x00"),
+                "empty.txt": b"",
+            }
+            for name, content in files.items():
+                Path(tmp, name).write_bytes(content)
+            self.assertEqual(
+                {name: templator.static_template(os.path.join(tmp, name))
+                 for name in files},
+                {"static.txt": True, "template.txt": False,
+                 "binary.dat": True, "late.dat": False, "empty.txt": True})
+
+            os.chmod(os.path.join(tmp, "binary.dat"), 0o750)
+            for atomic in (False, True):
+                writer = templator.OutputWriter(atomic=atomic,
+                                                copy_static=True)
+                out = os.path.join(tmp, f"out{atomic}")
+                for name in ("static.txt", "binary.dat", "empty.txt"):
+                    self.assertEqual(
+                        writer.write_static(template=os.path.join(tmp, name),
+                                            dst=os.path.join(out, name)),
+                        "saved")
+                    self.assertEqual(Path(out, name).read_bytes(),
+                                     files[name])
+                self.assertEqual(
+                    os.stat(os.path.join(out, "binary.dat")).st_mode & 0o777,
+                    0o750)
+                self.assertIsNone(writer.write_static(
+                    template=os.path.join(tmp, "template.txt"),
+                    dst=os.path.join(out, "template.txt")))
+                self.assertEqual(
+                    writer.write_static(
+                        template=os.path.join(tmp, "static.txt"),
+                        dst=os.path.join(out, "static.txt"),
+                        force=True,
+                        if_changed=True),
+                    "unchanged")
+
+                # rendered through 'output_file'
+                self.assertEqual(
+                    templator.output_file(
+                        src=os.path.join(tmp, "template.txt"),
+                        dst=os.path.join(out, "template.txt"),
+                        substitutions={"VAR": "b"},
+                        writer=writer),
+                    "saved")
+                self.assertEqual(Path(out, "template.txt").read_text(),
+                                 "a b\n")
+                self.assertEqual(sorted(os.listdir(out)),
+                                 ["binary.dat", "empty.txt", "static.txt",
+                                  "template.txt"])
+
+    def test_renderer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            values = Path(tmp, "values.env")
+            values.write_text("A=file\nB=file")
+            Path(tmp, "src", "sub").mkdir(parents=True)
+            Path(tmp, "src", "a.txt").write_text("$A $B")
+            Path(tmp, "src", "sub", "b.txt").write_text("${C}")
+
+            renderer = templator.Renderer(variables=["A=set"],
+                                          input_files=[str(values)],
+                                          recursive=True)
+            self.assertEqual(renderer.render_string("$A $B $$"),
+                             "set file $")
+            self.assertEqual(
+                renderer.render_string("$A $B", variables={'B': "call"}),
+                "set call")
+            self.assertEqual(
+                renderer.render_file(os.path.join(tmp, "src", "a.txt")),
+                "set file")
+
+            # changed input files are read again
+            values.write_text("A=file\nB=changed value")
+            os.utime(values, ns=(0, 0))
+            self.assertEqual(renderer.render_string("$B"), "changed value")
+
+            results = renderer.render_tree(
+                src=os.path.join(tmp, "src") + "/",
+                dst=os.path.join(tmp, "dst") + "/",
+                variables={'C': "c"})
+            self.assertEqual(
+                sorted((Path(result.dst).relative_to(tmp).as_posix(),
+                        result.status, result.error) for result in results),
+                [("dst/a.txt", "saved", None),
+                 ("dst/sub/b.txt", "saved", None)])
+            self.assertEqual(Path(tmp, "dst", "sub", "b.txt").read_text(),
+                             "c\n")
+
+            # to stdout
+            results = {Path(result.template).name: result.content
+                       for result in renderer.results(
+                           src=os.path.join(tmp, "src"))}
+            self.assertEqual(results, {"a.txt": "set changed value",
+                                       "b.txt": "${C}"})
+
+            strict = templator.Renderer(strict=True)
+            with self.assertRaises(LookupError):
+                strict.render_string("$MISSING")
+            result, = strict.results(src=os.path.join(tmp, "src", "sub"))
+            self.assertIsInstance(result.error, LookupError)
+            with self.assertRaises(LookupError):
+                list(strict.results(src=os.path.join(tmp, "missing")))
+
+    def test_read_rows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = {
+                "rows.csv": 'host,port\na,1\n"b,c",2,extra\nd\n',
+                "rows.jsonl": '{"host": "a", "port": null}\n\n'
+                              '{"host": "b", "port": 2}\n',
+                "rows.ndjson": '{"host": "a"}\n',
+                "rows.json": '[{"host": "a"}, {"port": 2}]',
+                "invalid.jsonl": '{"host": "a"}\n{"host"\n',
+                "list.jsonl": '["a"]\n',
+                "object.json": '{"host": "a"}',
+                "rows.env": "host=a",
+            }
+            for name, content in files.items():
+                Path(tmp, name).write_text(content)
+
+            def rows(name: str) -> list:
+                return list(templator.read_rows(os.path.join(tmp, name)))
+
+            self.assertEqual(rows("rows.csv"),
+                             [(1, {'host': "a", 'port': "1"}),
+                              (2, {'host': "b,c", 'port': "2"}),
+                              (3, {'host': "d"})])
+            self.assertEqual(rows("rows.jsonl"),
+                             [(1, {'host': "a"}),
+                              (3, {'host': "b", 'port': 2})])
+            self.assertEqual(rows("rows.ndjson"), [(1, {'host': "a"})])
+            self.assertEqual(rows("rows.json"),
+                             [(1, {'host': "a"}), (2, {'port': 2})])
+            for name in ("invalid.jsonl", "list.jsonl", "object.json"):
+                with self.assertRaises(ValueError):
+                    rows(name)
+            with self.assertRaises(TypeError):
+                rows("rows.env")
+            with self.assertRaises(FileNotFoundError):
+                rows("missing.csv")
+
+    def test_map_template(self):
+        texts = [
+            "",
+            "no variables ü\n",
+            "a $VAR b ${VAR}c $$ d $ e ${1} $$VAR ${UNKNOWN} ${VAR",
+            "ä$VAR_2ö\n$NUM",
+        ]
+        values = {'VAR': "value", 'VAR_2': "ü€", 'NUM': 1}
+        with tempfile.TemporaryDirectory() as tmp:
+            template = os.path.join(tmp, "template.txt")
+            for text in texts:
+                with open(template, "w", encoding="utf-8") as f:
+                    f.write(text)
+                expected = templator.render_template(
+                    parts=templator.compile_template(text=text),
+                    substitutions=values) + "\n"
+
+                # text stream without buffer
+                out = StringIO()
+                templator.map_template(template=template,
+                                       output=out,
+                                       substitutions=values)
+                self.assertEqual(out.getvalue(), expected)
+
+                dst = os.path.join(tmp, "dst.txt")
+                templator.output_file(src=template,
+                                      dst=dst,
+                                      force=True,
+                                      substitutions=values,
+                                      use_mmap=True)
+                with open(dst, encoding="utf-8") as f:
+                    self.assertEqual(f.read(), expected)
+
+                self.assertEqual(
+                    [raw for _, raw in templator.mapped_placeholders(
+                        template=template)],
+                    [part[1] for part in templator.compile_template(
+                        text=text) if not isinstance(part, str) and part[0]])
+
+            with self.assertRaises(LookupError):
+                templator.output_file(src=template,
+                                      substitutions={},
+                                      strict=True,
+                                      use_mmap=True)
+
+    def test_stats(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            template = os.path.join(tmp, "template.txt")
+            with open(template, "w") as f:
+                f.write("$A ${B} $C $$D")
+
+            stats = templator.Stats(layers=["set", "input files"])
+            templator.output_file(src=template,
+                                  dst=os.path.join(tmp, "out.txt"),
+                                  substitutions=[{'A': "1"}, {'A': 2, 'B': 3}],
+                                  stats=stats)
+
+            self.assertEqual(stats.resolved, [1, 1])
+            self.assertEqual(stats.unresolved, 1)
+            self.assertEqual(stats.bytes_in, 14)
+            self.assertEqual(stats.bytes_out, len("1 3 $C $D\n"))
+            self.assertEqual(set(stats.files[template]),
+                             {"read", "index", "substitute", "write"})
+            self.assertEqual(stats.totals['substitute'][1], 1)
+
+            output = StringIO()
+            stats.report(output=output)
+            report = output.getvalue()
+            self.assertIn(template, report)
+            self.assertIn("bytes in: 14", report)
+            self.assertIn("resolved placeholders: set: 1, input files: 1, "
+                          "unresolved: 1", report)
+
+    def test_lazy_imports(self):
+        modules = ["argparse", "asyncio", "cProfile", "concurrent.futures",
+                   "csv", "difflib", "hashlib", "json", "logging.handlers",
+                   "mmap", "socket", "socketserver"]
+        result = subprocess.run(
+            [sys.executable, "-c",
+             "import sys, templator; print(' '.join(sys.modules))"],
+            cwd=os.path.dirname(os.path.abspath(templator.__file__)),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            check=True)
+        loaded = result.stdout.split()
+        self.assertEqual([name for name in modules if name in loaded], [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,13 @@
+import collections
 import copy
 import json
 import os
 import sys
+import tempfile
+import threading
 import unittest
 from io import StringIO
+from pathlib import Path
 from unittest import mock
 
 sys.path.append(
@@ -13,6 +17,13 @@ sys.path.append(
 import templator
 
 
+def create_tree(root: str, files: dict):
+    for name, content in files.items():
+        path = Path(root, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
 class TestSum(unittest.TestCase):
 
     def test_process_key_value(self):
@@ -27,6 +38,558 @@ class TestSum(unittest.TestCase):
     def test_process_all(self):
         pass
 
+    def test_process_jobs(self):
+        files = {f"dir{nr % 3}/file{nr}.txt": f"{nr}: $VAR ${{MISSING}}"
+                 for nr in range(40)}
+        files["dir0/broken.txt"] = "$VAR"
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=os.path.join(tmp, "src"), files=files)
+            src = os.path.join(tmp, "src") + "/"
+
+            # stdout keeps the order of the sequential run
+            outputs = []
+            for jobs in (1, 4):
+                with mock.patch('sys.stdout', new=StringIO()) as out:
+                    templator.process(src=[src],
+                                      recursive=True,
+                                      key_value_list=["VAR=value"],
+                                      jobs=jobs)
+                outputs.append(out.getvalue())
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertIn("39: value ${MISSING}\n", outputs[1])
+
+            # errors are logged per template, the others are still rendered
+            for jobs in (1, 4):
+                dst = os.path.join(tmp, f"dst{jobs}")
+                os.mkdir(dst)
+                with self.assertLogs(level="ERROR") as logs:
+                    templator.process(src=[src],
+                                      dst=dst,
+                                      recursive=True,
+                                      key_value_list=["VAR=value"],
+                                      strict=True,
+                                      jobs=jobs)
+                self.assertEqual(len(logs.output), 40)
+                self.assertEqual(
+                    Path(dst, "dir0", "broken.txt").read_text(), "value\n")
+
+    def test_process_pipeline(self):
+        files = {f"dir{nr % 3}/file{nr}.txt": f"{nr}: $VAR ${{MISSING}}"
+                 for nr in range(40)}
+        files["dir0/broken.txt"] = "$VAR"
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=os.path.join(tmp, "src"), files=files)
+            src = os.path.join(tmp, "src") + "/"
+
+            # stdout and appended output keep the order of the sequential run
+            outputs = []
+            for pipeline in (0, 3):
+                with mock.patch('sys.stdout', new=StringIO()) as out:
+                    templator.process(src=[src],
+                                      recursive=True,
+                                      key_value_list=["VAR=value"],
+                                      pipeline=pipeline)
+                outputs.append(out.getvalue())
+                dst = os.path.join(tmp, f"all{pipeline}.txt")
+                templator.process(src=[src],
+                                  dst=dst,
+                                  recursive=True,
+                                  key_value_list=["VAR=value"],
+                                  append=True,
+                                  pipeline=pipeline)
+                outputs.append(Path(dst).read_text())
+            self.assertEqual(outputs[0], outputs[2])
+            self.assertEqual(outputs[1], outputs[3])
+            self.assertIn("39: value ${MISSING}\n", outputs[2])
+
+            # errors are logged per template
+            os.mkdir(os.path.join(tmp, "dst"))
+            with self.assertLogs(level="ERROR") as logs:
+                templator.process(src=[src],
+                                  dst=os.path.join(tmp, "dst"),
+                                  recursive=True,
+                                  key_value_list=["VAR=value"],
+                                  strict=True,
+                                  pipeline=3)
+            self.assertEqual(len(logs.output), 40)
+            self.assertEqual(
+                Path(tmp, "dst", "dir0", "broken.txt").read_text(),
+                "value\n")
+
+    def test_process_incremental(self):
+        files = {
+            "a.txt": "$A",
+            "b.txt": "$B",
+            "sub/ab.txt": "$A $B",
+            "static.txt": "static",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=os.path.join(tmp, "src"), files=files)
+            src = os.path.join(tmp, "src") + "/"
+            dst = os.path.join(tmp, "dst") + "/"
+            os.mkdir(dst)
+
+            def render(key_value_list: list) -> list:
+                with mock.patch('templator.output_file',
+                                wraps=templator.output_file) as cm:
+                    templator.process(src=[src],
+                                      dst=dst,
+                                      recursive=True,
+                                      key_value_list=key_value_list,
+                                      incremental=True)
+                return sorted(Path(call.kwargs['src']).name
+                              for call in cm.call_args_list)
+
+            self.assertEqual(render(["A=1", "B=1"]),
+                             ["a.txt", "ab.txt", "b.txt", "static.txt"])
+            self.assertTrue(
+                Path(tmp, "dst", templator.Manifest.NAME).is_file())
+            self.assertEqual(render(["A=1", "B=1"]), [])
+
+            # changed variable
+            self.assertEqual(render(["A=1", "B=2"]), ["ab.txt", "b.txt"])
+            self.assertEqual(Path(tmp, "dst", "sub", "ab.txt").read_text(),
+                             "1 2\n")
+
+            # changed template
+            Path(tmp, "src", "a.txt").write_text("${A}!")
+            self.assertEqual(render(["A=1", "B=2"]), ["a.txt"])
+
+            # changed destination
+            Path(tmp, "dst", "static.txt").write_text("changed")
+            self.assertEqual(render(["A=1", "B=2"]), ["static.txt"])
+            self.assertEqual(Path(tmp, "dst", "static.txt").read_text(),
+                             "static\n")
+
+            # deleted template
+            def manifest_keys() -> list:
+                manifest = templator.Manifest(
+                    path=os.path.join(tmp, "dst", templator.Manifest.NAME))
+                return sorted(manifest.entries)
+
+            os.remove(os.path.join(tmp, "src", "b.txt"))
+            self.assertEqual(render(["A=1", "B=2"]), [])
+            self.assertEqual(manifest_keys(),
+                             sorted(["a.txt", os.path.join("sub", "ab.txt"),
+                                     "static.txt"]))
+
+    def test_process_write_if_changed(self):
+        files = {f"dir{nr % 3}/file{nr}.txt": f"{nr}: $A" for nr in range(10)}
+        files["b.txt"] = "$B"
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=os.path.join(tmp, "src"), files=files)
+            src = os.path.join(tmp, "src") + "/"
+            dst = os.path.join(tmp, "dst") + "/"
+            os.mkdir(dst)
+
+            for jobs, pipeline in ((1, 0), (4, 0), (1, 4)):
+                def render(key_value_list: list) -> str:
+                    with self.assertLogs(level="INFO") as logs:
+                        templator.process(src=[src],
+                                          dst=dst,
+                                          recursive=True,
+                                          key_value_list=key_value_list,
+                                          force=True,
+                                          jobs=jobs,
+                                          pipeline=pipeline,
+                                          write_if_changed=True)
+                    return logs.records[-1].getMessage()
+
+                self.assertEqual(render(["A=1", "B=1"]),
+                                 "11 written, 0 unchanged")
+                mtime = os.stat(os.path.join(tmp, "dst", "b.txt")).st_mtime_ns
+                self.assertEqual(render(["A=1", "B=1"]),
+                                 "0 written, 11 unchanged")
+                self.assertEqual(render(["A=1", "B=2"]),
+                                 "1 written, 10 unchanged")
+                self.assertNotEqual(
+                    os.stat(os.path.join(tmp, "dst", "b.txt")).st_mtime_ns,
+                    mtime)
+                self.assertEqual(Path(tmp, "dst", "b.txt").read_text(),
+                                 "2\n")
+                self.assertEqual(render(["A=2", "B=3"]),
+                                 "11 written, 0 unchanged")
+
+    def test_process_store(self):
+        files = {f"src/file{nr}.txt": f"{nr % 2}: $A" for nr in range(4)}
+        files["src/static.txt"] = "no placeholders"
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=tmp, files=files)
+            store = os.path.join(tmp, "store")
+            for tenant in ("one", "two"):
+                dst = os.path.join(tmp, tenant) + "/"
+                os.mkdir(dst)
+                templator.process(src=[os.path.join(tmp, "src") + "/"],
+                                  dst=dst,
+                                  key_value_list=["A=1"],
+                                  store=store)
+
+            blobs = [path for path in Path(store).rglob("*")
+                     if path.is_file()]
+            self.assertEqual(len(blobs), 3)
+            for name in ("file0.txt", "file3.txt", "static.txt"):
+                one = os.path.join(tmp, "one", name)
+                self.assertTrue(os.path.samefile(
+                    one, os.path.join(tmp, "two", name)))
+            self.assertEqual(Path(tmp, "one", "file3.txt").read_text(),
+                             "1: 1\n")
+            self.assertEqual(Path(tmp, "two", "static.txt").read_text(),
+                             "no placeholders\n")
+
+    def test_process_store_rerender(self):
+        files = {"src/file.txt": "v=$A", "src/static.txt": "static"}
+        options = [{}, {'write_if_changed': True}, {'atomic': True},
+                   {'copy_static': True}]
+        for link in ("hardlink", "symlink"):
+            for kwargs in options:
+                with tempfile.TemporaryDirectory() as tmp:
+                    create_tree(root=tmp, files=files)
+                    src = os.path.join(tmp, "src") + "/"
+                    store = os.path.join(tmp, "store")
+                    for tenant in ("one", "two"):
+                        os.mkdir(os.path.join(tmp, tenant))
+                        templator.process(src=[src],
+                                          dst=os.path.join(tmp, tenant) + "/",
+                                          key_value_list=["A=1"],
+                                          store=store,
+                                          link=link)
+
+                    # without '--store', the links are replaced instead of
+                    # written into
+                    Path(tmp, "src", "static.txt").write_text("changed")
+                    templator.process(src=[src],
+                                      dst=os.path.join(tmp, "one") + "/",
+                                      key_value_list=["A=2"],
+                                      force=True,
+                                      **kwargs)
+                    for name, content in (("file.txt", "v=2\n"),
+                                          ("static.txt", "changed")):
+                        path = os.path.join(tmp, "one", name)
+                        self.assertFalse(os.path.islink(path))
+                        self.assertEqual(os.stat(path).st_nlink, 1)
+                        self.assertTrue(os.access(path, os.W_OK))
+                        if kwargs.get('copy_static') or name == "file.txt":
+                            self.assertEqual(Path(path).read_text(), content)
+                    self.assertEqual(
+                        Path(tmp, "two", "file.txt").read_text(), "v=1\n")
+                    self.assertEqual(
+                        Path(tmp, "two", "static.txt").read_text(),
+                        "static\n")
+                    self.assertEqual(
+                        sorted(path.read_text()
+                               for path in Path(store).rglob("*")
+                               if path.is_file()),
+                        ["static\n", "v=1\n"])
+
+                    # without a writer
+                    dst = os.path.join(tmp, "two", "file.txt")
+                    templator.write_content(
+                        content="v=3",
+                        dst=dst,
+                        force=True,
+                        if_changed=bool(kwargs.get('write_if_changed')))
+                    self.assertFalse(os.path.islink(dst))
+                    self.assertEqual(Path(dst).read_text(), "v=3\n")
+                    self.assertEqual(
+                        sorted(path.read_text()
+                               for path in Path(store).rglob("*")
+                               if path.is_file()),
+                        ["static\n", "v=1\n"])
+
+    def test_process_referenced_only(self):
+        files = {
+            "src/a.txt": "$A $B $HOME_DIR",
+            "src/sub/b.txt": "${B} $UNSET",
+            "first.env": "A=first\nB=first\nUNUSED=1",
+            "second.env": "B=second\nOTHER=2",
+        }
+        environ = {"HOME_DIR": "/home/user", "B": "env",
+                   **{f"ENV_{nr}": "value" for nr in range(100)}}
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=tmp, files=files)
+
+            def render(referenced_only: bool) -> tuple:
+                with mock.patch.dict(os.environ, environ), \
+                     mock.patch('templator.output_file',
+                                wraps=templator.output_file) as cm, \
+                     mock.patch('sys.stdout', new=StringIO()) as out:
+                    templator.process(
+                        src=[os.path.join(tmp, "src") + "/"],
+                        recursive=True,
+                        key_value_list=["A=set"],
+                        input_files=[os.path.join(tmp, "first.env"),
+                                     os.path.join(tmp, "second.env")],
+                        no_os_env=False,
+                        referenced_only=referenced_only)
+                return out.getvalue(), cm.call_args.kwargs['substitutions']
+
+            content, substitutions = render(referenced_only=False)
+            self.assertEqual(content,
+                             "set second /home/user\nsecond $UNSET\n")
+            self.assertIs(substitutions[2], os.environ)
+
+            referenced, substitutions = render(referenced_only=True)
+            self.assertEqual(referenced, content)
+            self.assertEqual(substitutions, [
+                {"A": "set"},
+                {"A": "first", "B": "second"},
+                {"HOME_DIR": "/home/user", "B": "env"},
+            ])
+
+            # each template is only read once, or chunk by chunk with
+            # '--stream'
+            templates = {os.path.join(tmp, "src", "a.txt"),
+                         os.path.join(tmp, "src", "sub", "b.txt")}
+            for stream in (False, True):
+                with mock.patch('builtins.open', wraps=open) as opened, \
+                        mock.patch('templator.stream_placeholders',
+                                   wraps=templator.stream_placeholders
+                                   ) as scanned, \
+                        mock.patch('sys.stdout', new=StringIO()) as out:
+                    templator.process(src=[os.path.join(tmp, "src") + "/"],
+                                      recursive=True,
+                                      key_value_list=["A=set"],
+                                      referenced_only=True,
+                                      stream=stream)
+                reads = collections.Counter(
+                    str(call.kwargs.get('file', call.args[0] if call.args
+                                        else None))
+                    for call in opened.call_args_list)
+                self.assertEqual({path: reads[path] for path in templates},
+                                 {path: 2 if stream else 1
+                                  for path in templates})
+                self.assertEqual(scanned.call_count, 2 if stream else 0)
+                self.assertEqual(out.getvalue(),
+                                 "set $B $HOME_DIR\n${B} $UNSET\n")
+
+    def test_render_batch(self):
+        files = {
+            "tpl/a.txt": "$NAME $ENV $SHARED",
+            "tpl/sub/b.txt": "${NAME}",
+            "shared.env": "SHARED=shared\nENV=shared",
+            "tenant.env": "ENV=tenant",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=tmp, files=files)
+            entries = [
+                {'src': f"{tmp}/tpl/", 'dst': f"{tmp}/out/one/",
+                 'set': {'NAME': "one"}, 'input': f"{tmp}/tenant.env"},
+                {'src': [f"{tmp}/tpl/a.txt"], 'dst': f"{tmp}/out/two/",
+                 'set': ["NAME=two"]},
+                {'src': f"{tmp}/tpl/a.txt"},
+            ]
+            manifest = os.path.join(tmp, "batch.jsonl")
+            with open(manifest, "w") as f:
+                f.write("# tenants\n\n")
+                f.write("\n".join(json.dumps(entry) for entry in entries))
+
+            for jobs in (1, 3):
+                compile_template = templator.compile_template
+                with mock.patch('templator.compile_template',
+                                wraps=compile_template) as compiled, \
+                     mock.patch('templator.read_file',
+                                wraps=templator.read_file) as read, \
+                     mock.patch('sys.stdout', new=StringIO()) as out:
+                    templator.render_batch(
+                        manifest=manifest,
+                        recursive=True,
+                        key_value_list=["NAME=default", "SHARED=set"],
+                        input_files=[f"{tmp}/shared.env"],
+                        force=True,
+                        jobs=jobs)
+                # each template is compiled and each file read once
+                self.assertEqual(compiled.call_count, 2)
+                self.assertEqual(read.call_count, 2)
+                self.assertEqual(out.getvalue(), "default shared set\n")
+                self.assertEqual(
+                    Path(tmp, "out", "one", "a.txt").read_text(),
+                    "one tenant set\n")
+                self.assertEqual(
+                    Path(tmp, "out", "one", "sub", "b.txt").read_text(),
+                    "one\n")
+                self.assertEqual(
+                    Path(tmp, "out", "two", "a.txt").read_text(),
+                    "two shared set\n")
+
+            # failed entries are reported at the end
+            with open(manifest, "a") as f:
+                f.write('\n{"src": "missing"}')
+            with mock.patch('sys.stdout', new=StringIO()), \
+                    self.assertRaises(Exception) as cm:
+                templator.render_batch(manifest=manifest, force=True)
+            self.assertIn("1 of 4 entries", str(cm.exception))
+
+            # invalid entries are rejected before rendering
+            with open(manifest, "a") as f:
+                f.write('\n{"src": "a", "unknown": 1}')
+            with self.assertRaises(ValueError) as cm:
+                templator.read_batch(path=manifest)
+            self.assertIn("line 7", str(cm.exception))
+            self.assertIn("unknown key 'unknown'", str(cm.exception))
+
+    def test_render_matrix(self):
+        files = {
+            "tpl.conf": "server $host:${port} $SHARED",
+            "shared.env": "SHARED=shared\nport=0",
+            "rows.csv": "host,port\na,1\nb,\n",
+            "rows.jsonl": '{"host": "c", "port": 3}\n\n{"host": "d"}\n',
+            "rows.json": '[{"host": "e"}, {"host": "e"}]',
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=tmp, files=files)
+            template = os.path.join(tmp, "tpl.conf")
+
+            with mock.patch('templator.compile_template',
+                            wraps=templator.compile_template) as compiled:
+                templator.render_matrix(
+                    rows_file=os.path.join(tmp, "rows.csv"),
+                    template=template,
+                    dst=os.path.join(tmp, "out", "${host}.conf"),
+                    input_files=[os.path.join(tmp, "shared.env")])
+            # template and destination pattern
+            self.assertEqual(compiled.call_count, 2)
+            self.assertEqual(Path(tmp, "out", "a.conf").read_text(),
+                             "server a:1 shared\n")
+            self.assertEqual(Path(tmp, "out", "b.conf").read_text(),
+                             "server b: shared\n")
+
+            with mock.patch('sys.stdout', new=StringIO()) as out:
+                with self.assertRaises(Exception):
+                    templator.render_matrix(
+                        rows_file=os.path.join(tmp, "rows.jsonl"),
+                        template=template,
+                        key_value_list=["SHARED=set"],
+                        strict=True)
+            rows = [json.loads(line) for line in out.getvalue().splitlines()]
+            self.assertEqual(rows[0], {'row': 1, 'content': "server c:3 set"})
+            self.assertEqual(rows[1]['row'], 3)
+            self.assertIn("error", rows[1])
+
+            # same destination for two rows
+            with self.assertLogs(level="ERROR") as logs, \
+                    self.assertRaises(Exception):
+                templator.render_matrix(
+                    rows_file=os.path.join(tmp, "rows.json"),
+                    template=template,
+                    dst=os.path.join(tmp, "out", "${host}.conf"))
+            self.assertIn("already rendered for row 1",
+                          logs.records[0].getMessage())
+
+            with self.assertRaises(SyntaxError):
+                templator.render_matrix(
+                    rows_file=os.path.join(tmp, "rows.json"),
+                    template=template,
+                    dst=os.path.join(tmp, "out", "file.conf"))
+
+    def test_process_watch(self):
+        files = {
+            "a.txt": "$A",
+            "b.txt": "$B",
+            "ab.txt": "$A $B",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=os.path.join(tmp, "src"), files=files)
+            input_file = Path(tmp, "values.env")
+            input_file.write_text("A=1\nB=1\n")
+            os.mkdir(os.path.join(tmp, "dst"))
+            watcher = templator.Watcher(src=[os.path.join(tmp, "src/")],
+                                        dst=Path(tmp, "dst"),
+                                        key_value_list=["B=set"],
+                                        input_files=[str(input_file)])
+
+            def poll() -> list:
+                return sorted(path.name for path in watcher.poll())
+
+            self.assertEqual(poll(), ["a.txt", "ab.txt", "b.txt"])
+            self.assertEqual(poll(), [])
+
+            # only templates using a changed value
+            input_file.write_text("A=2\nB=2\n")
+            os.utime(input_file, ns=(0, 0))
+            self.assertEqual(poll(), ["a.txt", "ab.txt"])
+            self.assertEqual(Path(tmp, "dst", "ab.txt").read_text(),
+                             "2 set\n")
+
+            # changed and new templates
+            Path(tmp, "src", "b.txt").write_text("${B}!")
+            Path(tmp, "src", "c.txt").write_text("$A")
+            with mock.patch('builtins.open', wraps=open) as opened:
+                self.assertEqual(poll(), ["b.txt", "c.txt"])
+            # each template is read once
+            self.assertEqual(sorted(Path(call.kwargs['file']).name
+                                    for call in opened.call_args_list
+                                    if 'file' in call.kwargs),
+                             ["b.txt", "c.txt"])
+            self.assertEqual(Path(tmp, "dst", "b.txt").read_text(), "set!\n")
+
+            # removed template
+            os.remove(os.path.join(tmp, "src", "c.txt"))
+            input_file.write_text("A=3\n")
+            self.assertEqual(poll(), ["a.txt", "ab.txt"])
+
+            # the render options are passed on
+            watcher = templator.Watcher(src=[os.path.join(tmp, "src/")],
+                                        dst=Path(tmp, "dst"),
+                                        stream=True)
+            with mock.patch('templator.output_file') as output_file:
+                poll()
+            self.assertEqual(output_file.call_count, 3)
+            for call in output_file.call_args_list:
+                self.assertTrue(call.kwargs['force'])
+                self.assertTrue(call.kwargs['stream'])
+                self.assertFalse(call.kwargs['show_diff'])
+
+    def test_render_server(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            create_tree(root=tmp, files={"a.txt": "$A $B",
+                                         "values.env": "A=file\n"})
+            socket_path = os.path.join(tmp, "templator.sock")
+            server = templator.RenderServer(
+                path=socket_path,
+                key_value_list=["B=server"],
+                input_files=[os.path.join(tmp, "values.env")])
+            listener = server.listen()
+            self.assertEqual(os.stat(socket_path).st_mode & 0o777, 0o600)
+            thread = threading.Thread(target=listener.serve_forever)
+            thread.start()
+            try:
+                template = os.path.join(tmp, "a.txt")
+                self.assertEqual(
+                    server.render(request={'template': template}),
+                    {'content': "file server"})
+                self.assertEqual(
+                    server.render(request={'text': "$A $B",
+                                           'set': ["B=request"]}),
+                    {'content': "file request"})
+                self.assertIn(
+                    "--strict",
+                    server.render(request={'text': "$C",
+                                           'strict': True})['error'])
+
+                # input files are read again after a change
+                Path(tmp, "values.env").write_text("A=changed\n")
+                os.utime(os.path.join(tmp, "values.env"), ns=(0, 0))
+
+                with mock.patch('sys.stdout', new=StringIO()) as out:
+                    templator.render_remote(socket_path=socket_path,
+                                            src=[template],
+                                            key_value_list=["B=client"])
+                self.assertEqual(out.getvalue(), "changed client\n")
+
+                os.mkdir(os.path.join(tmp, "dst"))
+                templator.render_remote(socket_path=socket_path,
+                                        src=[template],
+                                        dst=os.path.join(tmp, "dst/"))
+                self.assertEqual(Path(tmp, "dst", "a.txt").read_text(),
+                                 "changed server\n")
+            finally:
+                listener.shutdown()
+                listener.server_close()
+                thread.join()
+
+        with self.assertRaises(ConnectionError):
+            templator.render_remote(socket_path=socket_path, src=[template])
+
 
 if __name__ == '__main__':
     unittest.main()